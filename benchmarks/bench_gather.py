@@ -0,0 +1,148 @@
+# Author: Team Andrey Markov
+# benchmarks for the gather_* functions
+
+# Runs every gather_* function against an offline ReplaySource at
+# production scale and reports wall time, calls per second and peak
+# memory, so that performance changes can be compared to a baseline.
+#
+# Usage:
+#   python -m benchmarks.bench_gather
+#   python -m benchmarks.bench_gather --tickers 100 --latency 0.01
+
+# Imports
+import argparse
+import time
+import tracemalloc
+
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare,
+                                 gather_stock_time_series,
+                                 gather_stock_returns)
+from pyntrinio.sources import ReplaySource
+
+API_KEY = 'replay'
+STATEMENT = 'income_statement'
+PERIODS = ['Q1', 'Q2', 'Q3', 'Q4']
+# the panel benchmark prices one year of this many tickers
+PANEL_TICKERS = 500
+
+
+def measure(name, replay, func, *args, **kwargs):
+    """
+    Call func once and return its wall time, call rate and peak memory.
+
+    Parameters
+    -----------
+    name : str
+        the name to report the measurement under
+    replay : ReplaySource
+        the source func reads from, used to count the API calls
+    func : callable
+        the function to benchmark
+
+    Returns
+    -----------
+    dict
+        the name, wall time (s), API calls, calls per second and peak
+        memory (MB) of the call
+    """
+    replay.calls.clear()
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    calls = sum(replay.calls.values())
+    return {'name': name, 'wall_s': wall, 'calls': calls,
+            'calls_per_s': calls / wall if wall else float('inf'),
+            'peak_mb': peak / 2 ** 20}
+
+
+def run(n_tickers=1000, n_years=10, n_rows=10000, n_tags=50, latency=0.0,
+        max_workers=1):
+    """
+    Benchmark the four gather_* functions, and the stock time series of a
+    panel of tickers, and return the measurements.
+
+    Parameters
+    -----------
+    n_tickers : int (optional, default = 1000)
+        the number of tickers compared and priced
+    n_years : int (optional, default = 10)
+        the number of years of quarterly filings in the time series
+    n_rows : int (optional, default = 10000)
+        the number of rows in every price history
+    n_tags : int (optional, default = 50)
+        the number of facts in every filing
+    latency : float (optional, default = 0.0)
+        seconds of simulated latency added to every API call
+    max_workers : int (optional, default = 1)
+        the number of requests the functions may run in parallel
+
+    Returns
+    -----------
+    list
+        one dictionary per benchmark, see measure()
+    """
+    tickers = ['AAPL'] + ['T' + str(n) for n in range(1, n_tickers)]
+    years = [str(2019 - n) for n in range(n_years)][::-1]
+    source = ReplaySource.synthetic(
+        tickers, years=years, periods=PERIODS, statements=[STATEMENT],
+        n_tags=n_tags, n_rows=n_rows, latency=latency)
+    history = source.get_security_stock_prices(
+        tickers[0], page_size=n_rows).stock_prices
+    last_date = history[0].date.strftime('%Y-%m-%d')
+    first_date = history[-1].date.strftime('%Y-%m-%d')
+    year_ago = history[min(251, len(history) - 1)].date.strftime('%Y-%m-%d')
+    return [
+        measure('financial_statement_time_series', source,
+                gather_financial_statement_time_series, API_KEY, tickers[0],
+                STATEMENT, years, PERIODS, output_format='pddf',
+                source=source, max_workers=max_workers),
+        measure('financial_statement_company_compare', source,
+                gather_financial_statement_company_compare, API_KEY,
+                tickers, STATEMENT, years[-1], 'Q1', output_format='pddf',
+                source=source, max_workers=max_workers),
+        measure('stock_time_series', source, gather_stock_time_series,
+                API_KEY, tickers[0], start_date=first_date,
+                end_date=last_date, output_format='pddf',
+                allow_max_rows=True, source=source),
+        measure('stock_panel', source, gather_stock_time_series, API_KEY,
+                tickers[:PANEL_TICKERS], start_date=year_ago,
+                end_date=last_date, output_format='pddf',
+                allow_max_rows=True, source=source,
+                max_workers=max_workers),
+        measure('stock_returns', source, gather_stock_returns, API_KEY,
+                tickers, first_date, last_date, source=source,
+                max_workers=max_workers),
+    ]
+
+
+def report(results):
+    """Format the measurements of run() as a table."""
+    lines = ['{:<38}{:>10}{:>8}{:>12}{:>10}'.format(
+        'benchmark', 'wall (s)', 'calls', 'calls/s', 'peak MB')]
+    for r in results:
+        lines.append('{:<38}{:>10.3f}{:>8}{:>12.1f}{:>10.1f}'.format(
+            r['name'], r['wall_s'], r['calls'], r['calls_per_s'],
+            r['peak_mb']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the pyntrinio gather_* functions offline.')
+    parser.add_argument('--tickers', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+    print(report(run(args.tickers, args.years, args.rows, args.tags,
+                     args.latency, args.workers)))
+
+
+if __name__ == '__main__':
+    main()
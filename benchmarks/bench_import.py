@@ -0,0 +1,108 @@
+# Author: Team Andrey Markov
+# benchmark of the import time of pyntrinio
+
+# Imports every module of pyntrinio in a fresh interpreter, as a short-lived
+# job does on every cold start, and reports the wall time of the import and
+# the heavy dependencies (pandas, numpy, intrinio_sdk) it loaded. A second
+# measure also runs the 'dict' output of the functions on a ReplaySource,
+# which should not load pandas either.
+#
+# Usage:
+#   python -m benchmarks.bench_import
+#   python -m benchmarks.bench_import --repeats 10
+
+# Imports
+import argparse
+import json
+import subprocess
+import sys
+
+# the dependencies the import of pyntrinio defers until they are needed
+HEAVY_MODULES = ['pandas', 'numpy', 'intrinio_sdk']
+
+MODULES = ['pyntrinio.pyntrinio', 'pyntrinio.aio', 'pyntrinio.client']
+
+# the 'dict' outputs, on generated data
+DICT_CALLS = '''
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare,
+                                 gather_stock_time_series)
+from pyntrinio.sources import ReplaySource
+source = ReplaySource.synthetic(
+    ['AAPL', 'CSCO'], years=['2019'], periods=['Q1'],
+    statements=['income_statement'], n_tags=3, n_rows=20)
+gather_financial_statement_time_series(
+    'replay', 'AAPL', 'income_statement', ['2019'], ['Q1'],
+    output_format='dict', source=source)
+gather_financial_statement_company_compare(
+    'replay', ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1',
+    source=source)
+gather_stock_time_series('replay', ['AAPL', 'CSCO'], output_format='dict',
+                         source=source)
+'''
+
+# the script run in the fresh interpreter, prints its measure as JSON
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+{imports}
+wall = time.perf_counter() - start
+{calls}
+print(json.dumps({{'wall_s': wall, 'loaded': [
+    m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(name, calls='', repeats=5):
+    """
+    Import MODULES in repeats fresh interpreters (then run calls) and return
+    the best wall time of the imports and the heavy modules loaded.
+    """
+    script = SCRIPT.format(
+        imports='\n'.join('import ' + module for module in MODULES),
+        calls=calls, heavy=HEAVY_MODULES)
+    runs = [json.loads(subprocess.run(
+        [sys.executable, '-c', script], check=True, capture_output=True,
+        text=True).stdout) for _ in range(repeats)]
+    return {'name': name, 'wall_s': min(r['wall_s'] for r in runs),
+            'loaded': runs[-1]['loaded']}
+
+
+def run(repeats=5):
+    """
+    Measure the import of pyntrinio, alone and followed by 'dict' outputs.
+
+    Parameters
+    -----------
+    repeats : int (optional, default = 5)
+        the number of fresh interpreters per measure, the best one is kept
+
+    Returns
+    -----------
+    list
+        one dictionary per measure with its name, the wall time of the
+        import (s) and the heavy modules loaded
+    """
+    return [measure('import', repeats=repeats),
+            measure('import + dict outputs', DICT_CALLS, repeats)]
+
+
+def report(results):
+    """Format the measurements of run() as a table."""
+    lines = ['{:<24}{:>10}  {}'.format('benchmark', 'wall (s)', 'loaded')]
+    for r in results:
+        lines.append('{:<24}{:>10.3f}  {}'.format(
+            r['name'], r['wall_s'], ', '.join(r['loaded']) or '-'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the import time of pyntrinio.')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args(argv)
+    print(report(run(args.repeats)))
+
+
+if __name__ == '__main__':
+    main()
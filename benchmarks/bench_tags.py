@@ -0,0 +1,100 @@
+# Author: Team Andrey Markov
+# benchmark of the tag aggregation of the financial statement time series
+
+# Times gather_financial_statement_time_series on filings with a growing
+# number of facts and reports the time spent per fact. The aggregation is
+# a single pass over the facts, so the time per fact should stay flat as
+# filings grow.
+#
+# Usage:
+#   python -m benchmarks.bench_tags
+#   python -m benchmarks.bench_tags --sizes 100 1000 10000 --filings 20
+
+# Imports
+import argparse
+import time
+
+from pyntrinio.pyntrinio import gather_financial_statement_time_series
+from pyntrinio.sources import ReplaySource
+
+API_KEY = 'replay'
+TICKER = 'AAPL'
+STATEMENT = 'income_statement'
+PERIODS = ['Q1', 'Q2', 'Q3', 'Q4']
+
+
+def make_source(n_tags, n_filings, repeats=2):
+    """
+    Return a ReplaySource with n_filings filings of n_tags tags, each tag
+    reported repeats times, and the years those filings cover.
+    """
+    facts = [{'tag': 'tag_' + str(n), 'value': float(n), 'balance': 'debit',
+              'name': 'Tag ' + str(n)}
+             for _ in range(repeats) for n in range(n_tags)]
+    years = [str(2019 - n) for n in range(-(-n_filings // len(PERIODS)))]
+    source = ReplaySource()
+    for year in years:
+        for period in PERIODS:
+            source.add_reported_financials(
+                '-'.join([TICKER, STATEMENT, year, period]), facts)
+    return source, years[::-1]
+
+
+def run(sizes=(100, 200, 400, 800, 1600), n_filings=40, repeats=2):
+    """
+    Time the aggregation of filings of every size in sizes.
+
+    Parameters
+    -----------
+    sizes : list (optional, default = (100, 200, 400, 800, 1600))
+        the numbers of distinct tags per filing
+    n_filings : int (optional, default = 40)
+        the number of filings aggregated per size (rounded up to whole
+        years)
+    repeats : int (optional, default = 2)
+        the number of times every tag is reported in a filing
+
+    Returns
+    -----------
+    list
+        one dictionary per size with the facts per filing, the wall time (s)
+        and the time per fact (us)
+    """
+    results = []
+    for n_tags in sizes:
+        source, years = make_source(n_tags, n_filings, repeats)
+        start = time.perf_counter()
+        gather_financial_statement_time_series(
+            API_KEY, TICKER, STATEMENT, years, PERIODS, output_format='dict',
+            source=source, cache=False)
+        wall = time.perf_counter() - start
+        n_facts = n_tags * repeats
+        results.append({'facts': n_facts, 'wall_s': wall,
+                        'us_per_fact': wall / (n_facts * len(years) *
+                                               len(PERIODS)) * 1e6})
+    return results
+
+
+def report(results):
+    """Format the measurements of run() as a table."""
+    lines = ['{:>10}{:>10}{:>12}'.format('facts', 'wall (s)', 'us/fact')]
+    for r in results:
+        lines.append('{:>10}{:>10.3f}{:>12.3f}'.format(
+            r['facts'], r['wall_s'], r['us_per_fact']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tag aggregation of the financial '
+                    'statement time series.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 200, 400, 800, 1600])
+    parser.add_argument('--filings', type=int, default=40)
+    parser.add_argument('--repeats', type=int, default=2)
+    args = parser.parse_args(argv)
+    print(report(run(args.sizes, args.filings, args.repeats)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# Author: Team Andrey Markov
+# python -m pyntrinio runs the pyntrinio command, see pyntrinio.cli
+
+import sys
+
+from pyntrinio.cli import main
+
+sys.exit(main())
@@ -0,0 +1,466 @@
+# Author: Team Andrey Markov
+# pyntrinio asyncio functions
+
+# Async counterparts of the gather_* functions in pyntrinio.pyntrinio. They
+# validate their inputs and shape their results with the same helpers as the
+# blocking versions, but issue their requests concurrently on the running
+# event loop, with at most max_concurrency requests in flight per call.
+#
+# Sources that define coroutine endpoints (aget_fundamental_reported_financials
+# and aget_security_stock_prices, see pyntrinio.sources) are awaited
+# directly. The blocking intrinio_sdk endpoints are run on a thread pool of
+# max_concurrency threads owned by the call, so that max_concurrency
+# requests are really in flight whatever the size of the default executor
+# of the event loop.
+
+# Imports
+import asyncio
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+
+from pyntrinio.pyntrinio import (
+    _check_financial_statement_time_series, _check_company_compare_strings,
+    _check_company_compare, _check_stock_time_series, _check_stock_returns,
+    _reported_financials_key, _financial_statement_record,
+    _financial_statement_output, _company_record, _company_compare_output,
+    _page_size, _stock_prices_output, _concat_stock_prices, _MAX_PAGE_SIZE,
+    _stored_stock_prices, _stock_prices_panel,
+    _returns_requests, _returns_widen, _returns_row, _returns_error,
+    _RETURNS_SESSIONS, _returns_output, _fundamentals_source,
+    _default_source, _known_key,
+    _check_financial_statements, _financial_statements_cells,
+    _financial_statements_output)
+from pyntrinio.keys import invalid_key_error
+from pyntrinio.metrics import metered_source
+from pyntrinio.store import price_store
+from pyntrinio.sources import _EXECUTOR, _acall
+
+
+def _own_executor(function):
+    """
+    Run the blocking endpoints awaited by an agather_* function on a thread
+    pool of its max_concurrency argument, see pyntrinio.sources._acall
+    """
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        pool = ThreadPoolExecutor(
+            max_workers=max(1, bound.arguments['max_concurrency']))
+        # the tasks created by the call inherit the executor with the context
+        token = _EXECUTOR.set(pool)
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            _EXECUTOR.reset(token)
+            # the threads finish the requests in flight without blocking the
+            # event loop
+            pool.shutdown(wait=False)
+    return wrapper
+
+
+async def _acall_all(calls, max_concurrency):
+    """
+    Await every coroutine in calls with at most max_concurrency of them
+    running at once, and return their results in order. If one of them
+    fails the others are cancelled and the exception is propagated.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def limited(call):
+        async with semaphore:
+            return await call
+
+    tasks = [asyncio.ensure_future(limited(call)) for call in calls]
+    try:
+        return await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _async_sync_stock_prices(store, source, ticker, start_date,
+                                   end_date, overlap):
+    """
+    Async version of pyntrinio.pyntrinio._sync_stock_prices: the missing
+    windows are requested concurrently, their pages one at a time
+    """
+    async def window(start, end):
+        fetched = []
+        next_page = None
+        while True:
+            response = await _acall(
+                source, 'get_security_stock_prices', ticker,
+                start_date=start, end_date=end, page_size=_MAX_PAGE_SIZE,
+                next_page=next_page)
+            fetched.extend(response.stock_prices)
+            next_page = response.next_page
+            if not next_page:
+                return fetched
+
+    windows = store.missing(ticker, start_date, end_date, overlap)
+    if windows:
+        pages = await asyncio.gather(*[window(start, end)
+                                       for start, end in windows])
+        store.save_sync(ticker, start_date,
+                        [p for page in pages for p in page])
+
+
+async def _async_ticker_stock_prices(source, ticker, start_date, end_date,
+                                     allow_max_rows, all_pages):
+    """
+    Async version of pyntrinio.pyntrinio._ticker_stock_prices: the pages
+    are followed one at a time
+    """
+    response = await _acall(
+        source, 'get_security_stock_prices', ticker, start_date=start_date,
+        end_date=end_date, page_size=_page_size(allow_max_rows))
+    stock_prices = list(response.stock_prices)
+    while all_pages and response.next_page:
+        response = await _acall(
+            source, 'get_security_stock_prices', ticker,
+            start_date=start_date, end_date=end_date,
+            page_size=_page_size(allow_max_rows),
+            next_page=response.next_page)
+        stock_prices.extend(response.stock_prices)
+    return stock_prices
+
+
+async def _async_stock_price_panel(source, store, tickers, start_date,
+                                   end_date, output_format, allow_max_rows,
+                                   all_pages, price_dtype, overlap,
+                                   max_concurrency, layout):
+    """
+    Async version of pyntrinio.pyntrinio._gather_stock_price_panel: the
+    tickers are requested concurrently
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if store is None:
+        stock_prices = await _acall_all(
+            [_async_ticker_stock_prices(source, ticker, start_date, end_date,
+                                        allow_max_rows, all_pages)
+             for ticker in tickers], max_concurrency)
+        return _stock_prices_panel(tickers, stock_prices, output_format,
+                                   price_dtype, layout)
+    await _acall_all([_async_sync_stock_prices(store, source, ticker,
+                                               start_date, end_date, overlap)
+                      for ticker in tickers], max_concurrency)
+    if output_format == 'pddf' and hasattr(store, 'panel'):
+        return store.panel(tickers, start_date, end_date, price_dtype,
+                           layout, newest_first=True)
+    return _stock_prices_panel(
+        tickers, [store.get(t, start_date, end_date) for t in tickers],
+        output_format, price_dtype, layout)
+
+
+@_own_executor
+async def agather_financial_statement_time_series(
+        api_key, ticker, statement, year, period, output_format='pddf',
+        source=None, max_concurrency=10, cache=None):
+    """
+    Async version of gather_financial_statement_time_series: every year and
+    period is requested concurrently.
+
+    Parameters
+    -----------
+    api_key, ticker, statement, year, period, output_format, source, cache
+      see pyntrinio.pyntrinio.gather_financial_statement_time_series
+    max_concurrency : int (optional, default = 10)
+      the maximum number of requests in flight at once
+    Returns
+    -----------
+    object of type output_format
+      information about the given statement for the given ticker
+      at the given times in the specified output format
+    Example
+    -----------
+    >>> await agather_financial_statement_time_series(api_key, ticker='AAPL',
+    statement='income_statement', year=['2018', '2019'],
+    period=['Q1'], output_format='dict')
+    """
+    _check_financial_statement_time_series(
+        api_key, ticker, statement, year, period, output_format)
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_concurrency)
+    if _known_key(api_key, source) is False:
+        print("Invalid API Key: please input a valid API key as a string")
+        return
+    filings = metered_source(filings,
+                             'agather_financial_statement_time_series')
+    # Outer loop over years, inner loop over quarters
+    cells = [(i, j) for i in year for j in period]
+    try:
+        fundas = await _acall_all(
+            [_acall(filings, 'get_fundamental_reported_financials',
+                    _reported_financials_key(ticker, statement, i, j))
+             for i, j in cells], max_concurrency)
+    except Exception:
+        print("Invalid API Key: please input a valid API key as a string")
+        return
+    results = [_financial_statement_record(ticker, statement, i, j, funda)
+               for (i, j), funda in zip(cells, fundas)]
+    return _financial_statement_output(results, output_format)
+
+
+@_own_executor
+async def agather_financial_statement_company_compare(
+        api_key, ticker, statement, year, period, output_format='dict',
+        source=None, max_concurrency=10, cache=None, sparse=False):
+    """
+    Async version of gather_financial_statement_company_compare: every
+    company is requested concurrently.
+
+    Parameters
+    -----------
+    api_key, ticker, statement, year, period, output_format, source, cache,
+    sparse
+        see pyntrinio.pyntrinio.gather_financial_statement_company_compare
+    max_concurrency : int (optional, default = 10)
+        the maximum number of requests in flight at once
+
+    Returns
+    -----------
+    object of type output_format
+        information about the given statement for the given tickers at the
+        given time in the specified output format
+
+    Example
+    -----------
+    >>> await agather_financial_statement_company_compare(api_key,
+    ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1')
+    """
+    _check_company_compare_strings(api_key, statement, year, period)
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_concurrency)
+
+    _check_company_compare(ticker, statement, year, output_format)
+
+    # the API key is checked by the responses themselves (see pyntrinio.keys)
+    msg_apy = "Invalid API Key: please input a valid API key as a string"
+    if _known_key(api_key, source) is False:
+        return msg_apy
+    filings = metered_source(filings,
+                             'agather_financial_statement_company_compare')
+
+    try:
+        funds = await _acall_all(
+            [_acall(filings, 'get_fundamental_reported_financials',
+                    _reported_financials_key(comp, statement, year, period))
+             for comp in ticker], max_concurrency)
+    except Exception as e:
+        if invalid_key_error(e):
+            return msg_apy
+        msg = "Invalid agruments: please make sure that your statement"
+        msg = msg + "/year/period are valid"
+        return msg
+
+    result = [_company_record(comp, statement, year, period, fund)
+              for comp, fund in zip(ticker, funds)]
+    return _company_compare_output(result, output_format, sparse)
+
+
+@_own_executor
+async def agather_financial_statements(
+        api_key, ticker, statement, year, period, output_format='pddf',
+        source=None, cache=None, max_concurrency=10):
+    """
+    Async version of gather_financial_statements: every statement, year and
+    period is requested concurrently.
+
+    Parameters
+    -----------
+    api_key, ticker, statement, year, period, output_format, source, cache
+        see pyntrinio.pyntrinio.gather_financial_statements
+    max_concurrency : int (optional, default = 10)
+        the maximum number of requests in flight at once
+
+    Returns
+    -----------
+    object of type output_format
+        one record per ticker, year and period with the tags of every
+        statement, see pyntrinio.pyntrinio.gather_financial_statements
+
+    Example
+    -----------
+    >>> await agather_financial_statements(api_key, 'AAPL',
+    ['income_statement', 'balance_sheet_statement'], ['2019'], ['Q1'])
+    """
+    tickers, statements = _check_financial_statements(
+        api_key, ticker, statement, year, period, output_format)
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_concurrency)
+    msg_apy = "Invalid API Key: please input a valid API key as a string"
+    if _known_key(api_key, source) is False:
+        return msg_apy
+    filings = metered_source(filings, 'agather_financial_statements')
+
+    cells = _financial_statements_cells(tickers, statements, year, period)
+    try:
+        fundas = await _acall_all(
+            [_acall(filings, 'get_fundamental_reported_financials',
+                    _reported_financials_key(*cell)) for cell in cells],
+            max_concurrency)
+    except Exception as e:
+        if invalid_key_error(e):
+            return msg_apy
+        msg = "Invalid agruments: please make sure that your statement"
+        msg = msg + "/year/period are valid"
+        return msg
+    return _financial_statements_output(cells, fundas, output_format)
+
+
+@_own_executor
+async def agather_stock_time_series(
+        api_key, ticker, start_date=None, end_date=None, output_format='dict',
+        allow_max_rows=False, source=None, all_pages=False,
+        price_dtype='float64', store=None, overlap=5, max_concurrency=10,
+        layout='long'):
+    """
+    Async version of gather_stock_time_series: with a list of tickers, the
+    tickers are requested concurrently.
+
+    Parameters
+    -----------
+    api_key, ticker, start_date, end_date, output_format, allow_max_rows,
+    source, all_pages, price_dtype, store, overlap, layout
+        see pyntrinio.pyntrinio.gather_stock_time_series
+    max_concurrency : int (optional, default = 10)
+        the maximum number of tickers requested at once
+
+    Returns
+    -----------
+    object of type output_format
+        stock data for the specific timeframe in the specified output format
+
+    Example
+    -----------
+    >>> await agather_stock_time_series(api_key, 'AAPL',
+    start_date="2020-01-15", end_date="2020-01-30", output_format="pddf")
+    """
+    try:
+        start_date, end_date = _check_stock_time_series(
+            ticker, start_date, end_date, layout, panel=True)
+    except ValueError as e:
+        return str(e)
+
+    if source is None:
+        source = _default_source(api_key, max_concurrency)
+    if _known_key(api_key, source) is False:
+        return "Invalid API Key: please input a valid API key as a string"
+    source = metered_source(source, 'agather_stock_time_series')
+
+    store = price_store(store)
+    if isinstance(ticker, list):
+        try:
+            return await _async_stock_price_panel(
+                source, store, ticker, start_date, end_date, output_format,
+                allow_max_rows, all_pages, price_dtype, overlap,
+                max_concurrency, layout)
+        except Exception:
+            return "Invalid API Key: please input a valid API key as a string"
+    if store is not None:
+        try:
+            await _async_sync_stock_prices(store, source, ticker, start_date,
+                                           end_date, overlap)
+        except Exception:
+            return "Invalid API Key: please input a valid API key as a string"
+        return _stored_stock_prices(store, ticker, start_date, end_date,
+                                    output_format, price_dtype)
+
+    try:
+        response = await _acall(
+            source, 'get_security_stock_prices', ticker,
+            start_date=start_date, end_date=end_date,
+            page_size=_page_size(allow_max_rows))
+        chunks = [_stock_prices_output(response.stock_prices, output_format,
+                                       price_dtype)]
+        # follow the next pages one at a time
+        while all_pages and response.next_page:
+            response = await _acall(
+                source, 'get_security_stock_prices', ticker,
+                start_date=start_date, end_date=end_date,
+                page_size=_page_size(allow_max_rows),
+                next_page=response.next_page)
+            chunks.append(_stock_prices_output(
+                response.stock_prices, output_format, price_dtype))
+    except Exception:
+        return "Invalid API Key: please input a valid API key as a string"
+
+    if len(chunks) == 1:
+        return chunks[0]
+    return _concat_stock_prices(chunks, output_format)
+
+
+@_own_executor
+async def agather_stock_returns(api_key, ticker, buy_date, sell_date,
+                                source=None, max_concurrency=10,
+                                calendar=None):
+    """
+    Async version of gather_stock_returns: the prices of every ticker are
+    requested concurrently.
+
+    Parameters
+    -----------
+    api_key, ticker, buy_date, sell_date, source, calendar
+        see pyntrinio.pyntrinio.gather_stock_returns
+    max_concurrency : int (optional, default = 10)
+        the maximum number of tickers requested at once (two requests each
+        for long holding periods)
+
+    Returns
+    -----------
+    pandas.core.frame.DataFrame
+        a dataframe that contains the companies, historical prices and
+        corresponding profit/loss
+
+    Example
+    -----------
+    >>> await agather_stock_returns(api_key, ['AAPL', 'CSCO'], "2017-12-31",
+    "2019-03-01")
+    """
+    try:
+        ticker, buy_date, sell_date = _check_stock_returns(
+            ticker, buy_date, sell_date)
+    except ValueError as e:
+        return str(e)
+
+    if source is None:
+        source = _default_source(api_key, max_concurrency)
+    if _known_key(api_key, source) is False:
+        return "Invalid API Key: please input a valid API key as a string"
+    source = metered_source(source, 'agather_stock_returns')
+
+    # with calendar=None, _returns_requests reads the NYSE calendar only if
+    # the dates are too far apart for a single request
+
+    # the first ticker doubles as the API key check, duplicates are only
+    # requested once and the error of a ticker is kept to report it by name
+    async def fetch(comp):
+        sessions = _RETURNS_SESSIONS
+        try:
+            while sessions is not None:
+                responses = await asyncio.gather(*[_acall(
+                    source, 'get_security_stock_prices', comp,
+                    start_date=start, end_date=end, page_size=page_size)
+                    for start, end, page_size in _returns_requests(
+                        buy_date, sell_date, calendar, sessions)])
+                sessions = _returns_widen(responses, sessions)
+            return _returns_row(comp, responses)
+        except Exception as e:
+            return e
+
+    unique = list(dict.fromkeys(ticker))
+    first = await fetch(unique[0])
+    if isinstance(first, Exception):
+        return _returns_error(unique[0], first)
+    rest = await _acall_all([fetch(comp) for comp in unique[1:]],
+                            max_concurrency)
+    rows = dict(zip(unique, [first] + list(rest)))
+    for comp in unique:
+        if isinstance(rows[comp], Exception):
+            return _returns_error(comp, rows[comp])
+    return _returns_output([rows[comp] for comp in ticker])
@@ -0,0 +1,232 @@
+# Author: Team Andrey Markov
+# pyntrinio on-disk cache of reported financials
+
+# The reported financials of a filing never change once the filing exists,
+# so they are kept in a small SQLite database keyed by the Intrinio filing
+# key (ticker-statement-year-period, e.g. 'AAPL-income_statement-2019-Q1').
+# The least recently used filings are evicted once the cache holds more than
+# max_entries of them.
+
+# Imports
+import json
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+from pyntrinio.metrics import note_cache
+from pyntrinio.sources import _acall, _fact, _facts
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def cache_folder():
+    """
+    Return the folder pyntrinio keeps its local data in: the one named by
+    the PYNTRINIO_CACHE_DIR environment variable, or ~/.cache/pyntrinio
+    """
+    return os.environ.get('PYNTRINIO_CACHE_DIR') or os.path.join(
+        os.path.expanduser('~'), '.cache', 'pyntrinio')
+
+
+def default_cache_path():
+    """
+    Return the path of the default cache: filings.sqlite in cache_folder()
+    """
+    return os.path.join(cache_folder(), 'filings.sqlite')
+
+
+def default_cache():
+    """Return the process wide FilingCache at default_cache_path()."""
+    global _default_cache
+    # the worker threads of a call may all ask for it at once, only one of
+    # them opens the database
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = FilingCache()
+    return _default_cache
+
+
+class FilingCache:
+    """
+    Persistent, size-bounded LRU cache of reported financials.
+
+    Parameters
+    -----------
+    path : str (optional)
+        the SQLite file to store the filings in, defaults to
+        default_cache_path(). ':memory:' keeps the cache in memory
+    max_entries : int (optional, default = 100000)
+        the number of filings kept before the least recently used ones are
+        evicted
+
+    Attributes
+    -----------
+    hits : int
+        number of lookups answered from the cache
+    misses : int
+        number of lookups that were not in the cache
+
+    Example
+    -----------
+    >>> cache = FilingCache('filings.sqlite', max_entries=5000)
+    >>> gather_financial_statement_time_series(api_key, 'AAPL',
+    'income_statement', ['2018', '2019'], ['Q1'], cache=cache)
+    >>> cache.stats()
+    """
+
+    def __init__(self, path=None, max_entries=100000):
+        if path is None:
+            path = default_cache_path()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # used increases on every read or write, the smallest is the LRU one
+        self._db.execute('CREATE TABLE IF NOT EXISTS filings ('
+                         'key TEXT PRIMARY KEY, facts TEXT, used INTEGER)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS filings_used '
+                         'ON filings (used)')
+        self._db.commit()
+        # the number of filings and the last use are read once and then
+        # kept up to date here, instead of being queried on every access
+        self._entries, self._used = self._db.execute(
+            'SELECT COUNT(*), COALESCE(MAX(used), 0) FROM filings').fetchone()
+
+    def get(self, key):
+        """
+        Return the facts cached for a filing key (as a list of dictionaries)
+        or None if the filing is not cached.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT facts FROM filings WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute('UPDATE filings SET used = ? WHERE key = ?',
+                             (self._next_use(), key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, facts):
+        """Cache the facts of a filing key, evicting the LRU filings."""
+        with self._lock:
+            facts = json.dumps(facts)
+            used = self._next_use()
+            if not self._db.execute(
+                    'UPDATE filings SET facts = ?, used = ? WHERE key = ?',
+                    (facts, used, key)).rowcount:
+                self._db.execute('INSERT INTO filings VALUES (?, ?, ?)',
+                                 (key, facts, used))
+                self._entries += 1
+            extra = self._entries - self.max_entries
+            if extra > 0:
+                self._entries -= self._db.execute(
+                    'DELETE FROM filings WHERE key IN (SELECT key FROM '
+                    'filings ORDER BY used LIMIT ?)', (extra,)).rowcount
+            self._db.commit()
+
+    def clear(self):
+        """Remove every filing and reset the statistics."""
+        with self._lock:
+            self._db.execute('DELETE FROM filings')
+            self._db.commit()
+            self._entries = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hits, misses, hit rate and size of the cache."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self), 'max_entries': self.max_entries}
+
+    def _next_use(self):
+        self._used += 1
+        return self._used
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM filings').fetchone()[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM filings WHERE key = ?',
+                                    (key,)).fetchone() is not None
+
+
+class CachedSource:
+    """
+    Data source that answers reported financials from a FilingCache and
+    forwards everything else to another source. Only filings that exist
+    (non-empty responses) are cached.
+
+    Parameters
+    -----------
+    source : object
+        the source to read missing filings and stock prices from
+    cache : FilingCache
+        the cache to read and fill
+    """
+
+    def __init__(self, source, cache):
+        self.source = source
+        self.cache = cache
+
+    def _cached(self, key):
+        facts = self.cache.get(key)
+        note_cache(facts is not None)
+        if facts is None:
+            return None
+        return SimpleNamespace(reported_financials=[_fact(f) for f in facts])
+
+    def _store(self, key, response):
+        if response.reported_financials:
+            self.cache.put(key, _facts(response))
+        return response
+
+    def get_fundamental_reported_financials(self, key):
+        response = self._cached(key)
+        if response is None:
+            response = self._store(
+                key, self.source.get_fundamental_reported_financials(key))
+        return response
+
+    async def aget_fundamental_reported_financials(self, key):
+        # the SQLite reads and writes block: they run in the executor like
+        # the blocking endpoints, see pyntrinio.sources._acall
+        response = await _acall(self, '_cached', key)
+        if response is None:
+            response = await _acall(
+                self.source, 'get_fundamental_reported_financials', key)
+            await _acall(self, '_store', key, response)
+        return response
+
+    def get_security_stock_prices(self, *args, **kwargs):
+        return self.source.get_security_stock_prices(*args, **kwargs)
+
+    async def aget_security_stock_prices(self, *args, **kwargs):
+        return await _acall(self.source, 'get_security_stock_prices', *args,
+                            **kwargs)
+
+
+def cached_source(source, cache):
+    """
+    Wrap source in a CachedSource according to the cache argument of the
+    gather_* functions: a FilingCache is used as is, True means the
+    default_cache() and False or None leave source uncached.
+    """
+    if cache is True:
+        cache = default_cache()
+    if cache is None or cache is False:
+        return source
+    return CachedSource(source, cache)
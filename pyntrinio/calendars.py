@@ -0,0 +1,257 @@
+# Author: Team Andrey Markov
+# pyntrinio trading calendars
+
+# gather_stock_returns moves a buy date that is not a trading day to the next
+# trading day and a sell date to the last one. A TradingCalendar holds the
+# sorted trading days (sessions) of an exchange as a datetime64[D] array, so
+# a date is snapped to a session with one np.searchsorted, in O(log n) and
+# without a request. nyse_calendar() derives the sessions of the New York
+# Stock Exchange from its holiday rules (and the unscheduled closings since
+# 1990), and TradingCalendar.from_store() collects them from the price dates
+# kept in a local store (see pyntrinio.store and pyntrinio.columnar).
+
+# Imports
+import functools
+from datetime import date, timedelta
+
+import numpy as np
+
+from pyntrinio.sources import _to_date
+
+# days the NYSE closed outside of its holiday rules
+NYSE_CLOSINGS = [
+    '1994-04-27',  # national day of mourning for Richard Nixon
+    '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',  # 9/11
+    '2004-06-11',  # national day of mourning for Ronald Reagan
+    '2007-01-02',  # national day of mourning for Gerald Ford
+    '2012-10-29', '2012-10-30',  # hurricane Sandy
+    '2018-12-05',  # national day of mourning for George H.W. Bush
+    '2025-01-09',  # national day of mourning for Jimmy Carter
+]
+
+# the first year the holiday rules of nyse_holidays() apply to
+NYSE_FIRST_YEAR = 1990
+
+
+def _nth_weekday(year, month, weekday, n):
+    """
+    Return the n-th weekday (0 for Monday) of a month, or the last one for
+    n = -1
+    """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 +
+                                 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """Return the date of Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    m = (32 + 2 * e + 2 * i - h - k) % 7
+    n = (a + 11 * h + 22 * m) // 451
+    month, day = divmod(h + m - 7 * n + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(holiday):
+    """
+    Return the weekday a holiday is observed on: the Friday before a
+    Saturday and the Monday after a Sunday
+    """
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+
+def nyse_holidays(year):
+    """
+    Return the weekdays of a year the NYSE is closed on by its holiday
+    rules (from NYSE_FIRST_YEAR on), in date order.
+
+    Parameters
+    -----------
+    year : int
+        the year to list the holidays of
+
+    Returns
+    -----------
+    list
+        the date of every holiday
+    """
+    holidays = []
+    new_year = date(year, 1, 1)
+    # the NYSE does not close on the Friday before a Saturday New Year
+    if new_year.weekday() != 5:
+        holidays.append(_observed(new_year))
+    if year >= 1998:
+        # Martin Luther King, Jr. Day
+        holidays.append(_nth_weekday(year, 1, 0, 3))
+    holidays.append(_nth_weekday(year, 2, 0, 3))  # Washington's Birthday
+    holidays.append(_easter(year) - timedelta(days=2))  # Good Friday
+    holidays.append(_nth_weekday(year, 5, 0, -1))  # Memorial Day
+    if year >= 2022:
+        holidays.append(_observed(date(year, 6, 19)))  # Juneteenth
+    holidays.append(_observed(date(year, 7, 4)))  # Independence Day
+    holidays.append(_nth_weekday(year, 9, 0, 1))  # Labor Day
+    holidays.append(_nth_weekday(year, 11, 3, 4))  # Thanksgiving
+    holidays.append(_observed(date(year, 12, 25)))  # Christmas
+    return holidays
+
+
+class TradingCalendar:
+    """
+    The trading days (sessions) of an exchange, to snap dates to sessions
+    without requests.
+
+    Parameters
+    -----------
+    sessions : array-like
+        the trading days, as dates, "%Y-%m-%d" strings or datetime64, in
+        any order
+
+    Example
+    -----------
+    >>> calendar = nyse_calendar()
+    >>> calendar.next_trading_day('2019-12-25')
+    datetime.date(2019, 12, 26)
+    """
+
+    def __init__(self, sessions):
+        sessions = np.asarray([np.datetime64(_to_date(s), 'D')
+                               if not isinstance(s, np.datetime64) else s
+                               for s in sessions], dtype='datetime64[D]')
+        self.sessions = np.unique(sessions)
+
+    @classmethod
+    def from_store(cls, store, tickers=None):
+        """
+        Return the calendar of the dates stored for the tickers (every
+        stored ticker by default) in a PriceStore or ColumnStore.
+        """
+        if tickers is None:
+            tickers = store.tickers()
+        dates = []
+        for ticker in tickers:
+            if hasattr(store, 'columns'):
+                columns = store.columns(ticker)
+                if columns is not None:
+                    dates.append(np.asarray(columns['date']))
+            else:
+                dates.append(np.asarray(
+                    [p.date for p in store.get(ticker)],
+                    dtype='datetime64[D]'))
+        calendar = cls([])
+        if dates:
+            calendar.sessions = np.unique(np.concatenate(dates))
+        return calendar
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def _position(self, day, side):
+        return int(np.searchsorted(self.sessions,
+                                   np.datetime64(_to_date(day), 'D'), side))
+
+    def _session(self, k):
+        if 0 <= k < len(self.sessions):
+            return self.sessions[k].item()
+        return None
+
+    def is_trading_day(self, day):
+        """Return whether a date is a session of the calendar."""
+        k = self._position(day, 'left')
+        return self._session(k) == _to_date(day)
+
+    def next_trading_day(self, day):
+        """
+        Return the first session on or after a date, or None after the last
+        session of the calendar.
+        """
+        return self._session(self._position(day, 'left'))
+
+    def previous_trading_day(self, day):
+        """
+        Return the last session on or before a date, or None before the
+        first session of the calendar.
+        """
+        return self._session(self._position(day, 'right') - 1)
+
+    def offset(self, day, n):
+        """
+        Return the session n sessions after the next trading day of a date,
+        or, for a negative n, -n sessions before its previous trading day.
+        Returns None for a date before the first session or after the last
+        one (the calendar does not know the sessions around it), and when
+        the offset leaves the calendar.
+        """
+        if not len(self.sessions) or \
+                not self.sessions[0] <= np.datetime64(_to_date(day), 'D') \
+                <= self.sessions[-1]:
+            return None
+        if n >= 0:
+            return self._session(self._position(day, 'left') + n)
+        k = self._position(day, 'right') - 1 + n
+        return self._session(k) if k >= 0 else None
+
+    def between(self, start_date=None, end_date=None):
+        """
+        Return the sessions between the dates (both included) as a
+        datetime64[D] array.
+        """
+        lo = 0 if start_date is None else self._position(start_date, 'left')
+        hi = len(self.sessions) if end_date is None else \
+            self._position(end_date, 'right')
+        return self.sessions[lo:max(lo, hi)]
+
+    def snap(self, dates, forward=True):
+        """
+        Snap an array of dates to sessions at once: to the next trading day
+        with forward, to the previous one otherwise. Dates outside of the
+        calendar become NaT.
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        if forward:
+            k = np.searchsorted(self.sessions, dates, 'left')
+        else:
+            k = np.searchsorted(self.sessions, dates, 'right') - 1
+        inside = (k >= 0) & (k < len(self.sessions))
+        snapped = np.full(dates.shape, np.datetime64('NaT'),
+                          dtype='datetime64[D]')
+        snapped[inside] = self.sessions[k[inside]]
+        return snapped
+
+
+def nyse_calendar(last_year=None):
+    """
+    Return the TradingCalendar of the NYSE from NYSE_FIRST_YEAR to the end
+    of last_year (by default the year after the current one): the weekdays
+    that are neither holidays (see nyse_holidays) nor NYSE_CLOSINGS.
+    """
+    # the default is resolved before the cache, so that a long-running
+    # process gets the sessions of the new years as they come
+    if last_year is None:
+        last_year = date.today().year + 1
+    return _nyse_calendar(last_year)
+
+
+@functools.lru_cache(maxsize=None)
+def _nyse_calendar(last_year):
+    """Build the TradingCalendar of nyse_calendar, once per last_year."""
+    closed = [np.datetime64(d, 'D') for d in NYSE_CLOSINGS]
+    for year in range(NYSE_FIRST_YEAR, last_year + 1):
+        closed.extend(np.datetime64(d, 'D') for d in nyse_holidays(year))
+    days = np.arange(np.datetime64(str(NYSE_FIRST_YEAR) + '-01-01'),
+                     np.datetime64(str(last_year + 1) + '-01-01'),
+                     dtype='datetime64[D]')
+    sessions = days[np.is_busday(days, holidays=closed)]
+    calendar = TradingCalendar([])
+    calendar.sessions = sessions
+    return calendar
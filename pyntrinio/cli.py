@@ -0,0 +1,233 @@
+# Author: Team Andrey Markov
+# pyntrinio command line
+
+# The pyntrinio command extracts the data of a whole universe of tickers to
+# a folder, one CSV or Parquet file per ticker, streamed page by page as the
+# responses arrive (see pyntrinio.export):
+#
+#   pyntrinio prices --tickers universe.txt --start 2010-01-01 \
+#       --end 2019-12-31 --out prices/
+#   pyntrinio fundamentals --tickers AAPL,CSCO --statement income_statement \
+#       --years 2018 2019 --periods Q1 Q2 Q3 Q4 --out fundamentals/ \
+#       --format parquet
+#
+# The API key is read from --api-key or the INTRINIO_API_KEY environment
+# variable. --tickers takes ticker symbols separated by commas or files with
+# one ticker per line (lines starting with # are ignored). The command exits
+# with status 1 when some tickers failed, after writing all the others.
+#
+# Every file completed is recorded in the checkpoint manifest of the folder
+# (see pyntrinio.jobs), so running the same command again after a failure,
+# a crash or Ctrl-C only extracts the tickers that are missing.
+
+# Imports
+import argparse
+import os
+import sys
+
+from pyntrinio.export import (FUNDAMENTAL_FIELDS, FUNDAMENTAL_TYPES,
+                              PRICE_TYPES, WRITERS, export_path,
+                              fundamental_page, stream_to_files)
+from pyntrinio.jobs import CheckpointManifest
+from pyntrinio.pyntrinio import (
+    _check_financial_statement_time_series, _check_stock_time_series,
+    _default_source, _financial_statement_record, _fundamentals_source,
+    _reported_financials_key, iter_stock_time_series)
+from pyntrinio.sources import PRICE_FIELDS
+
+# the checkpoint manifest of an output folder
+MANIFEST = '.checkpoint.jsonl'
+
+
+def read_tickers(values):
+    """
+    Return the tickers named by the --tickers arguments: files with one
+    ticker per line, or ticker symbols separated by commas.
+    """
+    tickers = []
+    for value in values:
+        if os.path.isfile(value):
+            with open(value) as f:
+                lines = [line.strip() for line in f]
+            tickers.extend(line for line in lines
+                           if line and not line.startswith('#'))
+        else:
+            tickers.extend(t.strip() for t in value.split(',') if t.strip())
+    return list(dict.fromkeys(tickers))
+
+
+def _price_pages(args, source):
+    """
+    Return the pages function of the prices command: the stock prices of a
+    ticker, one page at a time
+    """
+    def pages(ticker):
+        return iter_stock_time_series(
+            args.api_key, ticker, args.start, args.end, output_format='dict',
+            page_size=args.page_size, source=source, prefetch=False)
+    return pages
+
+
+def _fundamental_pages(args, filings):
+    """
+    Return the pages function of the fundamentals command: one page of long
+    (ticker, statement, year, period, tag, value) rows per filing
+    """
+    def pages(ticker):
+        for year in args.years:
+            for period in args.periods:
+                key = _reported_financials_key(ticker, args.statement, year,
+                                               period)
+                record = _financial_statement_record(
+                    ticker, args.statement, year, period,
+                    filings.get_fundamental_reported_financials(key))
+                yield fundamental_page(record)
+    return pages
+
+
+def _unit(args, ticker):
+    """
+    Return the unit of the checkpoint manifest of the file of a ticker: the
+    command and the arguments that shape its content
+    """
+    if args.command == 'prices':
+        return ('prices', ticker, args.format, args.start or '',
+                args.end or '')
+    return ('fundamentals', ticker, args.format, args.statement,
+            ','.join(args.years), ','.join(args.periods))
+
+
+def build_parser():
+    """Return the argument parser of the pyntrinio command."""
+    parser = argparse.ArgumentParser(
+        prog='pyntrinio',
+        description='Extract Intrinio data for many tickers to CSV or '
+                    'Parquet files, one per ticker.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--tickers', nargs='+', required=True,
+                        help='ticker symbols separated by commas, or files '
+                             'with one ticker per line')
+    common.add_argument('--out', required=True,
+                        help='the folder of the files, one per ticker')
+    common.add_argument('--format', choices=sorted(WRITERS), default='csv',
+                        help='the format of the files (default: csv)')
+    common.add_argument('--api-key',
+                        default=os.environ.get('INTRINIO_API_KEY'),
+                        help='the Intrinio API key (default: the '
+                             'INTRINIO_API_KEY environment variable)')
+    common.add_argument('--workers', type=int, default=10,
+                        help='the number of tickers requested at the same '
+                             'time (default: 10)')
+    common.add_argument('--buffer', type=int, default=16,
+                        help='the number of pages held in memory before '
+                             'they are written (default: 16)')
+
+    prices = commands.add_parser(
+        'prices', parents=[common],
+        help='daily stock prices, see gather_stock_time_series')
+    prices.add_argument('--start', help='the earliest date, %%Y-%%m-%%d')
+    prices.add_argument('--end', help='the most recent date, %%Y-%%m-%%d')
+    prices.add_argument('--page-size', type=int, default=10000,
+                        help='the number of rows per request (default: '
+                             '10000)')
+
+    fundamentals = commands.add_parser(
+        'fundamentals', parents=[common],
+        help='reported financials, see '
+             'gather_financial_statement_time_series')
+    fundamentals.add_argument(
+        '--statement', required=True,
+        choices=['income_statement', 'cash_flow_statement',
+                 'balance_sheet_statement'])
+    fundamentals.add_argument('--years', nargs='+', required=True)
+    fundamentals.add_argument('--periods', nargs='+', required=True)
+    return parser
+
+
+def main(argv=None, source=None):
+    """
+    Run the pyntrinio command with the arguments argv (sys.argv by default)
+    and return its exit status.
+
+    Parameters
+    -----------
+    argv : list (optional)
+        the command line arguments, without the program name
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+
+    Returns
+    -----------
+    int
+        0 if every ticker was written, 1 if some failed
+
+    Example
+    -----------
+    >>> main(['prices', '--tickers', 'AAPL,CSCO', '--out', 'prices'])
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.api_key and source is None:
+        parser.error('an API key is required: use --api-key or set '
+                     'INTRINIO_API_KEY')
+    args.api_key = args.api_key or ''
+    tickers = read_tickers(args.tickers)
+    if not tickers:
+        parser.error('no tickers to extract')
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error('Parquet output requires pyarrow: pip install '
+                         'pyarrow')
+
+    if args.command == 'prices':
+        try:
+            _check_stock_time_series(tickers[0], args.start, args.end)
+        except ValueError as e:
+            parser.error(str(e))
+        if source is None:
+            source = _default_source(args.api_key, args.workers)
+        pages = _price_pages(args, source)
+        fields, types = PRICE_FIELDS, PRICE_TYPES
+    else:
+        try:
+            _check_financial_statement_time_series(
+                args.api_key, tickers[0], args.statement, args.years,
+                args.periods, 'dict')
+        except Exception as e:
+            parser.error(str(e))
+        source, filings = _fundamentals_source(args.api_key, source, None,
+                                               args.workers)
+        pages = _fundamental_pages(args, filings)
+        fields, types = FUNDAMENTAL_FIELDS, FUNDAMENTAL_TYPES
+
+    # the tickers whose file is complete are not extracted again
+    manifest = CheckpointManifest(os.path.join(args.out, MANIFEST))
+    todo = [ticker for ticker in tickers
+            if not (manifest.done(_unit(args, ticker)) and os.path.exists(
+                export_path(args.out, ticker, args.format)))]
+    if len(todo) < len(tickers):
+        print('skipped ' + str(len(tickers) - len(todo)) +
+              ' tickers already extracted', file=sys.stderr)
+    with manifest:
+        summary = stream_to_files(
+            todo, pages, args.out, fields, args.format, types,
+            max_workers=args.workers, buffer=args.buffer,
+            on_done=lambda ticker, path, rows: manifest.record(
+                _unit(args, ticker), rows))
+
+    for ticker, message in summary['failed'].items():
+        print(ticker + ': ' + message, file=sys.stderr)
+    print('wrote ' + str(sum(summary['rows'].values())) + ' rows for ' +
+          str(len(summary['rows'])) + ' tickers to ' + args.out +
+          (', ' + str(len(summary['failed'])) + ' failed'
+           if summary['failed'] else ''), file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
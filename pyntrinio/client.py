@@ -0,0 +1,156 @@
+# Author: Team Andrey Markov
+# pyntrinio client
+
+# PyntrinioClient is a long-lived IntrinioSource with the gather_* functions
+# as methods. It keeps one configured intrinio_sdk.ApiClient, so every call
+# made through it reuses the same pool of keep-alive connections instead of
+# opening new ones. The module level gather_* functions read from the client
+# returned by get_client(api_key), which is created once per API key and
+# process.
+
+# Imports
+import threading
+
+from pyntrinio import aio, pyntrinio
+from pyntrinio.sources import IntrinioSource
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class PyntrinioClient(IntrinioSource):
+    """
+    Reusable client of the Intrinio API.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    max_connections : int (optional, default = 10)
+        the number of connections kept alive in the pool, which should be at
+        least the max_workers or max_concurrency used with the client
+    cache : bool or FilingCache (optional, default = True)
+        the cache of reported financials used by the fundamentals methods,
+        see pyntrinio.cache.cached_source
+
+    Example
+    -----------
+    >>> with PyntrinioClient(api_key, max_connections=16) as client:
+    ...     client.gather_stock_returns(tickers, "2017-12-31", "2019-03-01",
+    ...                                 max_workers=16)
+    """
+
+    def __init__(self, api_key, max_connections=10, cache=True):
+        super().__init__(api_key, max_connections=max_connections)
+        self.cache = cache
+
+    def gather_financial_statement_time_series(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.gather_financial_statement_time_series."""
+        kwargs.setdefault('cache', self.cache)
+        return pyntrinio.gather_financial_statement_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    def gather_financial_statement_company_compare(self, *args, **kwargs):
+        """
+        See pyntrinio.pyntrinio.gather_financial_statement_company_compare.
+        """
+        kwargs.setdefault('cache', self.cache)
+        return pyntrinio.gather_financial_statement_company_compare(
+            self.api_key, *args, source=self, **kwargs)
+
+    def iter_financial_statement_time_series(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.iter_financial_statement_time_series."""
+        kwargs.setdefault('cache', self.cache)
+        return pyntrinio.iter_financial_statement_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    def iter_financial_statement_company_compare(self, *args, **kwargs):
+        """
+        See pyntrinio.pyntrinio.iter_financial_statement_company_compare.
+        """
+        kwargs.setdefault('cache', self.cache)
+        return pyntrinio.iter_financial_statement_company_compare(
+            self.api_key, *args, source=self, **kwargs)
+
+    def gather_financial_statements(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.gather_financial_statements."""
+        kwargs.setdefault('cache', self.cache)
+        return pyntrinio.gather_financial_statements(
+            self.api_key, *args, source=self, **kwargs)
+
+    def gather_stock_time_series(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.gather_stock_time_series."""
+        return pyntrinio.gather_stock_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    def iter_stock_time_series(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.iter_stock_time_series."""
+        return pyntrinio.iter_stock_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    def gather_stock_returns(self, *args, **kwargs):
+        """See pyntrinio.pyntrinio.gather_stock_returns."""
+        return pyntrinio.gather_stock_returns(
+            self.api_key, *args, source=self, **kwargs)
+
+    async def agather_financial_statement_time_series(self, *args, **kwargs):
+        """See pyntrinio.aio.agather_financial_statement_time_series."""
+        kwargs.setdefault('cache', self.cache)
+        return await aio.agather_financial_statement_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    async def agather_financial_statement_company_compare(self, *args,
+                                                          **kwargs):
+        """See pyntrinio.aio.agather_financial_statement_company_compare."""
+        kwargs.setdefault('cache', self.cache)
+        return await aio.agather_financial_statement_company_compare(
+            self.api_key, *args, source=self, **kwargs)
+
+    async def agather_financial_statements(self, *args, **kwargs):
+        """See pyntrinio.aio.agather_financial_statements."""
+        kwargs.setdefault('cache', self.cache)
+        return await aio.agather_financial_statements(
+            self.api_key, *args, source=self, **kwargs)
+
+    async def agather_stock_time_series(self, *args, **kwargs):
+        """See pyntrinio.aio.agather_stock_time_series."""
+        return await aio.agather_stock_time_series(
+            self.api_key, *args, source=self, **kwargs)
+
+    async def agather_stock_returns(self, *args, **kwargs):
+        """See pyntrinio.aio.agather_stock_returns."""
+        return await aio.agather_stock_returns(
+            self.api_key, *args, source=self, **kwargs)
+
+
+def get_client(api_key, max_connections=None):
+    """
+    Return the PyntrinioClient shared by the module level functions for
+    api_key, creating it on first use.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    max_connections : int (optional)
+        the pool size needed by the caller. A shared client with a smaller
+        pool is replaced by one with a pool of that size, and its idle
+        connections are closed
+
+    Returns
+    -----------
+    PyntrinioClient
+    """
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None or (max_connections is not None and
+                              client.max_connections < max_connections):
+            size = 10 if max_connections is None else max(10, max_connections)
+            replaced = client
+            client = PyntrinioClient(api_key, max_connections=size)
+            _clients[api_key] = client
+            if replaced is not None:
+                # requests still in flight on the replaced client complete,
+                # their connections are closed when they are released
+                replaced.close()
+        return client
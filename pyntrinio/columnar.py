@@ -0,0 +1,488 @@
+# Author: Team Andrey Markov
+# pyntrinio memory-mapped columnar store of stock prices
+
+# ColumnStore keeps the price history of every ticker as fixed-width NumPy
+# columns in .npy files, oldest bar first. <path>/<ticker>/meta.json names
+# the current version of the files, the first synced date and the
+# frequencies, and <path>/<ticker>/<version>/ holds
+#   date.npy         datetime64[D] dates
+#   prices.npy       float64 (rows x NUMERIC_FIELDS), Fortran ordered so
+#                    that every field is a contiguous column
+#   frequency.npy    int8 codes into the frequencies of meta.json
+#   intraperiod.npy  bool
+# The files are read with np.load(mmap_mode='r'): the operating system pages
+# them in on demand and shares the pages between every process reading
+# them, and a date range is a slice (found with searchsorted) of the mapped
+# arrays, so reading it copies nothing. Every write goes to a temporary
+# folder, renamed to the next version once complete, before meta.json is
+# switched to it, so readers never see a half-written history. Writers of a
+# ticker take turns on the lock file <path>/<ticker>/.lock (threads and
+# processes alike), and a superseded version is only deleted by a later
+# sync, once it has been superseded for `grace` seconds, or by prune():
+# readers that loaded the previous meta.json still find its files.
+#
+# ColumnStore has the interface of pyntrinio.store.PriceStore, so it can be
+# given to gather_stock_time_series(store=...) to sync it incrementally.
+# pandas is only imported to build dataframes, so syncing a store and
+# reading it as dictionaries does not pay for its import.
+
+# Imports
+import contextlib
+import json
+import operator
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from pyntrinio.cache import cache_folder
+from pyntrinio.sources import PRICE_FIELDS, _to_date
+from pyntrinio.store import _missing_windows, _synced_start
+
+# numeric attributes of a stock price, read in one call per row
+NUMERIC_FIELDS = [f for f in PRICE_FIELDS
+                  if f not in ('date', 'frequency', 'intraperiod')]
+_NUMERIC_GETTER = operator.attrgetter(*NUMERIC_FIELDS)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _price_arrays(stock_prices):
+    """
+    Return the columns of a list of stock prices: datetime64[D] dates, a
+    (rows x NUMERIC_FIELDS) float64 array where missing values are NaN, the
+    list of frequencies and a boolean intraperiod array
+    """
+    n = len(stock_prices)
+    # one pass over the rows fills a single (rows x fields) float array
+    values = np.array([_NUMERIC_GETTER(p) for p in stock_prices],
+                      dtype='float64').reshape(n, len(NUMERIC_FIELDS))
+    # dates go through their ordinal, much faster than parsing date objects
+    dates = (np.fromiter((p.date.toordinal() for p in stock_prices),
+                         dtype='int64', count=n) -
+             _EPOCH_ORDINAL).astype('datetime64[D]')
+    frequency = [p.frequency for p in stock_prices]
+    intraperiod = np.array([bool(p.intraperiod) for p in stock_prices],
+                           dtype=bool)
+    return dates, values, frequency, intraperiod
+
+
+def _price_frame(dates, values, frequency, intraperiod,
+                 price_dtype='float64'):
+    """
+    Build the stock prices dataframe of gather_stock_time_series from its
+    columns: a datetime64 date, price_dtype prices, int64 volumes (float64
+    if some are missing), a categorical frequency and a boolean intraperiod
+    """
+    import pandas as pd
+
+    columns = {'date': dates.astype('datetime64[ns]')}
+    for k, field in enumerate(NUMERIC_FIELDS):
+        column = values[:, k]
+        if field.endswith('volume'):
+            if not np.isnan(column).any():
+                column = column.astype('int64')
+        else:
+            column = column.astype(price_dtype)
+        columns[field] = column
+    columns['frequency'] = frequency
+    columns['intraperiod'] = np.asarray(intraperiod, dtype=bool)
+    return pd.DataFrame(columns, columns=PRICE_FIELDS)
+
+
+def _panel_frame(dates, values, frequency, intraperiod, ticker_codes,
+                 tickers, price_dtype='float64', layout='long'):
+    """
+    Build the stock prices dataframe of several tickers from their stacked
+    columns and the code of the ticker of every row (into tickers). The
+    'long' layout puts a categorical 'ticker' column first and keeps the
+    rows in order, the 'multiindex' layout sorts the rows by date then
+    ticker and indexes them by (date, ticker)
+    """
+    import pandas as pd
+
+    if layout == 'multiindex':
+        # a stable sort keeps the order of tickers within a date
+        order = np.lexsort((ticker_codes, dates))
+        dates, values, ticker_codes = dates[order], values[order], \
+            ticker_codes[order]
+        frequency = frequency.take(order)
+        intraperiod = np.asarray(intraperiod, dtype=bool)[order]
+    frame = _price_frame(dates, values, frequency, intraperiod, price_dtype)
+    ticker = pd.Categorical.from_codes(ticker_codes, tickers)
+    if layout == 'multiindex':
+        frame.index = pd.MultiIndex.from_arrays(
+            [frame.pop('date'), ticker], names=['date', 'ticker'])
+        return frame
+    frame.insert(0, 'ticker', ticker)
+    return frame
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """
+    Hold an exclusive lock on the file path (created if needed) until the
+    block exits, waiting for the threads and processes holding it
+    """
+    with open(path, 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after 10 seconds, so keep waiting
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def default_columns_path():
+    """
+    Return the folder of the default ColumnStore: columns in
+    pyntrinio.cache.cache_folder()
+    """
+    return os.path.join(cache_folder(), 'columns')
+
+
+class ColumnStore:
+    """
+    Memory-mapped columnar store of daily stock prices, partitioned by
+    ticker.
+
+    Parameters
+    -----------
+    path : str (optional)
+        the folder to store the prices in, defaults to
+        default_columns_path()
+    grace : float (optional, default = 60.0)
+        the seconds a superseded version is kept for the readers that
+        loaded it before a sync deletes it, see prune()
+
+    Example
+    -----------
+    >>> store = ColumnStore('prices')
+    >>> gather_stock_time_series(api_key, 'AAPL', start_date='2000-01-03',
+    output_format='pddf', store=store)
+    >>> store.columns('AAPL', '2019-01-01', '2019-12-31')['adj_close']
+    """
+
+    def __init__(self, path=None, grace=60.0):
+        if path is None:
+            path = default_columns_path()
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.grace = grace
+        self._lock = threading.Lock()
+        # memory maps of the current version of every ticker read so far
+        self._mapped = {}
+
+    def _folder(self, ticker):
+        return os.path.join(self.path, quote(ticker, safe=''))
+
+    def _meta(self, ticker):
+        try:
+            with open(os.path.join(self._folder(ticker), 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _arrays(self, ticker):
+        """
+        Return the meta data and the memory-mapped columns of a ticker
+        (None if it is not stored)
+        """
+        while True:
+            meta = self._meta(ticker)
+            if meta is None:
+                return None, None
+            with self._lock:
+                mapped = self._mapped.get(ticker)
+                if mapped is not None and mapped[0] == meta['version']:
+                    return meta, mapped[1]
+                folder = os.path.join(self._folder(ticker),
+                                      str(meta['version']))
+                try:
+                    arrays = {name: np.load(
+                        os.path.join(folder, name + '.npy'), mmap_mode='r')
+                        for name in ('date', 'prices', 'frequency',
+                                     'intraperiod')}
+                except FileNotFoundError:
+                    # the version was pruned after meta.json was read: read
+                    # the version that replaced it
+                    if self._meta(ticker) == meta:
+                        raise
+                    continue
+                self._mapped[ticker] = (meta['version'], arrays)
+                return meta, arrays
+
+    def _slice(self, arrays, start_date, end_date):
+        dates = arrays['date']
+        lo = 0 if start_date is None else int(np.searchsorted(
+            dates, np.datetime64(_to_date(start_date), 'D'), 'left'))
+        hi = len(dates) if end_date is None else int(np.searchsorted(
+            dates, np.datetime64(_to_date(end_date), 'D'), 'right'))
+        return slice(lo, max(lo, hi))
+
+    def columns(self, ticker, start_date=None, end_date=None):
+        """
+        Return the stored prices of a ticker between the dates (date
+        objects or "%Y-%m-%d" strings, both included) as read-only NumPy
+        views of the mapped files, oldest first: 'date' (datetime64[D]), one
+        float64 array per NUMERIC_FIELDS, 'frequency' (int8 codes into
+        frequencies(ticker)) and 'intraperiod' (bool). Returns None if the
+        ticker is not stored.
+        """
+        meta, arrays = self._arrays(ticker)
+        if arrays is None:
+            return None
+        rows = self._slice(arrays, start_date, end_date)
+        columns = {'date': arrays['date'][rows]}
+        for k, field in enumerate(NUMERIC_FIELDS):
+            columns[field] = arrays['prices'][rows, k]
+        columns['frequency'] = arrays['frequency'][rows]
+        columns['intraperiod'] = arrays['intraperiod'][rows]
+        return columns
+
+    def frequencies(self, ticker):
+        """Return the frequencies the 'frequency' codes of a ticker map to."""
+        meta = self._meta(ticker)
+        return [] if meta is None else meta['frequencies']
+
+    def frame(self, ticker, start_date=None, end_date=None,
+              price_dtype='float64'):
+        """
+        Return the stored prices of a ticker between the dates as the
+        dataframe gather_stock_time_series returns (newest first), built
+        straight from the mapped columns.
+        """
+        import pandas as pd
+
+        meta, arrays = self._arrays(ticker)
+        if arrays is None:
+            return _price_frame(np.array([], dtype='datetime64[D]'),
+                                np.empty((0, len(NUMERIC_FIELDS))),
+                                pd.Categorical([]), [], price_dtype)
+        rows = self._slice(arrays, start_date, end_date)
+        # reversed views of the mapped columns, newest first
+        codes = arrays['frequency'][rows][::-1]
+        frequency = pd.Categorical.from_codes(
+            codes, meta['frequencies']).remove_unused_categories()
+        return _price_frame(arrays['date'][rows][::-1],
+                            arrays['prices'][rows][::-1], frequency,
+                            arrays['intraperiod'][rows][::-1], price_dtype)
+
+    def panel(self, tickers, start_date=None, end_date=None,
+              price_dtype='float64', layout='long', newest_first=False):
+        """
+        Return the stored prices of several tickers between the dates as
+        one dataframe (see the layouts of gather_stock_time_series): 'long'
+        has a 'ticker' column first and the rows of every ticker oldest
+        first (newest first with newest_first), 'multiindex' is indexed by
+        (date, ticker). Every column is allocated once and filled from the
+        mapped files.
+        """
+        import pandas as pd
+
+        slices = []
+        for ticker in tickers:
+            meta, arrays = self._arrays(ticker)
+            if arrays is not None:
+                slices.append((ticker, meta, arrays,
+                               self._slice(arrays, start_date, end_date)))
+        n = sum(rows.stop - rows.start for _, _, _, rows in slices)
+        dates = np.empty(n, dtype='datetime64[D]')
+        values = np.empty((n, len(NUMERIC_FIELDS)), dtype='float64')
+        intraperiod = np.empty(n, dtype=bool)
+        frequency = np.empty(n, dtype=object)
+        ticker_codes = np.empty(n, dtype='int32')
+        step = -1 if newest_first else 1
+        at = 0
+        for code, (ticker, meta, arrays, rows) in enumerate(slices):
+            end = at + rows.stop - rows.start
+            dates[at:end] = arrays['date'][rows][::step]
+            values[at:end] = arrays['prices'][rows][::step]
+            intraperiod[at:end] = arrays['intraperiod'][rows][::step]
+            frequency[at:end] = np.asarray(
+                meta['frequencies'],
+                dtype=object)[arrays['frequency'][rows][::step]]
+            ticker_codes[at:end] = code
+            at = end
+        return _panel_frame(dates, values, pd.Categorical(frequency),
+                            intraperiod, ticker_codes,
+                            [t for t, _, _, _ in slices], price_dtype, layout)
+
+    def get(self, ticker, start_date=None, end_date=None):
+        """
+        Return the stored prices of a ticker between the dates as stock
+        price objects, newest first like the Intrinio API.
+        """
+        columns = self.columns(ticker, start_date, end_date)
+        if columns is None:
+            return []
+        frequencies = self.frequencies(ticker)
+        prices = []
+        for n in range(len(columns['date']) - 1, -1, -1):
+            price = SimpleNamespace(date=columns['date'][n].item())
+            for field in NUMERIC_FIELDS:
+                value = float(columns[field][n])
+                setattr(price, field, None if np.isnan(value) else value)
+            price.frequency = frequencies[columns['frequency'][n]]
+            price.intraperiod = bool(columns['intraperiod'][n])
+            prices.append(price)
+        return prices
+
+    def last_date(self, ticker):
+        """Return the date of the last stored bar of a ticker, or None."""
+        columns = self.columns(ticker)
+        if columns is None or not len(columns['date']):
+            return None
+        return columns['date'][-1].item()
+
+    def synced_from(self, ticker):
+        """
+        Return a tuple (synced, start): whether the ticker was ever synced
+        and the first date it was synced from (None for the start of its
+        history).
+        """
+        meta = self._meta(ticker)
+        if meta is None:
+            return False, None
+        return True, None if meta['start'] is None else _to_date(
+            meta['start'])
+
+    def missing(self, ticker, start_date=None, end_date=None, overlap=5):
+        """
+        Return the windows to request from the API to bring the stored
+        prices of a ticker up to date, see PriceStore.missing.
+        """
+        synced, synced_start = self.synced_from(ticker)
+        return _missing_windows(synced, synced_start, self.last_date(ticker),
+                                start_date, end_date, overlap)
+
+    def save_sync(self, ticker, start_date, stock_prices):
+        """
+        Merge the prices requested for the windows given by missing() with
+        the stored ones (the new rows replace the stored rows of the same
+        dates) and write them as a new version, see PriceStore.save_sync.
+        Syncs of the same ticker, from any thread or process, run one after
+        another.
+        """
+        folder = self._folder(ticker)
+        os.makedirs(folder, exist_ok=True)
+        with _file_lock(os.path.join(folder, '.lock')):
+            self._save_sync(ticker, folder, start_date, stock_prices)
+
+    def _save_sync(self, ticker, folder, start_date, stock_prices):
+        """save_sync, with the lock of the ticker held"""
+        synced, synced_start = self.synced_from(ticker)
+        start_date = _synced_start(synced, synced_start, start_date)
+        meta, arrays = self._arrays(ticker)
+        dates, values, frequency, intraperiod = _price_arrays(stock_prices)
+        frequencies = [] if meta is None else list(meta['frequencies'])
+        for f in frequency:
+            if f not in frequencies:
+                frequencies.append(f)
+        codes = np.array([frequencies.index(f) for f in frequency],
+                         dtype='int8')
+        if arrays is not None:
+            # keep the stored rows whose dates were not requested again
+            kept = ~np.isin(arrays['date'], dates)
+            dates = np.concatenate([arrays['date'][kept], dates])
+            values = np.concatenate([arrays['prices'][kept], values])
+            codes = np.concatenate([arrays['frequency'][kept], codes])
+            intraperiod = np.concatenate([arrays['intraperiod'][kept],
+                                          intraperiod])
+        order = np.argsort(dates, kind='stable')
+        version = 0 if meta is None else meta['version'] + 1
+        # write the files to a folder of their own, then give it the name
+        # of the version at once
+        staging = tempfile.mkdtemp(prefix='.tmp-', dir=folder)
+        np.save(os.path.join(staging, 'date.npy'), dates[order])
+        np.save(os.path.join(staging, 'prices.npy'),
+                np.asfortranarray(values[order]))
+        np.save(os.path.join(staging, 'frequency.npy'), codes[order])
+        np.save(os.path.join(staging, 'intraperiod.npy'), intraperiod[order])
+        version_folder = os.path.join(folder, str(version))
+        # a writer that crashed before switching meta.json may have left it
+        shutil.rmtree(version_folder, ignore_errors=True)
+        os.replace(staging, version_folder)
+        # switch to the new version. The superseded ones are deleted once
+        # they have been superseded for grace seconds: readers that loaded
+        # the previous meta.json keep finding their files until then
+        now = time.time()
+        superseded = [] if meta is None else \
+            meta.get('superseded', []) + [[meta['version'], now]]
+        expired = [v for v, at in superseded if now - at >= self.grace]
+        self._write_meta(folder, {
+            'version': version, 'frequencies': frequencies,
+            'start': None if start_date is None
+            else _to_date(start_date).isoformat(),
+            'superseded': [[v, at] for v, at in superseded
+                           if now - at < self.grace]})
+        for v in expired:
+            shutil.rmtree(os.path.join(folder, str(v)), ignore_errors=True)
+
+    def _write_meta(self, folder, meta):
+        meta_path = os.path.join(folder, 'meta.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def prune(self, ticker=None):
+        """
+        Delete the superseded versions of a ticker (every stored ticker by
+        default) whatever their age, and the files of writes that did not
+        complete. Run it when no other process is reading the tickers, e.g.
+        before a batch job: a process still mapping a deleted version keeps
+        its pages where the system allows it (POSIX), but can not load it
+        anymore.
+        """
+        tickers = self.tickers() if ticker is None else [ticker]
+        for ticker in tickers:
+            folder = self._folder(ticker)
+            if not os.path.isdir(folder):
+                continue
+            with _file_lock(os.path.join(folder, '.lock')):
+                meta = self._meta(ticker)
+                if meta is None:
+                    continue
+                for name in os.listdir(folder):
+                    if name.startswith('.tmp-') or (
+                            name.isdigit() and int(name) != meta['version']):
+                        shutil.rmtree(os.path.join(folder, name),
+                                      ignore_errors=True)
+                meta['superseded'] = []
+                self._write_meta(folder, meta)
+
+    def tickers(self):
+        """Return the stored tickers."""
+        return sorted(unquote(name) for name in os.listdir(self.path)
+                      if os.path.exists(os.path.join(self.path, name,
+                                                     'meta.json')))
+
+    def delete(self, ticker):
+        """Remove the prices of a ticker."""
+        with self._lock:
+            self._mapped.pop(ticker, None)
+        shutil.rmtree(self._folder(ticker), ignore_errors=True)
+
+    def __contains__(self, ticker):
+        return self._meta(ticker) is not None
@@ -0,0 +1,333 @@
+# Author: Team Andrey Markov
+# pyntrinio streaming export of bulk extractions to files
+
+# A bulk extraction requests the data of many tickers and writes each one to
+# its own file in a folder (<folder>/<ticker>.csv or .parquet) as the pages
+# arrive: stream_to_files() fetches the tickers on a pool of threads and
+# hands their pages to the calling thread through a queue that holds at most
+# `buffer` pages, so the fetching threads wait when the disk falls behind
+# and the memory used stays bounded whatever the size of the universe. A
+# file is written as <file>.part and renamed once its ticker is complete, so
+# a folder never holds a truncated file under its final name.
+#
+# Pages are dictionaries of columns (lists of the same length), the 'dict'
+# output of the gather_* functions. CSV files are written with the csv
+# module; Parquet files need pyarrow and get one row group per page.
+#
+# The filing records of the iter_financial_statement_* functions are
+# written as long (ticker, statement, year, period, tag, value) rows, since
+# every filing reports its own tags: write_fundamentals() gathers them in
+# chunks of chunk_size rows and appends each chunk to a single file.
+
+# Imports
+import csv
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from pyntrinio.sources import PRICE_FIELDS
+
+# the columns of the long rows of the fundamentals exports
+FUNDAMENTAL_FIELDS = ['ticker', 'statement', 'year', 'period', 'tag',
+                      'value']
+
+# the Parquet types of the exported columns
+PRICE_TYPES = dict({field: 'double' for field in PRICE_FIELDS},
+                   date='date32', frequency='string', intraperiod='bool')
+FUNDAMENTAL_TYPES = dict({field: 'string' for field in FUNDAMENTAL_FIELDS},
+                         value='double')
+
+
+class CsvWriter:
+    """
+    Writes pages of columns to a CSV file with a header line.
+
+    Parameters
+    -----------
+    path : str
+        the path of the file, written as path + '.part' until close()
+    fields : list
+        the columns of the file, in order
+    types : dict (optional)
+        unused, for the interface of ParquetWriter
+    """
+
+    extension = '.csv'
+
+    def __init__(self, path, fields, types=None):
+        self.path = path
+        self.fields = list(fields)
+        self.rows = 0
+        self._file = open(path + '.part', 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.fields)
+
+    def write(self, columns):
+        """Append the rows of a dictionary of columns."""
+        rows = list(zip(*[columns[field] for field in self.fields]))
+        self._writer.writerows(rows)
+        self.rows += len(rows)
+
+    def close(self):
+        """Finish the file and give it its final name."""
+        self._file.close()
+        os.replace(self.path + '.part', self.path)
+
+    def abort(self):
+        """Close and delete the unfinished file."""
+        self._file.close()
+        os.remove(self.path + '.part')
+
+
+class ParquetWriter:
+    """
+    Writes pages of columns to a Parquet file, one row group per page.
+    Requires pyarrow.
+
+    Parameters
+    -----------
+    path : str
+        the path of the file, written as path + '.part' until close()
+    fields : list
+        the columns of the file, in order
+    types : dict (optional)
+        the pyarrow type alias of every column, e.g. 'double' or 'date32'.
+        Columns without a type are strings
+    """
+
+    extension = '.parquet'
+
+    def __init__(self, path, fields, types=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Parquet output requires pyarrow: pip install pyarrow")
+        types = types or {}
+        self.path = path
+        self.fields = list(fields)
+        self.rows = 0
+        self._pa = pa
+        self._schema = pa.schema([
+            (field, pa.type_for_alias(types.get(field, 'string')))
+            for field in self.fields])
+        self._writer = pq.ParquetWriter(path + '.part', self._schema)
+
+    def write(self, columns):
+        """Append the rows of a dictionary of columns as a row group."""
+        table = self._pa.Table.from_pydict(
+            {field: columns[field] for field in self.fields},
+            schema=self._schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        """Finish the file and give it its final name."""
+        self._writer.close()
+        os.replace(self.path + '.part', self.path)
+
+    def abort(self):
+        """Close and delete the unfinished file."""
+        self._writer.close()
+        os.remove(self.path + '.part')
+
+
+WRITERS = {'csv': CsvWriter, 'parquet': ParquetWriter}
+
+
+def export_path(folder, ticker, file_format='csv'):
+    """
+    Return the path of the file of a ticker in an export folder. Tickers
+    are quoted so that every one of them is a valid file name.
+    """
+    return os.path.join(folder, quote(ticker, safe='') +
+                        WRITERS[file_format].extension)
+
+
+def fundamental_page(record):
+    """
+    Return the long (ticker, statement, year, period, tag, value) columns of
+    a filing record, from a financial statement time series or a company
+    comparison.
+    """
+    tags = [tag for tag in record if tag not in FUNDAMENTAL_FIELDS]
+    page = {field: [record[field]] * len(tags)
+            for field in FUNDAMENTAL_FIELDS[:4]}
+    page['tag'] = tags
+    # time series records hold [value], company comparisons {'value': ...}
+    page['value'] = [record[tag]['value'] if isinstance(record[tag], dict)
+                     else record[tag][0] for tag in tags]
+    return page
+
+
+def write_fundamentals(records, path, file_format='csv', chunk_size=10000):
+    """
+    Write filing records to a single file as long rows, chunk_size rows at
+    a time, so that only one chunk is held in memory however many records
+    there are.
+
+    Parameters
+    -----------
+    records : iterable
+        the filing records, e.g. the generator of
+        iter_financial_statement_time_series or
+        iter_financial_statement_company_compare
+    path : str
+        the path of the file, written as path + '.part' until every record
+        is written
+    file_format : str (optional, default = 'csv')
+        'csv' or 'parquet'
+    chunk_size : int (optional, default = 10000)
+        the number of rows written at once (a Parquet row group)
+
+    Returns
+    -----------
+    int
+        the number of rows written. If a record fails, the unfinished file
+        is deleted and the error is raised
+
+    Example
+    -----------
+    >>> write_fundamentals(iter_financial_statement_company_compare(
+    api_key, universe, 'income_statement', '2019', 'Q1'), 'funda.csv')
+    """
+    if file_format not in WRITERS:
+        raise ValueError("Invalid Input: file_format must be 'csv' or "
+                         "'parquet'")
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    writer = WRITERS[file_format](path, FUNDAMENTAL_FIELDS,
+                                  FUNDAMENTAL_TYPES)
+    chunk = {field: [] for field in FUNDAMENTAL_FIELDS}
+    try:
+        for record in records:
+            for field, values in fundamental_page(record).items():
+                chunk[field].extend(values)
+            if len(chunk['tag']) >= chunk_size:
+                writer.write(chunk)
+                chunk = {field: [] for field in FUNDAMENTAL_FIELDS}
+        if chunk['tag']:
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+
+def _produce(pages, ticker, buffer, stop):
+    """
+    Put the pages of a ticker on the buffer, then its end (with the error
+    that stopped it, if any)
+    """
+    error = None
+    try:
+        for page in pages(ticker):
+            if stop.is_set():
+                return
+            buffer.put(('page', ticker, page))
+    except BaseException as e:
+        error = e
+    buffer.put(('end', ticker, error))
+
+
+def stream_to_files(tickers, pages, folder, fields, file_format='csv',
+                    types=None, max_workers=10, buffer=16, on_done=None):
+    """
+    Fetch the pages of every ticker with max_workers threads and write each
+    ticker to its own file in folder as the pages arrive, holding at most
+    buffer pages in memory.
+
+    Parameters
+    -----------
+    tickers : list
+        the tickers to export
+    pages : callable
+        pages(ticker) returns an iterator over the pages of a ticker, each a
+        dictionary of columns with at least the fields
+    folder : str
+        the folder of the files, created if needed
+    fields : list
+        the columns written, in order
+    file_format : str (optional, default = 'csv')
+        'csv' or 'parquet'
+    types : dict (optional)
+        the Parquet types of the columns, see ParquetWriter
+    max_workers : int (optional, default = 10)
+        the number of tickers fetched at the same time
+    buffer : int (optional, default = 16)
+        the number of pages waiting to be written at most
+    on_done : callable (optional)
+        called with the ticker, its file and its rows when a file is
+        complete
+
+    Returns
+    -----------
+    dict
+        the rows written per ticker ('rows') and the error message of every
+        ticker that failed ('failed'), whose file is deleted
+
+    Example
+    -----------
+    >>> stream_to_files(['AAPL', 'CSCO'], lambda ticker:
+    iter_stock_time_series(api_key, ticker), 'prices', PRICE_FIELDS)
+    """
+    if file_format not in WRITERS:
+        raise ValueError("Invalid Input: file_format must be 'csv' or "
+                         "'parquet'")
+    os.makedirs(folder, exist_ok=True)
+    tickers = list(dict.fromkeys(tickers))
+    pending = queue.Queue(maxsize=max(1, buffer))
+    stop = threading.Event()
+    writers = {}
+    summary = {'rows': {}, 'failed': {}}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [pool.submit(_produce, pages, ticker, pending, stop)
+                   for ticker in tickers]
+        try:
+            remaining = len(tickers)
+            while remaining:
+                kind, ticker, item = pending.get()
+                writer = writers.get(ticker)
+                if kind == 'page':
+                    if writer is None:
+                        writer = writers[ticker] = WRITERS[file_format](
+                            export_path(folder, ticker, file_format), fields,
+                            types)
+                    writer.write(item)
+                    continue
+                remaining -= 1
+                if item is not None:
+                    summary['failed'][ticker] = str(item) or repr(item)
+                    if writer is not None:
+                        writers.pop(ticker).abort()
+                    continue
+                if writer is None:
+                    # a ticker without pages still gets its (empty) file
+                    writer = WRITERS[file_format](
+                        export_path(folder, ticker, file_format), fields,
+                        types)
+                writers.pop(ticker, None)
+                writer.close()
+                summary['rows'][ticker] = writer.rows
+                if on_done is not None:
+                    on_done(ticker, writer.path, writer.rows)
+        finally:
+            # after an error or an interruption (Ctrl-C), stop the fetching
+            # threads, emptying the buffer for those waiting on it, and
+            # delete the unfinished files
+            stop.set()
+            for future in futures:
+                future.cancel()
+            while not all(future.done() for future in futures):
+                try:
+                    pending.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            for writer in writers.values():
+                writer.abort()
+    return summary
@@ -0,0 +1,384 @@
+# Author: Team Andrey Markov
+# pyntrinio resumable bulk jobs
+
+# A bulk job splits a backfill into units, one request (or a few) each:
+#   ('financial_statement', ticker, statement, year, period)
+#   ('stock_returns', ticker, buy_date, sell_date)
+#   ('stock_prices', ticker, start_date, end_date)
+# and runs them on a pool of threads. Every unit that completes is appended
+# to a checkpoint manifest, a JSON lines file flushed to disk line by line,
+# with its result: the filing record, the returns row, or the number of
+# stock prices saved to the price store (the prices themselves are kept in
+# the store, see pyntrinio.store). A unit that fails is reported and left
+# out of the manifest, so running the same job again after a failure, a
+# crash, a rate limit stall or Ctrl-C only requests the units that are
+# missing and rebuilds the output from the manifest.
+
+# Imports
+import contextlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date
+
+from pyntrinio.metrics import metered_source
+from pyntrinio.pyntrinio import (
+    _check_financial_statement_time_series, _check_stock_returns,
+    _check_stock_time_series, _default_source, _financial_statement_output,
+    _financial_statement_record, _fundamentals_source, _known_key,
+    _reported_financials_key, _returns_output, _returns_responses,
+    _returns_row, _sync_stock_prices)
+from pyntrinio.store import price_store
+
+_INVALID_KEY = "Invalid API Key: please input a valid API key as a string"
+
+
+class CheckpointManifest:
+    """
+    The completed units of a bulk job and their results, kept in a JSON
+    lines file. Every record is written and flushed as soon as its unit
+    completes; a line cut short by a crash is ignored when the file is read
+    back.
+
+    Parameters
+    -----------
+    path : str
+        the path of the manifest, created if needed
+
+    Example
+    -----------
+    >>> manifest = CheckpointManifest('backfill.jsonl')
+    >>> manifest.record(('stock_prices', 'AAPL', '', ''), 2520)
+    >>> manifest.done(('stock_prices', 'AAPL', '', ''))
+    True
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._results = {}
+        complete = True
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    complete = line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._results[tuple(entry['unit'])] = entry['result']
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(path, 'a')
+        if not complete:
+            # end the line cut short so that the next record starts anew
+            self._file.write('\n')
+
+    def done(self, unit):
+        """Return whether a unit is recorded as completed."""
+        with self._lock:
+            return tuple(unit) in self._results
+
+    def result(self, unit, default=None):
+        """Return the result recorded for a unit."""
+        with self._lock:
+            return self._results.get(tuple(unit), default)
+
+    def record(self, unit, result=None):
+        """Record that a unit completed with a (JSON serializable) result."""
+        line = json.dumps({'unit': list(unit), 'result': result})
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._results[tuple(unit)] = result
+
+    def units(self):
+        """Return the completed units."""
+        with self._lock:
+            return list(self._results)
+
+    def close(self):
+        """Close the manifest file."""
+        self._file.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextlib.contextmanager
+def checkpoint_manifest(manifest):
+    """
+    Open the CheckpointManifest named by the manifest argument of the
+    backfill functions: a CheckpointManifest is used as is, a string is the
+    path of one, opened for the block and closed after it.
+    """
+    if isinstance(manifest, CheckpointManifest):
+        yield manifest
+        return
+    with CheckpointManifest(manifest) as opened:
+        yield opened
+
+
+def run_units(units, fetch, manifest, max_workers=10):
+    """
+    Run fetch on every unit missing from manifest with max_workers threads
+    and record each one in the manifest as soon as it completes.
+
+    Parameters
+    -----------
+    units : list
+        the units of the job, tuples of strings
+    fetch : callable
+        fetch(unit) returns the (JSON serializable) result of a unit, or
+        raises an exception if it failed
+    manifest : CheckpointManifest
+        the manifest of the job
+    max_workers : int (optional, default = 10)
+        the number of units run at the same time
+
+    Returns
+    -----------
+    dict
+        the error message of every unit that failed. On an interruption
+        (KeyboardInterrupt) the units not started are cancelled, the ones
+        running are recorded when they complete and the interruption is
+        raised again
+
+    Example
+    -----------
+    >>> failed = run_units([('stock_prices', 'AAPL', '', '')], fetch,
+    CheckpointManifest('backfill.jsonl'))
+    """
+    todo = [unit for unit in dict.fromkeys(tuple(u) for u in units)
+            if not manifest.done(unit)]
+    failed = {}
+
+    def run(unit):
+        manifest.record(unit, fetch(unit))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(run, unit): unit for unit in todo}
+        try:
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED)
+                for future in finished:
+                    error = future.exception()
+                    if error is None:
+                        continue
+                    if not isinstance(error, Exception):
+                        # an interruption raised by a unit stops the job
+                        raise error
+                    failed[futures[future]] = str(error) or repr(error)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return failed
+
+
+def _check_tickers(ticker):
+    """Return the tickers of a backfill as a list without duplicates."""
+    if isinstance(ticker, str):
+        ticker = [ticker]
+    if not isinstance(ticker, list) or not ticker or \
+            any(not isinstance(t, str) for t in ticker):
+        raise TypeError(
+            "Invalid data format: ticker must be a string or a list of "
+            "strings")
+    return list(dict.fromkeys(ticker))
+
+
+def _checked_key(api_key, source, fetch):
+    """
+    Wrap fetch so that once api_key is known not to work the remaining
+    units fail without a request
+    """
+    def checked(unit):
+        if _known_key(api_key, source) is False:
+            raise ValueError(_INVALID_KEY)
+        return fetch(unit)
+    return checked
+
+
+def backfill_financial_statements(api_key, ticker, statement, year, period,
+                                  manifest, output_format='pddf',
+                                  source=None, cache=None, max_workers=10):
+    """
+    Resumable version of gather_financial_statement_time_series for a list
+    of tickers: every (ticker, statement, year, period) filing is recorded
+    in the manifest as soon as it is read, and the filings already recorded
+    are not requested again.
+
+    Parameters
+    -----------
+    api_key, statement, year, period, output_format, source, cache
+        see pyntrinio.pyntrinio.gather_financial_statement_time_series
+    ticker : str or list
+        the ticker symbol(s) to backfill
+    manifest : str or CheckpointManifest
+        the checkpoint manifest of the job, or its path
+    max_workers : int (optional, default = 10)
+        the number of filings requested at the same time
+
+    Returns
+    -----------
+    tuple
+        the filings of every completed unit, in (ticker, year, period)
+        order, in the specified output format, and the error message of
+        every unit that failed (a dictionary keyed by unit, empty if the
+        backfill is complete)
+
+    Example
+    -----------
+    >>> filings, failed = backfill_financial_statements(api_key,
+    ['AAPL', 'CSCO'], 'income_statement', ['2018', '2019'],
+    ['Q1', 'Q2', 'Q3', 'Q4'], 'fundamentals.jsonl')
+    """
+    ticker = _check_tickers(ticker)
+    for comp in ticker:
+        _check_financial_statement_time_series(
+            api_key, comp, statement, year, period, output_format)
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
+    filings = metered_source(filings, 'backfill_financial_statements')
+
+    def fetch(unit):
+        _, comp, statement, i, j = unit
+        return _financial_statement_record(
+            comp, statement, i, j, filings.get_fundamental_reported_financials(
+                _reported_financials_key(comp, statement, i, j)))
+
+    units = [('financial_statement', comp, statement, i, j)
+             for comp in ticker for i in year for j in period]
+    with checkpoint_manifest(manifest) as manifest:
+        failed = run_units(units, _checked_key(api_key, source, fetch),
+                           manifest, max_workers)
+        results = [manifest.result(unit) for unit in units
+                   if manifest.done(unit)]
+    return _financial_statement_output(results, output_format), failed
+
+
+def backfill_stock_returns(api_key, ticker, buy_date, sell_date, manifest,
+                           source=None, max_workers=10, calendar=None):
+    """
+    Resumable version of gather_stock_returns: the returns row of every
+    (ticker, buy_date, sell_date) is recorded in the manifest as soon as it
+    is priced, and the rows already recorded are not requested again.
+
+    Parameters
+    -----------
+    api_key, ticker, buy_date, sell_date, source, calendar
+        see pyntrinio.pyntrinio.gather_stock_returns
+    manifest : str or CheckpointManifest
+        the checkpoint manifest of the job, or its path
+    max_workers : int (optional, default = 10)
+        the number of tickers requested at the same time
+
+    Returns
+    -----------
+    tuple
+        the dataframe of gather_stock_returns for the completed tickers,
+        and the error message of every unit that failed
+
+    Example
+    -----------
+    >>> returns, failed = backfill_stock_returns(api_key, ['AAPL', 'CSCO'],
+    "2017-12-31", "2019-03-01", 'returns.jsonl')
+    """
+    tickers, buy, sell = _check_stock_returns(ticker, buy_date, sell_date)
+    if source is None:
+        source = _default_source(api_key, max_workers)
+    metered = metered_source(source, 'backfill_stock_returns')
+
+    def fetch(unit):
+        return _returns_row(unit[1], _returns_responses(
+            metered, unit[1], buy, sell, calendar))
+
+    units = [('stock_returns', comp, buy.isoformat(), sell.isoformat())
+             for comp in tickers]
+    with checkpoint_manifest(manifest) as manifest:
+        failed = run_units(units, _checked_key(api_key, source, fetch),
+                           manifest, max_workers)
+        rows = [manifest.result(unit) for unit in units
+                if manifest.done(unit)]
+    return _returns_output(rows), failed
+
+
+def backfill_stock_prices(api_key, ticker, manifest, start_date=None,
+                          end_date=None, store=True, source=None,
+                          max_workers=10, overlap=5):
+    """
+    Resumable sync of the stock prices of many tickers into a price store:
+    every (ticker, start_date, end_date) is recorded in the manifest once
+    its prices are saved, and the tickers already recorded are not synced
+    again. Without end_date a ticker is recorded for the day it is synced,
+    so running the backfill again on a later day syncs the newer prices.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    ticker : str or list
+        the ticker symbol(s) to backfill
+    manifest : str or CheckpointManifest
+        the checkpoint manifest of the job, or its path
+    start_date, end_date : str (optional)
+        the dates in the format of "%Y-%m-%d", see gather_stock_time_series
+    store : PriceStore or bool (optional, default = True)
+        the store the prices are saved to, True for the default store, see
+        pyntrinio.store and pyntrinio.columnar
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+    max_workers : int (optional, default = 10)
+        the number of tickers requested at the same time
+    overlap : int (optional, default = 5)
+        see pyntrinio.store.PriceStore.missing
+
+    Returns
+    -----------
+    tuple
+        the number of stored prices of every completed ticker between the
+        dates, and the error message of every unit that failed
+
+    Example
+    -----------
+    >>> rows, failed = backfill_stock_prices(api_key, tickers,
+    'prices.jsonl', start_date="2010-01-01")
+    >>> gather_stock_time_series(api_key, 'AAPL', "2010-01-01", store=True)
+    """
+    tickers = _check_tickers(ticker)
+    start, end = _check_stock_time_series(tickers[0], start_date, end_date)
+    store = price_store(store)
+    if store is None:
+        raise ValueError("Invalid Input: backfill_stock_prices needs a store")
+    if source is None:
+        source = _default_source(api_key, max_workers)
+    metered = metered_source(source, 'backfill_stock_prices')
+
+    def fetch(unit):
+        _sync_stock_prices(store, metered, unit[1], start, end, overlap)
+        return len(store.get(unit[1], start, end))
+
+    # a sync without end_date is keyed on the day it runs: it is done for
+    # the day, and a run on a later day syncs the newer prices
+    units = [('stock_prices', comp, start_date or '',
+              end_date or date.today().isoformat()) for comp in tickers]
+    with checkpoint_manifest(manifest) as manifest:
+        failed = run_units(units, _checked_key(api_key, source, fetch),
+                           manifest, max_workers)
+        rows = {unit[1]: manifest.result(unit) for unit in units
+                if manifest.done(unit)}
+    return rows, failed
@@ -0,0 +1,78 @@
+# Author: Team Andrey Markov
+# pyntrinio API key checks
+
+# The functions used to spend a request checking the API key before doing
+# any work. Keys are now checked lazily: every response of the live API
+# (IntrinioSource) tells whether its key works, an HTTP 401 or 403 meaning it
+# does not, and the outcome is remembered for KEY_TTL seconds per key and
+# process, so later calls neither repeat the check nor wait for it.
+
+# Imports
+import threading
+import time
+
+# seconds a key check is remembered for, see set_key_ttl()
+KEY_TTL = 3600.0
+
+# HTTP statuses the Intrinio API answers an unusable key with
+INVALID_KEY_STATUSES = (401, 403)
+
+_checked = {}
+_checked_lock = threading.Lock()
+
+
+def set_key_ttl(seconds):
+    """
+    Set the number of seconds key checks are remembered for. 0 disables
+    the memo and forgets the keys checked so far.
+    """
+    global KEY_TTL
+    KEY_TTL = float(seconds)
+    if not KEY_TTL:
+        forget_keys()
+
+
+def forget_keys():
+    """Forget every key checked so far."""
+    with _checked_lock:
+        _checked.clear()
+
+
+def known_key(api_key):
+    """
+    Return True if api_key was found to work with the live API less than
+    KEY_TTL seconds ago, False if it was found not to and None if it is not
+    known.
+    """
+    with _checked_lock:
+        valid, expires = _checked.get(api_key, (None, 0.0))
+    if time.monotonic() >= expires:
+        return None
+    return valid
+
+
+def invalid_key_error(error):
+    """
+    Return True if error (raised by a request) says that the API key is not
+    accepted by the API.
+    """
+    return getattr(error, 'status', None) in INVALID_KEY_STATUSES
+
+
+def remember_key(api_key, error=None):
+    """
+    Remember the outcome of a request made to the live API with api_key:
+    the key works if the request succeeded (error is None) and does not if
+    it failed with invalid_key_error(). Other errors say nothing about the
+    key and are not remembered.
+    """
+    if not KEY_TTL:
+        return
+    if error is None:
+        valid = True
+    elif invalid_key_error(error):
+        valid = False
+    else:
+        return
+    with _checked_lock:
+        _checked[api_key] = (valid, time.monotonic() + KEY_TTL)
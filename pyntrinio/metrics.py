@@ -0,0 +1,429 @@
+# Author: Team Andrey Markov
+# pyntrinio instrumentation of the API calls
+
+# Every call the gather_* functions (and their async versions) make to their
+# data source can be reported to hooks: callables registered with add_hook()
+# that receive one CallRecord per call, with the function and endpoint, the
+# request key, the latency, the retries of the rate limiter, the size of the
+# HTTP payload (live API only), the rows returned and whether the filing
+# cache answered. Without hooks the sources are used as is, so the
+# instrumentation costs nothing unless it is enabled.
+#
+# MetricsRegistry is a hook that aggregates the records per function and
+# endpoint and exports them in the Prometheus text format, and
+# profile_call() runs a single call under cProfile and tracemalloc.
+
+# Imports
+import contextvars
+import threading
+import time
+import warnings
+from collections import defaultdict
+
+_hooks = []
+_hooks_lock = threading.Lock()
+
+# the record of the call in progress in the current thread or task, so that
+# the layers below the source (rate limiter, filing cache, HTTP client) can
+# add to it
+_current = contextvars.ContextVar('pyntrinio_call', default=None)
+
+# upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+
+
+class CallRecord:
+    """
+    One call made to a data source.
+
+    Attributes
+    -----------
+    function : str
+        the gather_* (or agather_*) function that made the call
+    endpoint : str
+        'get_fundamental_reported_financials' or 'get_security_stock_prices'
+    key : str
+        the reported financials key, or the ticker of the stock prices
+    latency : float
+        seconds the call took
+    retries : int
+        the times the request was retried by the rate limiter
+    payload_size : int
+        bytes of the HTTP response bodies, None when the source does not
+        go through HTTP
+    rows : int
+        the facts or stock prices returned, None if the call failed
+    cache : str
+        'hit' or 'miss' when the filing cache was consulted, None otherwise
+    error : Exception
+        the exception the call raised, None if it succeeded
+    """
+
+    __slots__ = ('function', 'endpoint', 'key', 'latency', 'retries',
+                 'payload_size', 'rows', 'cache', 'error')
+
+    def __init__(self, function, endpoint, key):
+        self.function = function
+        self.endpoint = endpoint
+        self.key = key
+        self.latency = 0.0
+        self.retries = 0
+        self.payload_size = None
+        self.rows = None
+        self.cache = None
+        self.error = None
+
+    def as_dict(self):
+        """Return the record as a dictionary."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return 'CallRecord(' + ', '.join(
+            name + '=' + repr(getattr(self, name))
+            for name in self.__slots__) + ')'
+
+
+def add_hook(hook):
+    """
+    Register a callable that receives the CallRecord of every call made by
+    the gather_* functions from now on.
+    """
+    with _hooks_lock:
+        _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    """Unregister a hook registered with add_hook()."""
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def _emit(record):
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            # a failing hook must not break the data it observes
+            warnings.warn('pyntrinio metrics hook failed: ' + repr(e))
+
+
+def note_retry():
+    """Count a retry of the call in progress, see pyntrinio.ratelimit."""
+    record = _current.get()
+    if record is not None:
+        record.retries += 1
+
+
+def note_cache(hit):
+    """Record whether the filing cache answered the call in progress."""
+    record = _current.get()
+    if record is not None:
+        record.cache = 'hit' if hit else 'miss'
+
+
+def note_payload(size):
+    """Add the bytes of an HTTP response body to the call in progress."""
+    record = _current.get()
+    if record is not None:
+        record.payload_size = (record.payload_size or 0) + size
+
+
+def _rows(response):
+    """Return the number of facts or stock prices in a response."""
+    rows = getattr(response, 'stock_prices', None)
+    if rows is None:
+        rows = getattr(response, 'reported_financials', None)
+    return None if rows is None else len(rows)
+
+
+class MeteredSource:
+    """
+    Data source that reports every call to another source to the hooks,
+    as made by function. Built by metered_source().
+    """
+
+    def __init__(self, source, function):
+        self.source = source
+        self.function = function
+
+    def _start(self, endpoint, key):
+        record = CallRecord(self.function, endpoint, key)
+        return record, _current.set(record), time.perf_counter()
+
+    def _finish(self, record, token, start, response=None, error=None):
+        record.latency = time.perf_counter() - start
+        _current.reset(token)
+        if error is None:
+            record.rows = _rows(response)
+        record.error = error
+        _emit(record)
+
+    def _call(self, endpoint, key, *args, **kwargs):
+        record, token, start = self._start(endpoint, key)
+        try:
+            response = getattr(self.source, endpoint)(*args, **kwargs)
+        except Exception as e:
+            self._finish(record, token, start, error=e)
+            raise
+        self._finish(record, token, start, response)
+        return response
+
+    async def _acall(self, endpoint, key, *args, **kwargs):
+        # imported here since pyntrinio.sources reports to this module
+        from pyntrinio.sources import _acall
+        record, token, start = self._start(endpoint, key)
+        try:
+            response = await _acall(self.source, endpoint, *args, **kwargs)
+        except Exception as e:
+            self._finish(record, token, start, error=e)
+            raise
+        self._finish(record, token, start, response)
+        return response
+
+    def get_fundamental_reported_financials(self, key):
+        return self._call('get_fundamental_reported_financials', key, key)
+
+    async def aget_fundamental_reported_financials(self, key):
+        return await self._acall('get_fundamental_reported_financials', key,
+                                 key)
+
+    def get_security_stock_prices(self, identifier, *args, **kwargs):
+        return self._call('get_security_stock_prices', identifier,
+                          identifier, *args, **kwargs)
+
+    async def aget_security_stock_prices(self, identifier, *args, **kwargs):
+        return await self._acall('get_security_stock_prices', identifier,
+                                 identifier, *args, **kwargs)
+
+
+def metered_source(source, function):
+    """
+    Return source wrapped in a MeteredSource reporting its calls as made by
+    function, or source itself when no hook is registered.
+    """
+    if not _hooks:
+        return source
+    return MeteredSource(source, function)
+
+
+class MetricsRegistry:
+    """
+    Hook that aggregates the CallRecords per function and endpoint: calls,
+    errors, retries, rows, payload bytes, cache hits and misses, and a
+    latency histogram.
+
+    Example
+    -----------
+    >>> registry = enable_metrics()
+    >>> gather_stock_time_series(api_key, 'AAPL')
+    >>> print(registry.to_prometheus())
+    """
+
+    _COUNTERS = ['calls', 'errors', 'retries', 'rows', 'payload_bytes',
+                 'cache_hits', 'cache_misses']
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = defaultdict(self._new_series)
+
+    def _new_series(self):
+        series = dict.fromkeys(self._COUNTERS, 0)
+        series['latency_sum'] = 0.0
+        series['latency_buckets'] = [0] * len(self.buckets)
+        return series
+
+    def __call__(self, record):
+        with self._lock:
+            series = self._series[(record.function, record.endpoint)]
+            series['calls'] += 1
+            series['errors'] += record.error is not None
+            series['retries'] += record.retries
+            series['rows'] += record.rows or 0
+            series['payload_bytes'] += record.payload_size or 0
+            series['cache_hits'] += record.cache == 'hit'
+            series['cache_misses'] += record.cache == 'miss'
+            series['latency_sum'] += record.latency
+            for k, bound in enumerate(self.buckets):
+                if record.latency <= bound:
+                    series['latency_buckets'][k] += 1
+
+    def snapshot(self):
+        """
+        Return the aggregated metrics, keyed by (function, endpoint).
+        """
+        with self._lock:
+            return {key: dict(series, latency_buckets=list(
+                series['latency_buckets']))
+                for key, series in self._series.items()}
+
+    def reset(self):
+        """Forget the metrics aggregated so far."""
+        with self._lock:
+            self._series.clear()
+
+    def to_prometheus(self, prefix='pyntrinio'):
+        """
+        Return the metrics in the Prometheus text exposition format.
+        """
+        series = self.snapshot()
+        helps = {
+            'calls': 'API calls made by the gather functions',
+            'errors': 'API calls that raised an error',
+            'retries': 'retries of throttled or failed requests',
+            'rows': 'facts or stock prices returned',
+            'payload_bytes': 'bytes of the HTTP response bodies',
+            'cache_hits': 'filings answered by the filing cache',
+            'cache_misses': 'filings missing from the filing cache',
+        }
+        lines = []
+        for counter in self._COUNTERS:
+            name = prefix + '_' + counter + '_total'
+            lines.append('# HELP ' + name + ' ' + helps[counter])
+            lines.append('# TYPE ' + name + ' counter')
+            for (function, endpoint), values in sorted(series.items()):
+                lines.append(name + _labels(function, endpoint) + ' ' +
+                             str(values[counter]))
+        name = prefix + '_latency_seconds'
+        lines.append('# HELP ' + name + ' latency of the API calls')
+        lines.append('# TYPE ' + name + ' histogram')
+        for (function, endpoint), values in sorted(series.items()):
+            for bound, count in zip(self.buckets + ('+Inf',),
+                                    values['latency_buckets'] +
+                                    [values['calls']]):
+                lines.append(name + '_bucket' + _labels(
+                    function, endpoint, le=str(bound)) + ' ' + str(count))
+            lines.append(name + '_sum' + _labels(function, endpoint) + ' ' +
+                         repr(values['latency_sum']))
+            lines.append(name + '_count' + _labels(function, endpoint) +
+                         ' ' + str(values['calls']))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(function, endpoint, **extra):
+    labels = [('function', function), ('endpoint', endpoint)] + \
+        sorted(extra.items())
+    return '{' + ','.join(k + '="' + str(v).replace('\\', '\\\\').replace(
+        '"', '\\"') + '"' for k, v in labels) + '}'
+
+
+_registry = None
+
+
+def enable_metrics():
+    """
+    Register the process wide MetricsRegistry as a hook (once) and return
+    it.
+    """
+    global _registry
+    with _hooks_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        if _registry not in _hooks:
+            _hooks.append(_registry)
+    return _registry
+
+
+def disable_metrics():
+    """Unregister the process wide MetricsRegistry."""
+    if _registry is not None:
+        remove_hook(_registry)
+
+
+def profile_call(func, *args, cpu=True, memory=True, top=20, **kwargs):
+    """
+    Call func(*args, **kwargs) once under cProfile and tracemalloc, and
+    return its result along with a report of where the time and memory
+    went and of the API calls it made. The CPU profile covers the calling
+    thread and the threads started during the call, such as the thread
+    pools of the gather functions that make the requests and parse the
+    responses. Threads started before the call (e.g. the default executor
+    of a running event loop) are only profiled from Python 3.12, where
+    cProfile sees every thread.
+
+    Parameters
+    -----------
+    func : callable
+        the function to profile, e.g. gather_stock_time_series
+    cpu : bool (optional, default = True)
+        if True, profile the call with cProfile
+    memory : bool (optional, default = True)
+        if True, trace the allocations of the call with tracemalloc
+    top : int (optional, default = 20)
+        the number of functions and allocation sites in the report
+
+    Returns
+    -----------
+    tuple
+        the result of the call and a dictionary with the wall time
+        ('wall_s'), the cProfile statistics sorted by cumulative time
+        ('profile'), the peak traced memory in MB ('peak_mb'), the top
+        allocation sites ('allocations') and the CallRecords ('calls')
+
+    Example
+    -----------
+    >>> result, report = profile_call(gather_stock_returns, api_key,
+    ['AAPL', 'CSCO'], "2017-12-31", "2019-03-01")
+    >>> print(report['profile'])
+    """
+    # imported here to keep them out of the import of pyntrinio
+    import cProfile
+    import io
+    import pstats
+    import sys
+    import tracemalloc
+
+    calls = []
+    hook = add_hook(calls.append)
+    profiler = cProfile.Profile() if cpu else None
+    # before Python 3.12 a profiler only sees the thread that enabled it, so
+    # every thread started during the call gets a profiler of its own
+    profilers = [profiler]
+    per_thread = profiler is not None and sys.version_info < (3, 12)
+
+    def profile_thread(*event):
+        thread_profiler = cProfile.Profile()
+        profilers.append(thread_profiler)
+        thread_profiler.enable()
+
+    if per_thread:
+        threading.setprofile(profile_thread)
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if per_thread:
+                threading.setprofile(None)
+        report = {'wall_s': time.perf_counter() - start, 'calls': calls,
+                  'profile': None, 'peak_mb': None, 'allocations': None}
+        if memory:
+            snapshot = tracemalloc.take_snapshot()
+            report['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            report['allocations'] = [
+                str(stat) for stat in
+                snapshot.statistics('lineno')[:top]]
+    finally:
+        if tracing:
+            tracemalloc.stop()
+        remove_hook(hook)
+    if profiler is not None:
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        for thread_profiler in profilers[1:]:
+            thread_profiler.create_stats()
+            if thread_profiler.stats:
+                stats.add(thread_profiler)
+        stats.sort_stats('cumulative').print_stats(top)
+        report['profile'] = out.getvalue()
+    return result, report
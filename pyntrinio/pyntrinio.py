@@ -2,46 +2,120 @@
 # pyntrinio functions
 
 # Imports
-import pandas as pd
-import intrinio_sdk
+# numpy, pandas (and the modules built on them, pyntrinio.columnar and
+# pyntrinio.calendars) are imported by the functions that need them, so that
+# importing pyntrinio and asking for output_format='dict' stays fast
+import collections
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from pyntrinio.cache import cached_source
+from pyntrinio.keys import invalid_key_error, known_key
+from pyntrinio.metrics import metered_source
+from pyntrinio.sources import IntrinioSource
+from pyntrinio.store import price_store
 
-# Function that gathers a given financial statement
-# for a given company for a specified time
 
+# the largest page_size the stock prices endpoint accepts
+_MAX_PAGE_SIZE = 10000
 
-def gather_financial_statement_time_series(
-        api_key, ticker, statement, year, period, output_format='pddf'):
+# the number of sessions gather_stock_returns first requests around each
+# date of a long holding period
+_RETURNS_SESSIONS = 10
+
+# the message of gather_stock_returns for a ticker that has no prices
+# between the dates, followed by the ticker
+_NO_PRICES = "Invalid ticker: no stock prices found for "
+
+
+def _fetch_all(fetch, keys, max_workers=1):
     """
-    Given the tickers, statement, year and period returns the complete
-    financial information from the Intrinio API stock data
-    Parameters
-    -----------
-    api_key : str
-      API key (sandbox or production) from Intrinio
-    ticker : str
-      the ticker symbol you would like to get information for
-    statement : str
-      the statement that you want to study
-      options: 'income_statement', 'cash_flow_statement',
-      'balance_sheet_statement'
-    year : list
-      the list containing the years as strings
-    period : list
-      the list of quarters (as strings) for which you want information
-    output_format : str (optional, default = 'pddf')
-      the output format for the data, options are 'dict' for dictionary
-      or 'pddf' for pandas dataframe
-    Returns
-    -----------
-    object of type output_format
-      information about the given statement for the given ticker
-      at the given times in the specified output format
-    Example
-    -----------
-    >>> gather_financial_statement_time_series(api_key, ticker='AAPL',
-    statement='income_statement', year=['2018', '2019'],
-    period=['Q1'], output_format='dict')
+    Call fetch on every key and return the results in the order of keys.
+    With max_workers > 1 the calls are spread over a thread pool of that
+    size. The first exception raised by fetch is propagated.
+    """
+    if max_workers is None or max_workers <= 1 or len(keys) <= 1:
+        return [fetch(key) for key in keys]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        return list(pool.map(fetch, keys))
+
+
+def _iter_fetch(fetch, keys, max_workers=1):
+    """
+    Yield fetch(key) for every key, in the order of keys, as the results
+    arrive. With max_workers > 1 up to max_workers calls run ahead on a
+    thread pool, so at most that many results are held in memory at once.
+    The first exception raised by fetch is propagated, and closing the
+    generator cancels the calls not started.
+    """
+    if max_workers is None or max_workers <= 1:
+        for key in keys:
+            yield fetch(key)
+        return
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        window = collections.deque(
+            pool.submit(fetch, key)
+            for key in itertools.islice(keys, max_workers))
+        try:
+            while window:
+                result = window.popleft().result()
+                # keep the window full while the caller handles the result
+                for key in itertools.islice(keys, 1):
+                    window.append(pool.submit(fetch, key))
+                yield result
+        finally:
+            for future in window:
+                future.cancel()
+
+
+def _default_source(api_key, max_connections=None):
+    """
+    Return the source used when the caller gives none: the PyntrinioClient
+    shared by every call made with api_key, see pyntrinio.client.get_client
+    """
+    # imported here since pyntrinio.client wraps the functions of this module
+    from pyntrinio.client import get_client
+    return get_client(api_key, max_connections)
+
+
+def _known_key(api_key, source):
+    """
+    Return what is remembered about api_key when source is the live API
+    (see pyntrinio.keys.known_key), and None for any other source
+    """
+    if isinstance(source, IntrinioSource):
+        return known_key(api_key)
+    return None
+
+
+def _fundamentals_source(api_key, source, cache, max_connections=None):
+    """
+    Return the source of the fundamentals functions and the same source
+    behind the filing cache. With cache=None filings read from the live API
+    go through the default FilingCache, while a source given by the caller
+    is left uncached.
+    """
+    if cache is None:
+        cache = source is None
+    if source is None:
+        source = _default_source(api_key, max_connections)
+    return source, cached_source(source, cache)
+
+
+def _reported_financials_key(ticker, statement, year, period):
+    """
+    Return the Intrinio key of a filing, e.g. 'AAPL-income_statement-2019-Q1'
+    """
+    return str(ticker) + '-' + str(statement) + '-' + str(year) + '-' + \
+        str(period)
+
+
+def _check_financial_statement_time_series(api_key, ticker, statement, year,
+                                           period, output_format):
+    """
+    Validate the inputs of gather_financial_statement_time_series
     """
     # https://data.intrinio.com/data-tags
     available_statements = [
@@ -90,50 +164,736 @@ def gather_financial_statement_time_series(
             raise Exception(
                 "Invalid data format: " +
                 "year must be a string of 4 digits")
-    # Initialize API key
-    intrinio_sdk.ApiClient().configuration.api_key['api_key'] = api_key
-    fundamentals_api = intrinio_sdk.FundamentalsApi()
-    # Empty list to store results: reformat later to dataframe
-    results = []
-    # Outer loop over years, inner loop over quarters
-    for i in year:
-        for j in period:
-            # define key to obtain relevant information
-            key = str(ticker) + '-' + str(statement) + \
-                '-' + str(i) + '-' + str(j)
-            # Obtain req. object from API
-            try:
-                # put stock prices into a variable
-                funda = fundamentals_api.get_fundamental_reported_financials(
-                    key)
-            except Exception:
-                print(
-                    "Invalid API Key: please input a valid API key as a string"
-                )
-                return
-            my_fund = funda.reported_financials
-            # Empty dictionary to append the results : convert to df at the
-            # last stage
-            my_dict = {}
-            my_dict['ticker'] = ticker
-            my_dict['statement'] = statement
-            my_dict['year'] = i
-            my_dict['period'] = j
-            for n in range(0, len(my_fund)):
-                my_dict[str(my_fund[n].xbrl_tag.tag)] = []
-            # add values to the dictionary
-            for k in range(0, len(my_fund)):
-                for key, val in my_dict.items():
-                    if my_fund[k].xbrl_tag.tag == key:
-                        my_dict[key].append(my_fund[k].value)
-                        my_dict[key] = [sum(my_dict[key])]
-            results.append(my_dict)
-    final_df = pd.DataFrame(results)
+
+
+def _financial_statement_record(ticker, statement, year, period, funda):
+    """
+    Return the dictionary of one filing in a financial statement time series
+    """
+    # add up the values of every tag in a single pass over the facts (a tag
+    # can be reported more than once in a filing)
+    totals = {}
+    for fact in funda.reported_financials:
+        tag = str(fact.xbrl_tag.tag)
+        totals[tag] = totals.get(tag, 0) + fact.value
+    # Dictionary of the results : converted to df at the last stage. Every
+    # tag holds a one-element list, as it always has
+    my_dict = {'ticker': ticker, 'statement': statement, 'year': year,
+               'period': period}
+    for tag, total in totals.items():
+        my_dict[tag] = [total]
+    return my_dict
+
+
+def _financial_statement_output(results, output_format):
+    """
+    Return the filings of a financial statement time series in output_format
+    """
     # if_else for output format
     if output_format == 'pddf':
-        return final_df
+        import pandas as pd
+        return pd.DataFrame(results)
+    else:
+        return results
+
+
+def _check_financial_statements(api_key, ticker, statement, year, period,
+                                output_format):
+    """
+    Validate the inputs of gather_financial_statements and return the
+    tickers and the statements as lists without duplicates
+    """
+    tickers = [ticker] if isinstance(ticker, str) else ticker
+    if not isinstance(tickers, list) or not tickers:
+        raise TypeError("Invalid data format: ticker must be a string or a "
+                        "list of strings")
+    if not isinstance(statement, list) or not statement:
+        raise TypeError("Invalid data format: statement must be a list of "
+                        "strings")
+    tickers = list(dict.fromkeys(tickers))
+    statements = list(dict.fromkeys(statement))
+    # every ticker and statement is checked as by the time series
+    for comp in tickers:
+        for stmt in statements:
+            _check_financial_statement_time_series(
+                api_key, comp, stmt, year, period, output_format)
+    return tickers, statements
+
+
+def _financial_statements_cells(tickers, statements, year, period):
+    """
+    Return the (ticker, statement, year, period) filings of
+    gather_financial_statements, the statements of a (ticker, year, period)
+    next to each other
+    """
+    return [(comp, stmt, i, j) for comp in tickers for i in year
+            for j in period for stmt in statements]
+
+
+def _financial_statements_output(cells, fundas, output_format):
+    """
+    Join the filings of gather_financial_statements on (ticker, year,
+    period): one record per company-period whose tags are prefixed by their
+    statement, e.g. 'income_statement.netincome', and hold a number (not
+    the one-element list of the time series), in output_format
+    """
+    results = {}
+    for (comp, stmt, i, j), funda in zip(cells, fundas):
+        record = results.get((comp, i, j))
+        if record is None:
+            record = results[(comp, i, j)] = {'ticker': comp, 'year': i,
+                                              'period': j}
+        filing = _financial_statement_record(comp, stmt, i, j, funda)
+        for tag, value in filing.items():
+            if tag not in _COMPANY_FIELDS:
+                record[stmt + '.' + tag] = value[0]
+    results = list(results.values())
+    if output_format == 'pddf':
+        import pandas as pd
+        return pd.DataFrame(results)
+    return results
+
+
+def _check_company_compare_strings(api_key, statement, year, period):
+    """
+    Check that the string inputs of
+    gather_financial_statement_company_compare are strings
+    """
+    inputs = {'api_key': api_key, 'statement': statement, 'year': year,
+              'period': period}
+
+    # Check if api_key, statement, year, period are strings
+    for inst in inputs.keys():
+        if not isinstance(inputs[inst], str):
+            raise TypeError("Invalid data format: " + inst +
+                            " must be a string")
+
+
+def _check_company_compare(ticker, statement, year, output_format):
+    """
+    Validate the other inputs of gather_financial_statement_company_compare
+    """
+    statements = ['income_statement', 'balance_sheet_statement',
+                  'cash_flow_statement']
+
+    # Check if ticker is a list
+    if not isinstance(ticker, list):
+        raise TypeError("Invalid data format: ticker must be a list")
+
+    # Check if the elements in the ticker list are strings
+    for comp in ticker:
+        if not isinstance(comp, str):
+            raise TypeError(
+                'Invalid data format: ticker must be a list of strings')
+
+    # Check if the year is a 4-digits number
+    if not len(year) == 4:
+        raise Exception(
+            "Invalid data format: year must be a string of 4 digits")
+
+    # Check if the output_format is either 'dict' or 'pddf'
+    if output_format not in ['dict', 'pddf']:
+        raise Exception(
+            "Invalid data format: output_format must be 'dict' or 'pddf'"
+        )
+
+    # Check if the statement is valid
+    if statement not in statements:
+        raise Exception(
+            "Invalid data format: statement must be a valid type"
+        )
+
+
+def _company_record(comp, statement, year, period, fund):
+    """
+    Return the dictionary of one company in a company comparison
+    """
+    my_fund = fund.reported_financials
+
+    # This dictionary will contain all the information for one company
+    dict = {}
+    dict['ticker'] = comp
+    dict['statement'] = statement
+    dict['year'] = year
+    dict['period'] = period
+
+    # we store all the values, balances, names and the tags
+    for i in range(len(my_fund)):
+        value = my_fund[i].value
+        tag_dic = my_fund[i].xbrl_tag
+        balance = tag_dic.balance
+        name = tag_dic.name
+        tag = tag_dic.tag
+        # tag is a key of this dictionnary
+
+        # if the tag is several times in the original object, we keep
+        # one tag and the value is the sum or the substraction of
+        # all the values of this tag (depending on the value of balance)
+        if tag in dict.keys():
+            if balance == 'credit':
+                value = dict[tag]['value'] - value
+            else:
+                value = dict[tag]['value'] + value
+        dict[tag] = {'value': value, 'balance': balance, 'name': name}
+    return dict
+
+
+# the keys of a company record that are not tags
+_COMPANY_FIELDS = ['ticker', 'statement', 'year', 'period']
+
+
+def _company_compare_frame(result, sparse=False):
+    """
+    Return the companies of a company comparison as a dataframe: one row
+    per company, the _COMPANY_FIELDS columns and then one float column per
+    tag (in the order they first appear), NaN where a company does not
+    report the tag. The (company, tag, value) triples are collected in one
+    pass and scattered into a single (companies x tags) array. With sparse
+    the tag columns are pandas sparse columns that only store the reported
+    values
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns = {}
+    rows, cols, values = [], [], []
+    for i, record in enumerate(result):
+        for tag, fact in record.items():
+            if tag in _COMPANY_FIELDS:
+                continue
+            rows.append(i)
+            cols.append(columns.setdefault(tag, len(columns)))
+            values.append(fact['value'])
+
+    table = np.full((len(result), len(columns)), np.nan)
+    table[rows, cols] = np.asarray(values, dtype='float64')
+
+    fields = pd.DataFrame({field: [record[field] for record in result]
+                           for field in _COMPANY_FIELDS})
+    if sparse:
+        tags = pd.DataFrame({tag: pd.arrays.SparseArray(
+            table[:, j], fill_value=np.nan) for tag, j in columns.items()},
+            index=fields.index)
     else:
+        # the array becomes the single block of the tag columns
+        tags = pd.DataFrame(table, columns=list(columns), index=fields.index)
+    return pd.concat([fields, tags], axis=1)
+
+
+def _company_compare_output(result, output_format, sparse=False):
+    """
+    Return the companies of a company comparison in output_format
+    """
+    if output_format == 'dict':
+        return result
+
+    # if the wanted type of the output is a dataframe
+    return _company_compare_frame(result, sparse)
+
+
+def _check_stock_time_series(ticker, start_date, end_date, layout='long',
+                             panel=False):
+    """
+    Validate the inputs of gather_stock_time_series and return the dates as
+    date objects. A list of tickers is only valid with panel. Raises a
+    ValueError holding the message to return otherwise
+    """
+    # error messages
+    msg1 = "Invalid data format: ticker must be a string"
+    msg2 = "Invalid Date format: date must be a string in the format %Y-%m-%d"
+    msg3 = "Invalid Input: end_date must be later than start_date"
+    msg4 = "Invalid data format: ticker must be a string or a list of strings"
+    msg5 = "Invalid Input: layout must be 'long' or 'multiindex'"
+
+    # ensure the type of the ticker is a string, or a list of strings for
+    # a panel
+    if panel and isinstance(ticker, list):
+        if not ticker or any(not isinstance(t, str) for t in ticker):
+            raise ValueError(msg4)
+        if layout not in ['long', 'multiindex']:
+            raise ValueError(msg5)
+    elif not isinstance(ticker, str):
+        raise ValueError(msg1)
+
+    try:
+        # change dates to datetime objects
+        if start_date is not None:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        if end_date is not None:
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except Exception:
+        raise ValueError(msg2)
+
+    if start_date is not None and end_date is not None:
+        if start_date >= end_date:
+            raise ValueError(msg3)
+    return start_date, end_date
+
+
+def _page_size(allow_max_rows):
+    """
+    Return the number of stock prices requested per call
+    """
+    # if allow_max_rows=False
+    if allow_max_rows is False:
+        return 100
+    else:
+        return _MAX_PAGE_SIZE
+
+
+def _stock_prices_frame(stock_prices, price_dtype='float64'):
+    """
+    Return a list of stock prices as a dataframe with typed columns: a
+    datetime64 date, price_dtype prices, int64 volumes (float64 if some are
+    missing), a categorical frequency and a boolean intraperiod
+    """
+    import pandas as pd
+    from pyntrinio.columnar import _price_arrays, _price_frame
+
+    dates, values, frequency, intraperiod = _price_arrays(stock_prices)
+    return _price_frame(dates, values, pd.Categorical(frequency),
+                        intraperiod, price_dtype)
+
+
+def _concat_stock_prices(chunks, output_format):
+    """
+    Combine chunks of stock prices returned by _stock_prices_output
+    """
+    if output_format == 'pddf':
+        if not chunks:
+            return _stock_prices_frame([])
+        import pandas as pd
+        results = pd.concat(chunks, ignore_index=True)
+        results['frequency'] = results['frequency'].astype('category')
         return results
+    results = _stock_prices_output([], 'dict')
+    for chunk in chunks:
+        for key, values in chunk.items():
+            results[key].extend(values)
+    return results
+
+
+def _stock_prices_output(stock_prices, output_format, price_dtype='float64'):
+    """
+    Return a list of stock prices in output_format
+    """
+    # if the ouput format is a dataframe, build it column by column
+    if output_format == 'pddf':
+        return _stock_prices_frame(stock_prices, price_dtype)
+
+    # initialize a results dictionary
+    results = {'date': [], 'close': [], 'adj_close': [], 'high': [],
+               'adj_high': [], 'low': [], 'adj_low': [], 'open': [],
+               'adj_open': [], 'volume': [], 'adj_volume': [], 'frequency': [],
+               'intraperiod': []}
+
+    # fill in dictionary
+    for i in list(range(0, len(stock_prices), 1)):
+        results['date'].append(stock_prices[i].date)
+        results['close'].append(stock_prices[i].close)
+        results['adj_close'].append(stock_prices[i].adj_close)
+        results['high'].append(stock_prices[i].high)
+        results['adj_high'].append(stock_prices[i].adj_high)
+        results['low'].append(stock_prices[i].low)
+        results['adj_low'].append(stock_prices[i].adj_low)
+        results['open'].append(stock_prices[i].open)
+        results['adj_open'].append(stock_prices[i].adj_open)
+        results['volume'].append(stock_prices[i].volume)
+        results['adj_volume'].append(stock_prices[i].adj_volume)
+        results['frequency'].append(stock_prices[i].frequency)
+        results['intraperiod'].append(stock_prices[i].intraperiod)
+
+    return results
+
+
+def _stock_price_pages(source, ticker, start_date, end_date, page_size,
+                       prefetch=False):
+    """
+    Yield the stock prices of every page between the dates, following the
+    next_page tokens. With prefetch the next page is requested in a
+    background thread before the current one is yielded
+    """
+    fetch = functools.partial(source.get_security_stock_prices, ticker,
+                              start_date=start_date, end_date=end_date,
+                              page_size=page_size)
+    if not prefetch:
+        response = fetch()
+        yield response.stock_prices
+        while response.next_page:
+            response = fetch(next_page=response.next_page)
+            yield response.stock_prices
+        return
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(fetch)
+        while future is not None:
+            response = future.result()
+            future = None
+            if response.next_page:
+                future = pool.submit(fetch, next_page=response.next_page)
+            yield response.stock_prices
+
+
+def _sync_stock_prices(store, source, ticker, start_date, end_date,
+                       overlap):
+    """
+    Request the stock prices missing from store between the dates (see
+    pyntrinio.store.PriceStore.missing) and save them
+    """
+    windows = store.missing(ticker, start_date, end_date, overlap)
+    if windows:
+        fetched = []
+        for start, end in windows:
+            for page in _stock_price_pages(source, ticker, start, end,
+                                           _MAX_PAGE_SIZE):
+                fetched.extend(page)
+        store.save_sync(ticker, start_date, fetched)
+
+
+def _stored_stock_prices(store, ticker, start_date, end_date, output_format,
+                         price_dtype):
+    """
+    Return the stored stock prices between the dates in output_format.
+    Stores with a frame method (see pyntrinio.columnar.ColumnStore) build
+    the dataframe from their columns directly
+    """
+    if output_format == 'pddf' and hasattr(store, 'frame'):
+        return store.frame(ticker, start_date, end_date, price_dtype)
+    return _stock_prices_output(store.get(ticker, start_date, end_date),
+                                output_format, price_dtype)
+
+
+def _ticker_stock_prices(source, ticker, start_date, end_date,
+                         allow_max_rows, all_pages):
+    """
+    Return the stock prices of a ticker between the dates, newest first, as
+    gather_stock_time_series reads them without a store
+    """
+    if all_pages:
+        return list(itertools.chain.from_iterable(_stock_price_pages(
+            source, ticker, start_date, end_date,
+            _page_size(allow_max_rows))))
+    return source.get_security_stock_prices(
+        ticker, start_date=start_date, end_date=end_date,
+        page_size=_page_size(allow_max_rows)).stock_prices
+
+
+def _stock_prices_panel(tickers, stock_prices, output_format,
+                        price_dtype='float64', layout='long'):
+    """
+    Return the lists of stock prices of several tickers in output_format:
+    a dictionary with a 'ticker' key first, or a dataframe in the given
+    layout (see pyntrinio.columnar._panel_frame). The lists are stacked
+    before the columns are built, so every column is allocated once.
+    """
+    lengths = [len(prices) for prices in stock_prices]
+    rows = list(itertools.chain.from_iterable(stock_prices))
+    if output_format != 'pddf':
+        results = {'ticker': [t for t, n in zip(tickers, lengths)
+                              for _ in range(n)]}
+        results.update(_stock_prices_output(rows, output_format))
+        return results
+    import numpy as np
+    import pandas as pd
+    from pyntrinio.columnar import _panel_frame, _price_arrays
+
+    dates, values, frequency, intraperiod = _price_arrays(rows)
+    ticker_codes = np.repeat(np.arange(len(tickers), dtype='int32'), lengths)
+    return _panel_frame(dates, values, pd.Categorical(frequency),
+                        intraperiod, ticker_codes, tickers, price_dtype,
+                        layout)
+
+
+def _gather_stock_price_panel(source, store, tickers, start_date, end_date,
+                              output_format, allow_max_rows, all_pages,
+                              price_dtype, overlap, max_workers, layout):
+    """
+    Request the stock prices of every ticker (syncing store first if there
+    is one) with max_workers threads and return them as one panel, see
+    _stock_prices_panel. Failed requests raise the error of the source
+    """
+    tickers = list(dict.fromkeys(tickers))
+    if store is None:
+        stock_prices = _fetch_all(
+            lambda ticker: _ticker_stock_prices(
+                source, ticker, start_date, end_date, allow_max_rows,
+                all_pages), tickers, max_workers)
+        return _stock_prices_panel(tickers, stock_prices, output_format,
+                                   price_dtype, layout)
+    _fetch_all(lambda ticker: _sync_stock_prices(
+        store, source, ticker, start_date, end_date, overlap),
+        tickers, max_workers)
+    if output_format == 'pddf' and hasattr(store, 'panel'):
+        # newest first like the rows read from the other stores
+        return store.panel(tickers, start_date, end_date, price_dtype,
+                           layout, newest_first=True)
+    return _stock_prices_panel(
+        tickers, [store.get(t, start_date, end_date) for t in tickers],
+        output_format, price_dtype, layout)
+
+
+def _check_stock_returns(ticker, buy_date, sell_date):
+    """
+    Validate the inputs of gather_stock_returns and return the tickers as a
+    list and the dates as date objects. Raises a ValueError holding the
+    message to return otherwise
+    """
+    msg1 = "Invalid Input: sell_date must be later than buy_date"
+    msg2 = "Invalid Date format: date must be a string in the format %Y-%m-%d"
+
+    # test whether the input dates are in the right format
+    try:
+        buy_date = datetime.strptime(buy_date, '%Y-%m-%d').date()
+        sell_date = datetime.strptime(sell_date, '%Y-%m-%d').date()
+    except Exception:
+        raise ValueError(msg2)
+    if buy_date >= sell_date:
+        raise ValueError(msg1)
+
+    if isinstance(ticker, str):  # if user gives just one ticker
+        ticker = [ticker]
+    return ticker, buy_date, sell_date
+
+
+def _returns_requests(buy_date, sell_date, calendar=None,
+                      sessions=_RETURNS_SESSIONS):
+    """
+    Plan the get_security_stock_prices requests that price one ticker in
+    gather_stock_returns, as a list of (start_date, end_date, page_size).
+    A single request covers both dates whenever every row between them fits
+    in one page, otherwise the first sessions trading days from buy_date and
+    the last ones up to sell_date are requested, found in calendar (the
+    NYSE calendar by default) without a request
+    """
+    # there is at most one row per calendar day, so a span shorter than the
+    # largest page always comes back in one response
+    if (sell_date - buy_date).days < _MAX_PAGE_SIZE:
+        return [(buy_date, sell_date, _MAX_PAGE_SIZE)]
+    if calendar is None:
+        from pyntrinio.calendars import nyse_calendar
+        calendar = nyse_calendar()
+    # Dates outside of the calendar fall back to calendar days, at most one
+    # page of them
+    days = timedelta(days=min(2 * sessions, _MAX_PAGE_SIZE - 1))
+    # if buy_date is not a trading day (holiday), we'll get the nearest next
+    # trading day instead.
+    buy_date_upper = calendar.offset(buy_date, sessions - 1) or \
+        buy_date + days
+    # the same idea for sell_date, but we'll get the nearest **last** trading
+    # day instead.
+    sell_date_lower = calendar.offset(sell_date, 1 - sessions) or \
+        sell_date - days
+    windows = [(buy_date, min(buy_date_upper, sell_date)),
+               (max(sell_date_lower, buy_date), sell_date)]
+    # there is at most one row per calendar day, so the page of a window
+    # always holds all of its rows: the oldest row of the first window is
+    # the first trading day and the newest row of the last one the last
+    return [(start, end, min(_MAX_PAGE_SIZE, (end - start).days + 1))
+            for start, end in windows]
+
+
+def _returns_widen(responses, sessions):
+    """
+    Return the number of sessions to request again around the dates when a
+    window of _returns_requests came back empty (the ticker did not trade,
+    e.g. it was halted), or None when the responses are complete. A single
+    response holds every row between the dates: there is nothing to widen
+    """
+    if len(responses) == 1 or sessions >= _MAX_PAGE_SIZE or \
+            all(response.stock_prices for response in responses):
+        return None
+    return sessions * 10
+
+
+def _returns_responses(source, ticker, buy_date, sell_date, calendar=None):
+    """
+    Request the stock prices that price one ticker in gather_stock_returns
+    (see _returns_requests), widening the windows that come back empty, and
+    return the responses
+    """
+    sessions = _RETURNS_SESSIONS
+    while sessions is not None:
+        responses = [source.get_security_stock_prices(
+            ticker, start_date=start, end_date=end, page_size=page_size)
+            for start, end, page_size in _returns_requests(
+                buy_date, sell_date, calendar, sessions)]
+        sessions = _returns_widen(responses, sessions)
+    return responses
+
+
+def _returns_error(ticker, error):
+    """
+    Return the message of gather_stock_returns for a ticker that could not
+    be priced: the ticker has no prices between the dates (the ValueError of
+    _returns_row) or is not known to the API (404), or else the request
+    failed with the API key
+    """
+    if isinstance(error, ValueError) or \
+            getattr(error, 'status', None) == 404:
+        return _NO_PRICES + ticker
+    return "Invalid API Key: please input a valid API key as a string"
+
+
+def _returns_row(ticker, responses):
+    """
+    Return the row of gather_stock_returns for one ticker, given the
+    responses to its _returns_requests (rows newest first): the buy price is
+    the oldest row of the first one and the sell price the newest row of the
+    last one, skipping the responses that came back empty. Raises a
+    ValueError holding the message to return if none has a row
+    """
+    prices = [response.stock_prices for response in responses
+              if response.stock_prices]
+    if not prices:
+        raise ValueError(_NO_PRICES + ticker)
+    buy = prices[0][-1]
+    sell = prices[-1][0]
+    buy_price = buy.adj_close
+    sell_price = sell.adj_close
+    rtn = ((sell_price - buy_price) / buy_price)*100
+    rtn = round(rtn, 2)
+    return [ticker, buy.date.strftime("%Y-%m-%d"), buy_price,
+            sell.date.strftime("%Y-%m-%d"), sell_price, rtn]
+
+
+def _returns_output(rows):
+    """
+    Return the rows of gather_stock_returns as a dataframe
+    """
+    import pandas as pd
+
+    # create the result DataFrame to record and report
+    results = pd.DataFrame(columns=['Stock', 'Buy date', 'Buy price',
+                                    'Sell date', 'Sell price', 'Return (%)'],
+                           index=range(len(rows)))
+    for i, row in enumerate(rows):
+        results.iloc[i, :] = row
+    return results
+
+
+# Function that gathers a given financial statement
+# for a given company for a specified time
+
+
+def gather_financial_statement_time_series(
+        api_key, ticker, statement, year, period, output_format='pddf',
+        source=None, cache=None, max_workers=10):
+    """
+    Given the tickers, statement, year and period returns the complete
+    financial information from the Intrinio API stock data
+    Parameters
+    -----------
+    api_key : str
+      API key (sandbox or production) from Intrinio
+    ticker : str
+      the ticker symbol you would like to get information for
+    statement : str
+      the statement that you want to study
+      options: 'income_statement', 'cash_flow_statement',
+      'balance_sheet_statement'
+    year : list
+      the list containing the years as strings
+    period : list
+      the list of quarters (as strings) for which you want information
+    output_format : str (optional, default = 'pddf')
+      the output format for the data, options are 'dict' for dictionary
+      or 'pddf' for pandas dataframe
+    source : object (optional)
+      the data source to read from, see pyntrinio.sources. Defaults to the
+      live Intrinio API
+    cache : FilingCache or bool (optional)
+      the cache of reported financials to use, see pyntrinio.cache. By
+      default filings read from the live API are kept in the default cache;
+      False disables caching and True also caches a given source
+    max_workers : int (optional, default = 10)
+      the number of years and periods requested in parallel. With 1 the
+      requests are made one after another
+    Returns
+    -----------
+    object of type output_format
+      information about the given statement for the given ticker
+      at the given times in the specified output format
+    Example
+    -----------
+    >>> gather_financial_statement_time_series(api_key, ticker='AAPL',
+    statement='income_statement', year=['2018', '2019'],
+    period=['Q1'], output_format='dict')
+    """
+    _check_financial_statement_time_series(
+        api_key, ticker, statement, year, period, output_format)
+    # Initialize API key
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
+    if _known_key(api_key, source) is False:
+        print("Invalid API Key: please input a valid API key as a string")
+        return
+    filings = metered_source(filings,
+                             'gather_financial_statement_time_series')
+    # Outer loop over years, inner loop over quarters: the cells of the grid
+    # are requested in parallel and come back in this order
+    cells = [(i, j) for i in year for j in period]
+    # define the keys to obtain the relevant information
+    keys = [_reported_financials_key(ticker, statement, i, j)
+            for i, j in cells]
+    try:
+        # Obtain req. objects from API
+        fundas = _fetch_all(filings.get_fundamental_reported_financials, keys,
+                            max_workers)
+    except Exception:
+        print("Invalid API Key: please input a valid API key as a string")
+        return
+    # list of records: reformat later to dataframe
+    results = [_financial_statement_record(ticker, statement, i, j, funda)
+               for (i, j), funda in zip(cells, fundas)]
+    return _financial_statement_output(results, output_format)
+
+# Function that streams a given financial statement for a given company,
+# one filing at a time
+
+
+def iter_financial_statement_time_series(api_key, ticker, statement, year,
+                                         period, source=None, cache=None,
+                                         max_workers=10):
+    """
+    Given the ticker, statement, year and period, yield from the Intrinio
+    API the filing of every year and period, one record at a time as the
+    responses arrive. Only the filings being downloaded (at most
+    max_workers) are held in memory, however long the time series.
+
+    Parameters
+    -----------
+    api_key, ticker, statement, year, period, source, cache
+      see gather_financial_statement_time_series
+    max_workers : int (optional, default = 10)
+      the number of filings requested ahead of the one being processed.
+      With 1 the filings are requested one at a time
+    Returns
+    -----------
+    generator
+      yields the record of every filing, in the order of the 'dict' output
+      of gather_financial_statement_time_series (years, then periods). An
+      invalid API key raises a ValueError and failed requests raise the
+      error of the source
+    Example
+    -----------
+    >>> for record in iter_financial_statement_time_series(api_key, 'AAPL',
+    'income_statement', ['2018', '2019'], ['Q1', 'Q2', 'Q3', 'Q4']):
+    ...     print(record['year'], record['period'], record['netincome'])
+    """
+    _check_financial_statement_time_series(
+        api_key, ticker, statement, year, period, 'dict')
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
+    if _known_key(api_key, source) is False:
+        raise ValueError(
+            "Invalid API Key: please input a valid API key as a string")
+    filings = metered_source(filings, 'iter_financial_statement_time_series')
+    cells = [(i, j) for i in year for j in period]
+    fundas = _iter_fetch(
+        filings.get_fundamental_reported_financials,
+        [_reported_financials_key(ticker, statement, i, j) for i, j in cells],
+        max_workers)
+    return (_financial_statement_record(ticker, statement, i, j, funda)
+            for (i, j), funda in zip(cells, fundas))
 
 # Function that gathers a given statement at a specific time for different
 # companies
@@ -141,7 +901,9 @@ def gather_financial_statement_time_series(
 
 def gather_financial_statement_company_compare(api_key, ticker, statement,
                                                year, period,
-                                               output_format='dict'):
+                                               output_format='dict',
+                                               source=None, max_workers=10,
+                                               cache=None, sparse=False):
     """
     Given the tickers, statement, year and period returns all the
         information from the Intrinio API fundamental reported financials
@@ -165,6 +927,21 @@ def gather_financial_statement_company_compare(api_key, ticker, statement,
     output_format : str (optional, default = 'dict')
         the output format for the data, options are 'dict' for dictionary or
         'pddf' for pandas dataframe
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+    max_workers : int (optional, default = 10)
+        the number of companies requested in parallel. With 1 the requests
+        are made one after another
+    cache : FilingCache or bool (optional)
+        the cache of reported financials to use, see pyntrinio.cache. By
+        default filings read from the live API are kept in the default
+        cache; False disables caching and True also caches a given source
+    sparse : bool (optional, default = False)
+        with output_format='pddf', if True the tag columns are pandas sparse
+        columns that only store the values the companies report, otherwise
+        they are float columns with NaN for the tags a company does not
+        report
 
     Returns
     -----------
@@ -177,174 +954,178 @@ def gather_financial_statement_company_compare(api_key, ticker, statement,
     >>> gather_financial_statement_company_compare(api_key,
     ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1')
     """
-    statements = ['income_statement', 'balance_sheet_statement',
-                  'cash_flow_statement']
+    # Check if api_key, statement, year, period are strings
+    _check_company_compare_strings(api_key, statement, year, period)
 
-    inputs = {'api_key': api_key, 'statement': statement, 'year': year,
-              'period': period}
+    # link with the API
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
 
-    intrinio_sdk.ApiClient().configuration.api_key['api_key'] = api_key
-    fundamentals_api = intrinio_sdk.FundamentalsApi()
+    _check_company_compare(ticker, statement, year, output_format)
 
-    # Check if api_key, statement, year, period are strings
-    for inst in inputs.keys():
-        if not isinstance(inputs[inst], str):
-            raise TypeError("Invalid data format: " + inst +
-                            " must be a string")
-
-    # test if the API Key works
-    try:
-        fundamentals_api.get_fundamental_reported_financials(
-            'AAPL-income_statement-2019-Q1')
-    except Exception:
-        msg_apy = "Invalid API Key: please input a valid API key as a string"
+    # the API key is checked by the responses themselves (see pyntrinio.keys)
+    msg_apy = "Invalid API Key: please input a valid API key as a string"
+    if _known_key(api_key, source) is False:
         return msg_apy
+    filings = metered_source(filings,
+                             'gather_financial_statement_company_compare')
 
-    # Check if ticker is a list
+    # result will contain a dictionnary for each company.
+    # This dictionnary will contain all the information for one company
+    result = []
 
-    if not isinstance(ticker, list):
-        raise TypeError("Invalid data format: ticker must be a list")
+    # keys are the appropriate keys to select the information we want
+    keys = [_reported_financials_key(comp, statement, year, period)
+            for comp in ticker]
+    try:
+        # get the objects that we want from the API, in the order of ticker
+        funds = _fetch_all(filings.get_fundamental_reported_financials, keys,
+                           max_workers)
+    except Exception as e:
+        if invalid_key_error(e):
+            return msg_apy
+        msg = "Invalid agruments: please make sure that your statement"
+        msg = msg + "/year/period are valid"
+        return msg
 
-    # Check if the elements in the ticker list are strings
-    for comp in ticker:
-        if not isinstance(comp, str):
-            raise TypeError(
-                'Invalid data format: ticker must be a list of strings')
+    # for every company
+    for comp, fund in zip(ticker, funds):
+        result.append(_company_record(comp, statement, year, period, fund))
 
-    # Check if the year is a 4-digits number
-    if not len(year) == 4:
-        raise Exception(
-            "Invalid data format: year must be a string of 4 digits")
+    return _company_compare_output(result, output_format, sparse)
 
-    # Check if the output_format is either 'dict' or 'pddf'
-    if output_format not in ['dict', 'pddf']:
-        raise Exception(
-            "Invalid data format: output_format must be 'dict' or 'pddf'"
-        )
 
-    # Check if the statement is valid
-    if statement not in statements:
-        raise Exception(
-            "Invalid data format: statement must be a valid type"
-        )
+# Function that streams a given statement at a specific time for different
+# companies, one company at a time
+def iter_financial_statement_company_compare(api_key, ticker, statement,
+                                             year, period, source=None,
+                                             cache=None, max_workers=10):
+    """
+    Given the tickers, statement, year and period, yield from the Intrinio
+    API the filing of every company, one record at a time as the responses
+    arrive. Only the filings being downloaded (at most max_workers) are held
+    in memory, so a whole universe of tickers runs in flat memory.
 
-    # link with the API
-    intrinio_sdk.ApiClient().configuration.api_key['api_key'] = api_key
-    fundamentals_api = intrinio_sdk.FundamentalsApi()
+    Parameters
+    -----------
+    api_key, ticker, statement, year, period, source, cache
+        see gather_financial_statement_company_compare
+    max_workers : int (optional, default = 10)
+        the number of companies requested ahead of the one being processed.
+        With 1 the companies are requested one at a time
 
-    # result will contain a dictionnary for each company.
-    # This dictionnary will contain all the information for one company
-    result = []
+    Returns
+    -----------
+    generator
+        yields the record of every company, in the order of ticker, as in
+        the 'dict' output of gather_financial_statement_company_compare. An
+        invalid API key raises a ValueError and failed requests raise the
+        error of the source
 
-    # for every company
-    for comp in ticker:
-        # key is the appropriate key to select the information we want
-        key = comp + '-' + str(statement) + '-' + str(year) + '-' + str(period)
-        try:
-            # get the object that we want from the API
-            fund = fundamentals_api.get_fundamental_reported_financials(
-                key)
-        except Exception:
-            msg = "Invalid agruments: please make sure that your statement"
-            msg = msg + "/year/period are valid"
-            return msg
-
-        my_fund = fund.reported_financials
-
-        # This dictionary will contain all the information for one company
-        dict = {}
-        dict['ticker'] = comp
-        dict['statement'] = statement
-        dict['year'] = year
-        dict['period'] = period
-
-        # we store all the values, balances, names and the tags
-        for i in range(len(my_fund)):
-            value = my_fund[i].value
-            tag_dic = my_fund[i].xbrl_tag
-            balance = tag_dic.balance
-            name = tag_dic.name
-            tag = tag_dic.tag
-            # tag is a key of this dictionnary
-
-            # if the tag is several times in the original object, we keep
-            # one tag and the value is the sum or the substraction of
-            # all the values of this tag (depending on the value of balance)
-            if tag in dict.keys():
-                if balance == 'credit':
-                    value = dict[tag]['value'] - value
-                else:
-                    value = dict[tag]['value'] + value
-            dict[tag] = {'value': value, 'balance': balance, 'name': name}
-        result.append(dict)
+    Example
+    -----------
+    >>> records = iter_financial_statement_company_compare(api_key,
+    universe, 'income_statement', '2019', 'Q1')
+    >>> write_fundamentals(records, 'income_statement_2019_Q1.csv')
+    """
+    _check_company_compare_strings(api_key, statement, year, period)
+    _check_company_compare(ticker, statement, year, 'dict')
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
+    if _known_key(api_key, source) is False:
+        raise ValueError(
+            "Invalid API Key: please input a valid API key as a string")
+    filings = metered_source(filings,
+                             'iter_financial_statement_company_compare')
+    funds = _iter_fetch(
+        filings.get_fundamental_reported_financials,
+        [_reported_financials_key(comp, statement, year, period)
+         for comp in ticker], max_workers)
+    return (_company_record(comp, statement, year, period, fund)
+            for comp, fund in zip(ticker, funds))
+
+
+# Function that gathers several statements of the same filings at once
+def gather_financial_statements(api_key, ticker, statement, year, period,
+                                output_format='pddf', source=None, cache=None,
+                                max_workers=10):
+    """
+    Given the tickers, statements, years and periods, returns every
+    statement of every filing in one table: one row per (ticker, year,
+    period), with the tags of every statement prefixed by its name. All the
+    statements, years and periods are requested in parallel.
 
-    if output_format == 'dict':
-        return result
+    Parameters
+    -----------
+    api_key : str
+      API key (sandbox or production) from Intrinio
+    ticker : str or list
+      the ticker symbol(s) you would like to get information for
+    statement : list
+      the statements that you want to study
+      options: 'income_statement', 'cash_flow_statement',
+      'balance_sheet_statement'
+    year : list
+      the list containing the years as strings
+    period : list
+      the list of quarters (as strings) for which you want information
+    output_format : str (optional, default = 'pddf')
+      the output format for the data, options are 'dict' for dictionary
+      or 'pddf' for pandas dataframe
+    source : object (optional)
+      the data source to read from, see pyntrinio.sources. Defaults to the
+      live Intrinio API
+    cache : FilingCache or bool (optional)
+      the cache of reported financials to use, see pyntrinio.cache
+    max_workers : int (optional, default = 10)
+      the number of filings requested in parallel. With 1 the requests are
+      made one after another
+    Returns
+    -----------
+    object of type output_format
+      one record per ticker, year and period (in that order) with the
+      columns 'ticker', 'year' and 'period' and then the tags of every
+      statement, named '<statement>.<tag>', e.g.
+      'income_statement.netincome', holding the value of the tag (float
+      columns in a dataframe)
+    Example
+    -----------
+    >>> gather_financial_statements(api_key, 'AAPL', ['income_statement',
+    'cash_flow_statement', 'balance_sheet_statement'], ['2018', '2019'],
+    ['Q1', 'Q2', 'Q3', 'Q4'])
+    """
+    tickers, statements = _check_financial_statements(
+        api_key, ticker, statement, year, period, output_format)
 
-    # if the wanted type of the output is a dataframe
-    else:
-        # initialize a new empty dictionnary that we will convert into a
-        # dataframe
-        # this dictionnary will have the following structure
-        # {'name': [name1, name2], 'revenue' :
-        # [revenu_company_1, revenue_company_2], ...}
-        df = {}
-
-        # for every company
-        for i in range(len(result)):
-
-            # select all the information about this company
-            sub_dict = result[i]
-
-            # For all the tags that we have for this company
-            for val in sub_dict.keys():
-
-                # if the key is already in the df dictionary
-                if val in df.keys():
-
-                    # if the value that corresponds to the key is a string
-                    # which means that the key is 'ticker', 'statement',
-                    # 'year' or 'period'
-                    if type(sub_dict[val]) == str:
-
-                        # We append the value of the key
-                        df[val].append(sub_dict[val])
-
-                    # if the value of the key is a dictionary
-                    else:
-
-                        # only take the value that corresponds to the key
-                        # 'value'
-                        df[val].append(sub_dict[val]['value'])
-
-                # This step is to make sure that all the values in this
-                # dictionary (which are lists) are the same length
-                # if the tag of the company is not already in the df dictionary
-                else:
-
-                    if type(sub_dict[val]) == str:
-                        # We have to put as many 'None' as the number of
-                        # companies for which we already collected the
-                        # information
-                        df[val] = [None for j in range(i)] + [sub_dict[val]]
-                    else:
-                        df[val] = [None for j in range(
-                            i)] + [sub_dict[val]['value']]
-                        # We add some 'None' to make sure that all the values
-                        # are the same length in this dictionary
-            for val in df.keys():
-                # The length of each value should be i+1
-                # (=number of companies we studied)
-                if len(df[val]) != i+1:
-                    df[val].append(None)
-
-    return pd.DataFrame(df)
+    # link with the API
+    source, filings = _fundamentals_source(api_key, source, cache,
+                                           max_workers)
+    msg_apy = "Invalid API Key: please input a valid API key as a string"
+    if _known_key(api_key, source) is False:
+        return msg_apy
+    filings = metered_source(filings, 'gather_financial_statements')
+
+    # every statement x year x period key, fetched in parallel
+    cells = _financial_statements_cells(tickers, statements, year, period)
+    try:
+        fundas = _fetch_all(
+            filings.get_fundamental_reported_financials,
+            [_reported_financials_key(*cell) for cell in cells], max_workers)
+    except Exception as e:
+        if invalid_key_error(e):
+            return msg_apy
+        msg = "Invalid agruments: please make sure that your statement"
+        msg = msg + "/year/period are valid"
+        return msg
+    return _financial_statements_output(cells, fundas, output_format)
 
 
 # Function that gathers time series data of stock values
 def gather_stock_time_series(
         api_key, ticker, start_date=None, end_date=None, output_format='dict',
-        allow_max_rows=False):
+        allow_max_rows=False, source=None, all_pages=False,
+        price_dtype='float64', store=None, overlap=5, max_workers=10,
+        layout='long'):
     """
     Given the ticker, start date, and end date, return from the Intrinio API
         stock data for that time frame in either a dictionary or a pandas
@@ -354,8 +1135,10 @@ def gather_stock_time_series(
     -----------
     api_key : str
         API key (sandbox or production) from Intrinio
-    ticker : str
-        the ticker symbol you would like to get stock data for
+    ticker : str or list
+        the ticker symbol you would like to get stock data for, or a list of
+        ticker symbols to get a panel of stock data for, e.g. 'AAPL' or
+        ['AAPL', 'CSCO']
     start_date : str (optional)
         the earliest date in the format of "%Y-%m-%d", e.g. "2019-12-31" to
         get data for
@@ -368,6 +1151,33 @@ def gather_stock_time_series(
     allow_max_rows : bool (optional, default = False)
         if False, then only 100 rows will show in the output, otherwise up to
         10000 rows will show (based on dates)
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+    all_pages : bool (optional, default = False)
+        if True, every row between the dates is returned: the pages of 100
+        (or 10000 with allow_max_rows) rows are followed and added to the
+        output one at a time
+    price_dtype : str (optional, default = 'float64')
+        the dtype of the price columns of a pandas dataframe output, e.g.
+        'float32' to halve their memory
+    store : PriceStore, ColumnStore or bool (optional)
+        a local store of the prices (True for the default PriceStore, see
+        pyntrinio.store and pyntrinio.columnar). Only the dates after the
+        last stored bar are requested and every stored row between the
+        dates is returned, whatever allow_max_rows and all_pages are
+    overlap : int (optional, default = 5)
+        with a store, the number of days before the last stored bar that are
+        requested again to pick up revised adjusted values
+    max_workers : int (optional, default = 10)
+        with a list of tickers, the number of tickers requested in parallel.
+        With 1 the requests are made one after another
+    layout : str (optional, default = 'long')
+        with a list of tickers and output_format='pddf', 'long' for one row
+        per ticker and date with a categorical 'ticker' column first (the
+        rows of every ticker newest first, in the order of the list) or
+        'multiindex' for rows indexed by (date, ticker), oldest first. The
+        dictionary output is always long
 
     Returns
     -----------
@@ -378,81 +1188,132 @@ def gather_stock_time_series(
     -----------
     >>> gather_stock_time_series(api_key, 'AAPL', start_date="2020-01-15",
     end_date="2020-01-30", output_format="pddf")
+    >>> gather_stock_time_series(api_key, ['AAPL', 'CSCO'],
+    start_date="2020-01-15", output_format="pddf", layout="multiindex")
     """
-    # error messages
-    msg1 = "Invalid data format: ticker must be a string"
-    msg2 = "Invalid Date format: date must be a string in the format %Y-%m-%d"
-    msg3 = "Invalid Input: end_date must be later than start_date"
     msg4 = "Invalid API Key: please input a valid API key as a string"
 
-    # ensure the type of the ticker is a string
-    if type(ticker) != str:
-        return msg1
-
     try:
-        # change dates to datetime objects
-        if start_date is not None:
-            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        if end_date is not None:
-            end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-    except Exception:
-        return msg2
-
-    if start_date is not None and end_date is not None:
-        if start_date >= end_date:
-            return msg3
+        start_date, end_date = _check_stock_time_series(
+            ticker, start_date, end_date, layout, panel=True)
+    except ValueError as e:
+        return str(e)
+
+    panel = isinstance(ticker, list)
+    # initialize the data source
+    if source is None:
+        source = _default_source(api_key, max_workers if panel else None)
+    if _known_key(api_key, source) is False:
+        return msg4
+    source = metered_source(source, 'gather_stock_time_series')
 
-    # initialize API key
-    intrinio_sdk.ApiClient().configuration.api_key['api_key'] = api_key
+    store = price_store(store)
+    if panel:
+        try:
+            return _gather_stock_price_panel(
+                source, store, ticker, start_date, end_date, output_format,
+                allow_max_rows, all_pages, price_dtype, overlap, max_workers,
+                layout)
+        except Exception:
+            return msg4
 
-    # initialize security API
-    security_api = intrinio_sdk.SecurityApi()
+    if store is not None:
+        try:
+            _sync_stock_prices(store, source, ticker, start_date, end_date,
+                               overlap)
+        except Exception:
+            return msg4
+        return _stored_stock_prices(store, ticker, start_date, end_date,
+                                    output_format, price_dtype)
 
-    # if allow_max_rows=False
-    if allow_max_rows is False:
-        rows = 100
-    else:
-        rows = 10000
+    if all_pages:
+        try:
+            # build the output one page at a time
+            chunks = [_stock_prices_output(page, output_format, price_dtype)
+                      for page in _stock_price_pages(
+                          source, ticker, start_date, end_date,
+                          _page_size(allow_max_rows))]
+        except Exception:
+            return msg4
+        return _concat_stock_prices(chunks, output_format)
 
     try:
         # put stock prices into a variable
-        stock_prices = security_api.get_security_stock_prices(
+        stock_prices = source.get_security_stock_prices(
             ticker, start_date=start_date, end_date=end_date,
-            page_size=rows).stock_prices
+            page_size=_page_size(allow_max_rows)).stock_prices
     except Exception:
         return msg4
 
-    # initialize a results dictionary
-    results = {'date': [], 'close': [], 'adj_close': [], 'high': [],
-               'adj_high': [], 'low': [], 'adj_low': [], 'open': [],
-               'adj_open': [], 'volume': [], 'adj_volume': [], 'frequency': [],
-               'intraperiod': []}
+    return _stock_prices_output(stock_prices, output_format, price_dtype)
 
-    # fill in dictionary
-    for i in list(range(0, len(stock_prices), 1)):
-        results['date'].append(stock_prices[i].date)
-        results['close'].append(stock_prices[i].close)
-        results['adj_close'].append(stock_prices[i].adj_close)
-        results['high'].append(stock_prices[i].high)
-        results['adj_high'].append(stock_prices[i].adj_high)
-        results['low'].append(stock_prices[i].low)
-        results['adj_low'].append(stock_prices[i].adj_low)
-        results['open'].append(stock_prices[i].open)
-        results['adj_open'].append(stock_prices[i].adj_open)
-        results['volume'].append(stock_prices[i].volume)
-        results['adj_volume'].append(stock_prices[i].adj_volume)
-        results['frequency'].append(stock_prices[i].frequency)
-        results['intraperiod'].append(stock_prices[i].intraperiod)
 
-    # if the ouput format is a dataframe, change to that
-    if output_format == 'pddf':
-        results = pd.DataFrame(results)
+# Function that streams time series data of stock values page by page
+def iter_stock_time_series(
+        api_key, ticker, start_date=None, end_date=None, output_format='dict',
+        page_size=10000, source=None, prefetch=True, price_dtype='float64'):
+    """
+    Given the ticker, start date, and end date, yield from the Intrinio API
+        all the stock data for that time frame, one page at a time, in either
+        a dictionary or a pandas dataframe format. Only one page is held in
+        memory at once (two with prefetch).
 
-    return results
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    ticker : str
+        the ticker symbol you would like to get stock data for
+    start_date : str (optional)
+        the earliest date in the format of "%Y-%m-%d", e.g. "2019-12-31" to
+        get data for
+    end_date : str (optional)
+        the most recent date in the format of "%Y-%m-%d", e.g. "2019-12-31" to
+        get data for
+    output_format : str (optional, default = 'dict')
+        the output format for every page, options are 'dict' for dictionary
+        or 'pddf' for pandas dataframe
+    page_size : int (optional, default = 10000)
+        the number of rows per page (at most 10000)
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+    prefetch : bool (optional, default = True)
+        if True, the next page is downloaded in a background thread while
+        the current one is being processed
+    price_dtype : str (optional, default = 'float64')
+        the dtype of the price columns of pandas dataframe pages
+
+    Returns
+    -----------
+    generator
+        yields the stock data of every page, newest first, in the specified
+        output format. Invalid inputs raise a ValueError with the message
+        gather_stock_time_series returns, and failed requests raise the
+        error of the source
+
+    Example
+    -----------
+    >>> for page in iter_stock_time_series(api_key, 'AAPL',
+    start_date="1990-01-01", output_format="pddf"):
+    ...     page.to_csv('aapl.csv', mode='a')
+    """
+    start_date, end_date = _check_stock_time_series(
+        ticker, start_date, end_date)
+
+    # initialize the data source
+    if source is None:
+        source = _default_source(api_key)
+    source = metered_source(source, 'iter_stock_time_series')
+
+    return (_stock_prices_output(page, output_format, price_dtype)
+            for page in _stock_price_pages(source, ticker, start_date,
+                                           end_date, page_size, prefetch))
 
 
 # Function that calculates the stock returns
-def gather_stock_returns(api_key, ticker, buy_date, sell_date):
+def gather_stock_returns(api_key, ticker, buy_date, sell_date, source=None,
+                         max_workers=10, calendar=None):
     """
     Given the tickers, buy-in date, sell-out date, returns the historical
     prices and profit/loss (based on the adjusted closing prices).
@@ -472,6 +1333,16 @@ def gather_stock_returns(api_key, ticker, buy_date, sell_date):
         the sell-out date in the format of "%Y-%m-%d", e.g. "2019-12-31". If
         the input date is not a trading day, it will be automatically changed
         to the last nearest trading day.
+    source : object (optional)
+        the data source to read from, see pyntrinio.sources. Defaults to the
+        live Intrinio API
+    max_workers : int (optional, default = 10)
+        the number of tickers requested in parallel. With 1 the requests are
+        made one after another
+    calendar : TradingCalendar (optional)
+        the trading days used to find the prices around the dates of long
+        holding periods without extra requests, see pyntrinio.calendars.
+        Defaults to nyse_calendar()
 
     Returns
     -----------
@@ -484,68 +1355,43 @@ def gather_stock_returns(api_key, ticker, buy_date, sell_date):
     >>> gather_stock_returns(api_key, ['AAPL', 'CSCO'], "2017-12-31",
     "2019-03-01")
     """
-
-    msg1 = "Invalid Input: sell_date must be later than buy_date"
-    msg2 = "Invalid Date format: date must be a string in the format %Y-%m-%d"
     msg3 = "Invalid API Key: please input a valid API key as a string"
 
-    # test whether the input dates are in the right format
     try:
-        buy_date = datetime.strptime(buy_date, '%Y-%m-%d').date()
-        sell_date = datetime.strptime(sell_date, '%Y-%m-%d').date()
-        if buy_date >= sell_date:
-            return msg1
-    except Exception:
-        return msg2
-
-    if type(ticker) == str:  # if user gives just one ticker
-        ticker = [ticker]
+        ticker, buy_date, sell_date = _check_stock_returns(
+            ticker, buy_date, sell_date)
+    except ValueError as e:
+        return str(e)
 
-    # initialize API key
-    intrinio_sdk.ApiClient().configuration.api_key['api_key'] = api_key
+    # initialize the data source
+    if source is None:
+        source = _default_source(api_key, max_workers)
 
-    # initialize security API
-    security_api = intrinio_sdk.SecurityApi()
-
-    # test if the API Key works
-    try:
-        security_api.get_security_stock_prices(ticker[0], start_date=buy_date,
-                                               end_date=sell_date)
-    except Exception:
+    # a key found not to work by an earlier call is not tried again
+    if _known_key(api_key, source) is False:
         return msg3
+    source = metered_source(source, 'gather_stock_returns')
 
-    # create the result DataFrame to record and report
-    results = pd.DataFrame(columns=['Stock', 'Buy date', 'Buy price',
-                                    'Sell date', 'Sell price', 'Return (%)'],
-                           index=range(len(ticker)))
+    # with calendar=None, _returns_requests reads the NYSE calendar only if
+    # the dates are too far apart for a single request
 
-    # iterate through all the tickers and record the results
-    i = 0
-    # if buy_date it not a trading day (holiday), we'll get the nearest next
-    # trading day instead
-    buy_date_upper = buy_date + timedelta(days=10)
-    # the same idea for sell_date, but we'll get the nearest **last** trading
-    # day instead.
-    sell_date_lower = sell_date - timedelta(days=10)
-
-    for ticker in ticker:
-        api_response = security_api.get_security_stock_prices(
-            ticker,
-            start_date=buy_date,
-            end_date=buy_date_upper
-        )
-        buy_price = api_response.stock_prices[-1].adj_close
-        buy_date = api_response.stock_prices[-1].date.strftime("%Y-%m-%d")
-
-        api_response = security_api.get_security_stock_prices(
-            ticker, start_date=sell_date_lower, end_date=sell_date)
-        sell_price = api_response.stock_prices[0].adj_close
-        sell_date = api_response.stock_prices[0].date.strftime("%Y-%m-%d")
-        rtn = ((sell_price - buy_price) / buy_price)*100
-        rtn = round(rtn, 2)
-
-        results.iloc[i, :] = [ticker, buy_date, buy_price, sell_date,
-                              sell_price, rtn]
-        i += 1
-
-    return results
+    # price the first ticker on its own: its response doubles as the
+    # API key check. Duplicated tickers are only requested once, and the
+    # error of a ticker is kept to report it by name
+    def fetch(comp):
+        try:
+            return _returns_row(comp, _returns_responses(
+                source, comp, buy_date, sell_date, calendar))
+        except Exception as e:
+            return e
+
+    unique = list(dict.fromkeys(ticker))
+    first = fetch(unique[0])
+    if isinstance(first, Exception):
+        return _returns_error(unique[0], first)
+    rows = dict(zip(
+        unique, [first] + _fetch_all(fetch, unique[1:], max_workers)))
+    for comp in unique:
+        if isinstance(rows[comp], Exception):
+            return _returns_error(comp, rows[comp])
+    return _returns_output([rows[comp] for comp in ticker])
@@ -0,0 +1,232 @@
+# Author: Team Andrey Markov
+# pyntrinio rate limiting
+
+# Every request IntrinioSource sends to the Intrinio API goes through the
+# RateLimiter of its API key, shared by the whole process. The limiter is a
+# token bucket: it lets through at most `rate` requests per second, with
+# bursts of up to `burst` requests, so a bulk run stays under the limit of
+# the Intrinio plan. Requests that are throttled (HTTP 429), that hit a
+# server error (HTTP 5xx) or that lose their connection are retried with a
+# jittered exponential backoff. A Retry-After header sent by the API is
+# honored, and pauses every request made with the key, not only the one
+# that was throttled. These are the only retries: IntrinioSource turns off
+# the ones of the intrinio_sdk ApiClient.
+#
+# The rate limit is opt-in: Intrinio plans have different limits, so the
+# limiter of a key lets every request through until set_rate_limit() gives
+# it the rate of the plan. Retries apply either way.
+#
+# Usage:
+#   >>> from pyntrinio.ratelimit import set_rate_limit
+#   >>> set_rate_limit(api_key, rate=100, burst=10)
+
+# Imports
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from pyntrinio.metrics import note_retry
+
+# HTTP statuses that are worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def retry_after(error):
+    """
+    Return the number of seconds the Retry-After header of error asks to
+    wait for, or None if error has no such header.
+    """
+    headers = getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # an HTTP date, rarely sent: its parser is imported when one comes
+    from email.utils import parsedate_to_datetime
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def retryable_error(error):
+    """
+    Return True if the request that raised error may succeed if sent again:
+    it was throttled, hit a server error or lost its connection.
+    """
+    status = getattr(error, 'status', None)
+    if status is not None:
+        return status in RETRY_STATUSES
+    # urllib3 already retried the failed connections (MaxRetryError), only
+    # dropped connections and timeouts are left to retry here. urllib3 is
+    # not imported for this: no request was sent if it has not been loaded
+    urllib3 = sys.modules.get('urllib3')
+    if urllib3 is None:
+        return False
+    return isinstance(error, (urllib3.exceptions.ProtocolError,
+                              urllib3.exceptions.TimeoutError))
+
+
+class RateLimiter:
+    """
+    Token bucket with retries, shared by the requests made with one API key.
+
+    Parameters
+    -----------
+    rate : float (optional)
+        the number of requests allowed per second, None for no limit
+    burst : int (optional)
+        the number of requests that can be sent at once after a quiet
+        period, defaults to max(1, rate)
+    max_retries : int (optional, default = 5)
+        the number of times a failed request is sent again
+    backoff : float (optional, default = 0.5)
+        seconds waited before the first retry, doubled on every retry and
+        multiplied by a random jitter between 0.5 and 1.5
+    max_backoff : float (optional, default = 60.0)
+        the longest wait between two retries
+
+    Attributes
+    -----------
+    requests : int
+        number of requests sent
+    retries : int
+        number of requests sent again after a failure
+    throttled : int
+        number of HTTP 429 responses received
+
+    Example
+    -----------
+    >>> limiter = RateLimiter(rate=100, burst=10)
+    >>> limiter.call(security_api.get_security_stock_prices, 'AAPL')
+    """
+
+    def __init__(self, rate=None, burst=None, max_retries=5, backoff=0.5,
+                 max_backoff=60.0):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def acquire(self):
+        """Wait until a request may be sent and take its token."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._paused_until - now
+            if self.rate:
+                # refill the bucket, then reserve a token: a negative count
+                # is the queue of requests waiting for theirs
+                self._tokens = min(float(self.burst), self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                wait = max(wait, -self._tokens / self.rate)
+            self.requests += 1
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every request made through the limiter for seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+
+    def delay(self, attempt, error=None):
+        """
+        Return the seconds to wait before retry number attempt (from 0),
+        honoring the Retry-After header of error.
+        """
+        wait = min(self.max_backoff, self.backoff * 2 ** attempt)
+        wait = wait * random.uniform(0.5, 1.5)
+        asked = retry_after(error)
+        if asked is not None:
+            wait = max(wait, asked)
+        return wait
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs) once a token is available, retrying it
+        when it raises a retryable_error(), and return its result. The last
+        error is raised once max_retries is reached.
+        """
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not retryable_error(e):
+                    raise
+                wait = self.delay(attempt, e)
+                throttled = getattr(e, 'status', None) == 429
+                with self._lock:
+                    self.retries += 1
+                    self.throttled += throttled
+                note_retry()
+                if throttled:
+                    # the limit is shared by every request made with the key
+                    self.pause(wait)
+                time.sleep(wait)
+                attempt += 1
+
+    def stats(self):
+        """Return the requests, retries and throttled responses so far."""
+        return {'requests': self.requests, 'retries': self.retries,
+                'throttled': self.throttled}
+
+
+def get_limiter(api_key):
+    """
+    Return the RateLimiter shared by the requests made with api_key,
+    creating one without a rate limit on first use.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if limiter is None:
+            limiter = _limiters[api_key] = RateLimiter()
+        return limiter
+
+
+def set_rate_limit(api_key, rate=None, burst=None, **kwargs):
+    """
+    Set the rate limit of the requests made with api_key.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    rate : float (optional)
+        the number of requests allowed per second, None for no limit
+    burst : int (optional)
+        the number of requests that can be sent at once
+    **kwargs
+        max_retries, backoff and max_backoff, see RateLimiter
+
+    Returns
+    -----------
+    RateLimiter
+        the new limiter of api_key
+    """
+    limiter = RateLimiter(rate, burst, **kwargs)
+    with _limiters_lock:
+        _limiters[api_key] = limiter
+    return limiter
@@ -0,0 +1,181 @@
+# Author: Team Andrey Markov
+# pyntrinio returns over many windows of a price panel
+
+# gather_stock_returns prices one (buy_date, sell_date) window per call.
+# panel_returns instead takes a price panel (see gather_stock_time_series
+# with a list of tickers) and any number of windows, and prices every
+# (ticker, window) pair at once: the rows are sorted by (ticker, date) into
+# one int64 key per row, and the buy and sell keys of every pair are looked
+# up with two np.searchsorted calls. Like gather_stock_returns, a buy date
+# that is not a trading day moves to the next trading day and a sell date
+# to the last one before it.
+
+# Imports
+import numpy as np
+import pandas as pd
+
+from pyntrinio.pyntrinio import gather_stock_time_series
+
+
+def _window_dates(dates, name):
+    """
+    Return dates ("%Y-%m-%d" strings, date objects or datetime64) as a
+    datetime64[D] array. Raises a ValueError otherwise
+    """
+    try:
+        return np.asarray(pd.to_datetime(list(dates)),
+                          dtype='datetime64[D]')
+    except Exception:
+        raise ValueError("Invalid Date format: " + name +
+                         " must be dates in the format %Y-%m-%d")
+
+
+def _check_windows(buy_dates, sell_dates):
+    """
+    Validate the windows of panel_returns and return their dates as
+    datetime64[D] arrays. Raises a ValueError otherwise
+    """
+    buy = _window_dates(buy_dates, 'buy_dates')
+    sell = _window_dates(sell_dates, 'sell_dates')
+    if len(buy) != len(sell):
+        raise ValueError("Invalid Input: buy_dates and sell_dates must " +
+                         "have the same length")
+    if (buy >= sell).any():
+        raise ValueError("Invalid Input: sell_date must be later than " +
+                         "buy_date")
+    return buy, sell
+
+
+def _panel_columns(panel, price):
+    """
+    Return the ticker categorical, the datetime64[D] dates and the float64
+    prices of a long or (date, ticker) MultiIndex panel
+    """
+    if isinstance(panel.index, pd.MultiIndex):
+        ticker = panel.index.get_level_values('ticker')
+        dates = panel.index.get_level_values('date')
+    else:
+        ticker = panel['ticker']
+        dates = panel['date']
+    return (pd.Categorical(ticker),
+            np.asarray(dates, dtype='datetime64[D]'),
+            np.asarray(panel[price], dtype='float64'))
+
+
+def panel_returns(panel, buy_dates, sell_dates, price='adj_close'):
+    """
+    Given a price panel and lists of buy-in and sell-out dates, return the
+    profit/loss of every ticker over every (buy_date, sell_date) window.
+
+    Parameters
+    -----------
+    panel : pandas.core.frame.DataFrame
+        the stock prices of several tickers, in either layout returned by
+        gather_stock_time_series with a list of tickers
+    buy_dates : list
+        the buy-in date of every window, e.g. ["2019-01-02", "2019-06-03"].
+        A date that is not a trading day moves to the next trading day
+    sell_dates : list
+        the sell-out date of every window, as long as buy_dates. A date that
+        is not a trading day moves to the last trading day
+    price : str (optional, default = 'adj_close')
+        the price column to compute the returns on
+
+    Returns
+    -----------
+    pandas.core.frame.DataFrame
+        the returns in percent, one row per ticker and one column per
+        (buy_date, sell_date) window. A window with no trading day of a
+        ticker between its dates is NaN
+
+    Example
+    -----------
+    >>> panel = gather_stock_time_series(api_key, ['AAPL', 'CSCO'],
+    start_date='2010-01-04', output_format='pddf', all_pages=True)
+    >>> panel_returns(panel, ['2017-12-31', '2018-12-31'],
+    ['2019-03-01', '2019-12-31'])
+    """
+    buy, sell = _check_windows(buy_dates, sell_dates)
+
+    ticker, dates, prices = _panel_columns(panel, price)
+    codes = ticker.codes.astype('int64')
+    days = dates.astype('int64')
+    # one key per row orders the rows by ticker, then date
+    origin = min(days.min(initial=0), buy.astype('int64').min(initial=0))
+    span = max(days.max(initial=0), sell.astype('int64').max(initial=0)) - \
+        origin + 2
+    keys = codes * span + (days - origin)
+    order = np.argsort(keys, kind='stable')
+    # a trailing NaN prices the pairs without a trading day
+    keys, prices = keys[order], np.append(prices[order], np.nan)
+
+    # the first and last row of every ticker
+    n_tickers = len(ticker.categories)
+    first = np.searchsorted(keys, np.arange(n_tickers) * span, 'left')
+    last = np.searchsorted(keys, (np.arange(n_tickers) + 1) * span,
+                           'left') - 1
+
+    # (tickers x windows) keys of the buy and sell dates
+    base = (np.arange(n_tickers) * span)[:, None]
+    buy_at = np.searchsorted(keys, base + (buy.astype('int64') - origin),
+                             'left')
+    sell_at = np.searchsorted(keys, base + (sell.astype('int64') - origin),
+                              'right') - 1
+    valid = (buy_at <= last[:, None]) & (sell_at >= first[:, None]) & \
+        (buy_at <= sell_at)
+    buy_price = prices[np.where(valid, buy_at, -1)]
+    sell_price = prices[np.where(valid, sell_at, -1)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rtn = (sell_price - buy_price) / buy_price * 100
+
+    columns = pd.MultiIndex.from_arrays(
+        [pd.DatetimeIndex(buy), pd.DatetimeIndex(sell)],
+        names=['buy_date', 'sell_date'])
+    return pd.DataFrame(rtn, index=pd.Index(ticker.categories,
+                                            name='ticker'),
+                        columns=columns)
+
+
+def gather_panel_returns(api_key, ticker, buy_dates, sell_dates,
+                         price='adj_close', **kwargs):
+    """
+    Given the tickers and lists of buy-in and sell-out dates, request the
+    panel of stock prices covering every window and return the profit/loss
+    of every ticker over every window, see panel_returns.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    ticker : list
+        a list containing tickers, e.g. ['AAPL', 'CSCO']
+    buy_dates, sell_dates, price
+        see panel_returns
+    **kwargs
+        passed on to gather_stock_time_series, e.g. source, store or
+        max_workers
+
+    Returns
+    -----------
+    pandas.core.frame.DataFrame
+        the returns in percent, one row per ticker and one column per
+        window, or the error message of gather_stock_time_series
+
+    Example
+    -----------
+    >>> gather_panel_returns(api_key, ['AAPL', 'CSCO'],
+    ['2017-12-31', '2018-12-31'], ['2019-03-01', '2019-12-31'])
+    """
+    buy, sell = _check_windows(buy_dates, sell_dates)
+    if len(buy) == 0:
+        raise ValueError("Invalid Input: buy_dates must not be empty")
+    if isinstance(ticker, str):
+        ticker = [ticker]
+    kwargs.setdefault('allow_max_rows', True)
+    kwargs.setdefault('all_pages', True)
+    panel = gather_stock_time_series(
+        api_key, ticker, start_date=str(buy.min()),
+        end_date=str(sell.max()), output_format='pddf', **kwargs)
+    if isinstance(panel, str):
+        return panel
+    return panel_returns(panel, buy, sell, price)
@@ -0,0 +1,96 @@
+# Author: Team Andrey Markov
+# pyntrinio coalescing of identical requests in flight
+
+# When several threads (or asyncio tasks, whose blocking requests run in the
+# executor of their event loop) ask the live API for the same filing or the
+# same ticker and dates at the same time, only the first request is sent:
+# the others wait for it and receive its response, or its exception. A key
+# is only shared while its request is in flight, so later calls send a new
+# request (see pyntrinio.cache and pyntrinio.store to keep the responses).
+
+# Imports
+import threading
+from collections import Counter
+
+
+class _Call:
+    """A request in flight and the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome with the
+    callers that ask for the same key while it runs.
+
+    Example
+    -----------
+    >>> flight = SingleFlight()
+    >>> flight.call(('AAPL', '2019-01-02'), fetch, 'AAPL', '2019-01-02')
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = Counter()
+
+    def call(self, key, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), or the outcome of the call already in
+        flight for key. Calls with an unhashable key are not shared.
+        """
+        try:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self._stats['calls'] += 1
+                else:
+                    self._stats['shared'] += 1
+        except TypeError:
+            return fn(*args, **kwargs)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Return the number of keys with a call in flight."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        """
+        Return the number of calls made ('calls') and of callers that shared
+        the call of another one ('shared').
+        """
+        with self._lock:
+            return {'calls': self._stats['calls'],
+                    'shared': self._stats['shared']}
+
+
+# the requests of every IntrinioSource of the process go through this one
+_default_flight = SingleFlight()
+
+
+def single_flight():
+    """Return the SingleFlight shared by the live requests of the process."""
+    return _default_flight
@@ -0,0 +1,443 @@
+# Author: Team Andrey Markov
+# pyntrinio data sources
+
+# Every gather_* function reads its data through a "source": an object with
+# the two Intrinio endpoints pyntrinio uses,
+#   get_fundamental_reported_financials(key)
+#   get_security_stock_prices(identifier, start_date, end_date, page_size,
+#                             next_page)
+# returning objects shaped like the intrinio_sdk responses. IntrinioSource
+# talks to the live API, ReplaySource serves canned payloads offline and
+# RecordingSource captures live responses so they can be replayed later.
+# A source may also offer coroutine versions of the endpoints, named
+# aget_fundamental_reported_financials and aget_security_stock_prices, which
+# the agather_* functions of pyntrinio.aio await directly.
+
+# Imports
+import bisect
+import contextvars
+import functools
+import json
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+from pyntrinio.keys import remember_key
+from pyntrinio.metrics import note_payload
+from pyntrinio.ratelimit import get_limiter
+from pyntrinio.singleflight import single_flight
+
+# attributes of a stock price that pyntrinio reads
+PRICE_FIELDS = ['date', 'close', 'adj_close', 'high', 'adj_high', 'low',
+                'adj_low', 'open', 'adj_open', 'volume', 'adj_volume',
+                'frequency', 'intraperiod']
+
+
+class ReplayError(Exception):
+    """
+    Raised by ReplaySource when it has no payload for a request. Like
+    intrinio_sdk.rest.ApiException it carries an HTTP-style status.
+    """
+
+    def __init__(self, status, reason):
+        super().__init__("({0}) {1}".format(status, reason))
+        self.status = status
+        self.reason = reason
+        self.headers = None
+
+
+class IntrinioSource:
+    """
+    Data source backed by the live Intrinio API. It holds its own
+    intrinio_sdk.ApiClient, whose pool keeps up to max_connections HTTP
+    connections alive between requests, so a long-lived source reuses its
+    connections and TLS sessions. Its requests go through the RateLimiter
+    of its key, see pyntrinio.ratelimit, and identical requests in flight
+    at the same time are sent once, see pyntrinio.singleflight.
+
+    Parameters
+    -----------
+    api_key : str
+        API key (sandbox or production) from Intrinio
+    max_connections : int (optional, default = 10)
+        the number of connections kept in the pool, which should be at least
+        the number of requests made at the same time
+    """
+
+    def __init__(self, api_key, max_connections=10):
+        # imported here since intrinio_sdk (hundreds of generated modules) is
+        # only needed by the live API
+        import intrinio_sdk
+
+        configuration = intrinio_sdk.Configuration()
+        # Configuration() copies a default whose api_key dictionary is shared
+        # by every configuration, so this source gets a dictionary of its own
+        configuration.api_key = {'api_key': api_key}
+        configuration.connection_pool_maxsize = max_connections
+        # failed requests are retried by the RateLimiter of the key (see
+        # pyntrinio.ratelimit), the retries of the ApiClient (up to 5 tries
+        # of every request, sleeping on 429) would multiply its own
+        configuration.retries = {'allow': False}
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.api_client = intrinio_sdk.ApiClient(
+            configuration, header_name='Connection', header_value='keep-alive')
+        # report the size of every response body, see pyntrinio.metrics
+        request = self.api_client.rest_client.request
+
+        def metered_request(*args, **kwargs):
+            response = request(*args, **kwargs)
+            note_payload(len(getattr(response, 'data', None) or b''))
+            return response
+
+        self.api_client.rest_client.request = metered_request
+        self.fundamentals_api = intrinio_sdk.FundamentalsApi(self.api_client)
+        self.security_api = intrinio_sdk.SecurityApi(self.api_client)
+
+    def close(self):
+        """Close the pooled connections."""
+        self.api_client.rest_client.pool_manager.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _checked(self, endpoint, *args, **kwargs):
+        # identical requests made at the same time with the same key share
+        # one request (see pyntrinio.singleflight), which waits for the rate
+        # limit of the key and is retried when throttled (see
+        # pyntrinio.ratelimit), then every response tells whether the key
+        # works (see pyntrinio.keys)
+        key = (self.api_key, getattr(endpoint, '__name__', endpoint), args,
+               tuple(sorted(kwargs.items())))
+        try:
+            response = single_flight().call(
+                key, get_limiter(self.api_key).call, endpoint, *args,
+                **kwargs)
+        except Exception as e:
+            remember_key(self.api_key, e)
+            raise
+        remember_key(self.api_key)
+        return response
+
+    def get_fundamental_reported_financials(self, key):
+        return self._checked(
+            self.fundamentals_api.get_fundamental_reported_financials, key)
+
+    def get_security_stock_prices(self, identifier, start_date=None,
+                                  end_date=None, page_size=100,
+                                  next_page=None):
+        kwargs = {'start_date': start_date, 'end_date': end_date,
+                  'page_size': page_size}
+        if next_page is not None:
+            kwargs['next_page'] = next_page
+        return self._checked(self.security_api.get_security_stock_prices,
+                             identifier, **kwargs)
+
+
+# the executor _acall runs blocking endpoints on, set by the agather_*
+# functions of pyntrinio.aio for the duration of a call (None is the default
+# executor of the event loop)
+_EXECUTOR = contextvars.ContextVar('pyntrinio_executor', default=None)
+
+
+async def _acall(source, name, *args, **kwargs):
+    """
+    Call the endpoint name of source, awaiting its coroutine version when
+    the source has one and running it in the executor of _EXECUTOR
+    otherwise
+    """
+    # asyncio is imported by the coroutines only: an event loop running
+    # them has already imported it
+    import asyncio
+
+    coroutine = getattr(source, 'a' + name, None)
+    if coroutine is not None:
+        return await coroutine(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # the executor thread sees the context of the task, see pyntrinio.metrics
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_EXECUTOR.get(), functools.partial(
+        context.run, getattr(source, name), *args, **kwargs))
+
+
+def _to_date(value):
+    """Convert an ISO formatted string (or a date) to a date."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _fact(fact):
+    """Build a reported financial object from a plain dictionary."""
+    xbrl_tag = SimpleNamespace(tag=fact['tag'],
+                               balance=fact.get('balance'),
+                               name=fact.get('name'))
+    return SimpleNamespace(xbrl_tag=xbrl_tag, value=fact['value'])
+
+
+def _facts(response):
+    """Return the facts of a reported financials response as dictionaries."""
+    return [{'tag': f.xbrl_tag.tag, 'value': f.value,
+             'balance': f.xbrl_tag.balance, 'name': f.xbrl_tag.name}
+            for f in response.reported_financials]
+
+
+def _price(row):
+    """Build a stock price object from a plain dictionary."""
+    price = SimpleNamespace(**{f: row.get(f) for f in PRICE_FIELDS})
+    price.date = _to_date(price.date)
+    return price
+
+
+class ReplaySource:
+    """
+    Offline data source that serves canned Intrinio payloads.
+
+    Stock prices are filtered by date and paginated the way the live API
+    does it: newest first, page_size rows per page and a next_page token
+    when more rows are available.
+
+    Parameters
+    -----------
+    fundamentals : dict (optional)
+        maps a reported financials key such as
+        'AAPL-income_statement-2019-Q1' to a list of facts, each a dictionary
+        with the keys 'tag', 'value', 'balance' and 'name'
+    stock_prices : dict (optional)
+        maps a ticker to a list of price rows, each a dictionary with the
+        keys listed in PRICE_FIELDS (dates as date objects or "%Y-%m-%d")
+    latency : float (optional, default = 0.0)
+        seconds to sleep on every call, to simulate the network round trip
+
+    Attributes
+    -----------
+    calls : collections.Counter
+        number of calls made per endpoint
+
+    Example
+    -----------
+    >>> source = ReplaySource.load('recorded.json', latency=0.05)
+    >>> gather_stock_time_series(api_key, 'AAPL', source=source)
+    """
+
+    def __init__(self, fundamentals=None, stock_prices=None, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._fundamentals = {}
+        self._prices = {}
+        self._dates = {}
+        for key, facts in (fundamentals or {}).items():
+            self.add_reported_financials(key, facts)
+        for ticker, rows in (stock_prices or {}).items():
+            self.add_stock_prices(ticker, rows)
+
+    def add_reported_financials(self, key, facts):
+        """Register the facts served for a reported financials key."""
+        self._fundamentals[key] = [_fact(f) for f in facts]
+
+    def add_stock_prices(self, ticker, rows):
+        """Register the price history served for a ticker."""
+        prices = sorted((_price(r) for r in rows), key=lambda p: p.date)
+        self._set_prices(ticker, prices)
+
+    def _set_prices(self, ticker, prices):
+        # prices are kept oldest first so date ranges can be bisected
+        self._prices[ticker] = prices
+        self._dates[ticker] = [p.date for p in prices]
+
+    def get_fundamental_reported_financials(self, key):
+        self.calls['reported_financials'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reported_financials(key)
+
+    def get_security_stock_prices(self, identifier, start_date=None,
+                                  end_date=None, page_size=100,
+                                  next_page=None):
+        self.calls['stock_prices'] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._stock_prices(identifier, start_date, end_date,
+                                  page_size, next_page)
+
+    async def aget_fundamental_reported_financials(self, key):
+        self.calls['reported_financials'] += 1
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+        return self._reported_financials(key)
+
+    async def aget_security_stock_prices(self, identifier, start_date=None,
+                                         end_date=None, page_size=100,
+                                         next_page=None):
+        self.calls['stock_prices'] += 1
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+        return self._stock_prices(identifier, start_date, end_date,
+                                  page_size, next_page)
+
+    def _reported_financials(self, key):
+        if key not in self._fundamentals:
+            raise ReplayError(404, "No reported financials for " + key)
+        return SimpleNamespace(reported_financials=self._fundamentals[key])
+
+    def _stock_prices(self, identifier, start_date, end_date, page_size,
+                      next_page):
+        if identifier not in self._prices:
+            raise ReplayError(404, "No stock prices for " + identifier)
+        prices = self._prices[identifier]
+        dates = self._dates[identifier]
+        lo = 0 if start_date is None else bisect.bisect_left(
+            dates, _to_date(start_date))
+        hi = len(dates) if end_date is None else bisect.bisect_right(
+            dates, _to_date(end_date))
+        # pages are served newest first, next_page is the row offset
+        offset = int(next_page) if next_page else 0
+        stop = hi - offset
+        start = max(lo, stop - page_size)
+        page = prices[start:stop][::-1] if stop > lo else []
+        more = start > lo
+        return SimpleNamespace(
+            stock_prices=page,
+            next_page=str(offset + page_size) if more else None)
+
+    def to_dict(self):
+        """Return the payloads as JSON serializable dictionaries."""
+        fundamentals = {
+            key: _facts(SimpleNamespace(reported_financials=facts))
+            for key, facts in self._fundamentals.items()}
+        stock_prices = {}
+        for ticker, prices in self._prices.items():
+            rows = []
+            for p in prices:
+                row = {f: getattr(p, f) for f in PRICE_FIELDS}
+                row['date'] = p.date.strftime('%Y-%m-%d')
+                rows.append(row)
+            stock_prices[ticker] = rows
+        return {'fundamentals': fundamentals, 'stock_prices': stock_prices}
+
+    def save(self, path):
+        """Write the payloads to a JSON file that load() can read back."""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path, latency=0.0):
+        """Create a ReplaySource from a JSON file written by save()."""
+        with open(path) as f:
+            payload = json.load(f)
+        return cls(payload.get('fundamentals'), payload.get('stock_prices'),
+                   latency=latency)
+
+    @classmethod
+    def synthetic(cls, tickers, years=(), periods=(), statements=(),
+                  n_tags=50, n_rows=0, end_date='2019-12-31', latency=0.0):
+        """
+        Create a ReplaySource with generated payloads, for benchmarks.
+
+        Every filing shares one list of n_tags facts and every ticker shares
+        one history of n_rows weekday prices ending at end_date, so the
+        source stays small however many tickers it covers.
+
+        Parameters
+        -----------
+        tickers : list
+            the ticker symbols to generate payloads for
+        years : list (optional)
+            the years (as strings) to generate filings for
+        periods : list (optional)
+            the periods (as strings) to generate filings for
+        statements : list (optional)
+            the statements to generate filings for
+        n_tags : int (optional, default = 50)
+            the number of facts in every filing
+        n_rows : int (optional, default = 0)
+            the number of price rows for every ticker
+        end_date : str (optional, default = '2019-12-31')
+            the date of the most recent price row
+        latency : float (optional, default = 0.0)
+            seconds to sleep on every call
+
+        Returns
+        -----------
+        ReplaySource
+        """
+        source = cls(latency=latency)
+        facts = [_fact({'tag': 'tag_' + str(n), 'value': float(n + 1),
+                        'balance': 'credit' if n % 2 else 'debit',
+                        'name': 'Tag ' + str(n)})
+                 for n in range(n_tags)]
+        prices = []
+        day = _to_date(end_date)
+        while len(prices) < n_rows:
+            if day.weekday() < 5:
+                close = 100.0 + (len(prices) % 250) / 10
+                prices.append(SimpleNamespace(
+                    date=day, close=close, adj_close=close, high=close + 1,
+                    adj_high=close + 1, low=close - 1, adj_low=close - 1,
+                    open=close, adj_open=close, volume=1000000.0,
+                    adj_volume=1000000.0, frequency='daily',
+                    intraperiod=False))
+            day -= timedelta(days=1)
+        prices.reverse()
+        for ticker in tickers:
+            for statement in statements:
+                for year in years:
+                    for period in periods:
+                        key = '-'.join([ticker, statement, year, period])
+                        source._fundamentals[key] = facts
+            if n_rows:
+                source._set_prices(ticker, prices)
+        return source
+
+
+class RecordingSource:
+    """
+    Data source that forwards every call to another source and records the
+    responses, so that a live session can be replayed offline.
+
+    Parameters
+    -----------
+    source : object
+        the source to record, usually an IntrinioSource
+
+    Example
+    -----------
+    >>> recorder = RecordingSource(IntrinioSource(api_key))
+    >>> gather_stock_time_series(api_key, 'AAPL', source=recorder)
+    >>> recorder.save('recorded.json')
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.replay = ReplaySource()
+
+    def get_fundamental_reported_financials(self, key):
+        response = self.source.get_fundamental_reported_financials(key)
+        self.replay.add_reported_financials(key, _facts(response))
+        return response
+
+    def get_security_stock_prices(self, identifier, start_date=None,
+                                  end_date=None, page_size=100,
+                                  next_page=None):
+        response = self.source.get_security_stock_prices(
+            identifier, start_date=start_date, end_date=end_date,
+            page_size=page_size, next_page=next_page)
+        # merge the new rows with what was recorded before for this ticker
+        rows = {p.date: p for p in self.replay._prices.get(identifier, [])}
+        for p in response.stock_prices:
+            rows[p.date] = _price({f: getattr(p, f) for f in PRICE_FIELDS})
+        self.replay._set_prices(
+            identifier, sorted(rows.values(), key=lambda p: p.date))
+        return response
+
+    def save(self, path):
+        """Write the recorded payloads to a JSON file."""
+        self.replay.save(path)
@@ -0,0 +1,251 @@
+# Author: Team Andrey Markov
+# pyntrinio local store of stock prices
+
+# Price histories only grow at their end, so a local copy can be kept up to
+# date by asking the API for the days after the last stored bar. PriceStore
+# keeps the rows of every ticker in a SQLite database, along with the first
+# date each ticker was synced from, and tells gather_stock_time_series which
+# dates are missing. A few days before the last stored bar (the overlap) are
+# requested again to pick up revised adjusted values.
+
+# Imports
+import os
+import sqlite3
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+
+from pyntrinio.cache import cache_folder
+from pyntrinio.sources import PRICE_FIELDS, _to_date
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+# SQLite types of the columns that are not prices
+_TYPES = {'date': 'TEXT', 'frequency': 'TEXT', 'intraperiod': 'INTEGER'}
+
+
+def default_store_path():
+    """
+    Return the path of the default store: prices.sqlite in
+    pyntrinio.cache.cache_folder()
+    """
+    return os.path.join(cache_folder(), 'prices.sqlite')
+
+
+def default_store():
+    """Return the process wide PriceStore at default_store_path()."""
+    global _default_store
+    # the worker threads of a call may all ask for it at once, only one of
+    # them opens the database
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PriceStore()
+    return _default_store
+
+
+class PriceStore:
+    """
+    Persistent store of daily stock prices, partitioned by ticker.
+
+    Parameters
+    -----------
+    path : str (optional)
+        the SQLite file to store the prices in, defaults to
+        default_store_path(). ':memory:' keeps the store in memory
+
+    Example
+    -----------
+    >>> store = PriceStore('prices.sqlite')
+    >>> gather_stock_time_series(api_key, 'AAPL', start_date='2000-01-03',
+    output_format='pddf', store=store)
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = default_store_path()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS prices (ticker TEXT, ' +
+            ', '.join(f + ' ' + _TYPES.get(f, 'REAL') for f in PRICE_FIELDS) +
+            ', PRIMARY KEY (ticker, date)) WITHOUT ROWID')
+        # start is the first date a ticker was synced from, NULL when it was
+        # synced from the start of its history
+        self._db.execute('CREATE TABLE IF NOT EXISTS synced ('
+                         'ticker TEXT PRIMARY KEY, start TEXT)')
+        self._db.commit()
+
+    def put(self, ticker, stock_prices):
+        """
+        Store stock prices (objects with the PRICE_FIELDS attributes) of a
+        ticker, replacing the rows stored for the same dates.
+        """
+        rows = []
+        for p in stock_prices:
+            # PRICE_FIELDS starts with the date, stored in ISO format
+            row = [getattr(p, f) for f in PRICE_FIELDS]
+            row[0] = _to_date(row[0]).isoformat()
+            rows.append([ticker] + row)
+        with self._lock:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO prices VALUES (' +
+                ', '.join('?' * (len(PRICE_FIELDS) + 1)) + ')', rows)
+            self._db.commit()
+
+    def get(self, ticker, start_date=None, end_date=None):
+        """
+        Return the stored prices of a ticker between the dates (date
+        objects or "%Y-%m-%d" strings, both included), newest first like the
+        Intrinio API.
+        """
+        query = 'SELECT ' + ', '.join(PRICE_FIELDS) + \
+            ' FROM prices WHERE ticker = ?'
+        args = [ticker]
+        if start_date is not None:
+            query += ' AND date >= ?'
+            args.append(_to_date(start_date).isoformat())
+        if end_date is not None:
+            query += ' AND date <= ?'
+            args.append(_to_date(end_date).isoformat())
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY date DESC',
+                                    args).fetchall()
+        prices = []
+        for row in rows:
+            price = SimpleNamespace(**dict(zip(PRICE_FIELDS, row)))
+            price.date = _to_date(price.date)
+            price.intraperiod = None if price.intraperiod is None else \
+                bool(price.intraperiod)
+            prices.append(price)
+        return prices
+
+    def last_date(self, ticker):
+        """Return the date of the last stored bar of a ticker, or None."""
+        with self._lock:
+            value = self._db.execute(
+                'SELECT MAX(date) FROM prices WHERE ticker = ?',
+                (ticker,)).fetchone()[0]
+        return None if value is None else _to_date(value)
+
+    def synced_from(self, ticker):
+        """
+        Return a tuple (synced, start): whether the ticker was ever synced
+        and the first date it was synced from (None for the start of its
+        history).
+        """
+        with self._lock:
+            row = self._db.execute('SELECT start FROM synced WHERE ticker = ?',
+                                   (ticker,)).fetchone()
+        if row is None:
+            return False, None
+        return True, None if row[0] is None else _to_date(row[0])
+
+    def save_sync(self, ticker, start_date, stock_prices):
+        """
+        Store the prices requested for the windows given by missing() and
+        record that the ticker is now stored from start_date (None for the
+        start of its history) to its last bar.
+        """
+        synced, synced_start = self.synced_from(ticker)
+        start_date = _synced_start(synced, synced_start, start_date)
+        self.put(ticker, stock_prices)
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO synced VALUES (?, ?)',
+                (ticker, None if start_date is None
+                 else _to_date(start_date).isoformat()))
+            self._db.commit()
+
+    def missing(self, ticker, start_date=None, end_date=None, overlap=5):
+        """
+        Return the windows to request from the API to bring the stored
+        prices of a ticker up to date between the dates: the history before
+        the stored rows, if they do not reach back to start_date, and the
+        days after the last stored bar (and overlap days before it), if they
+        do not reach end_date.
+
+        Parameters
+        -----------
+        ticker : str
+            the ticker symbol
+        start_date : date (optional)
+            the earliest date needed, None for the start of the history
+        end_date : date (optional)
+            the most recent date needed, None for today
+        overlap : int (optional, default = 5)
+            the number of days before the last stored bar requested again,
+            to pick up revised adjusted values
+
+        Returns
+        -----------
+        list
+            the (start_date, end_date) windows to request, empty when the
+            store is up to date
+        """
+        synced, synced_start = self.synced_from(ticker)
+        return _missing_windows(synced, synced_start, self.last_date(ticker),
+                                start_date, end_date, overlap)
+
+    def tickers(self):
+        """Return the stored tickers."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                'SELECT ticker FROM synced ORDER BY ticker')]
+
+    def delete(self, ticker):
+        """Remove the prices of a ticker."""
+        with self._lock:
+            self._db.execute('DELETE FROM prices WHERE ticker = ?', (ticker,))
+            self._db.execute('DELETE FROM synced WHERE ticker = ?', (ticker,))
+            self._db.commit()
+
+    def __contains__(self, ticker):
+        return self.synced_from(ticker)[0]
+
+
+def _missing_windows(synced, synced_start, last, start_date, end_date,
+                     overlap):
+    """
+    Return the windows missing from a stored history, given whether it was
+    ever synced, the first date it was synced from and its last bar, see
+    PriceStore.missing
+    """
+    if not synced or last is None:
+        return [(start_date, end_date)]
+    windows = []
+    if synced_start is not None and (start_date is None or
+                                     start_date < synced_start):
+        windows.append((start_date, synced_start - timedelta(days=1)))
+    if end_date is None or end_date > last:
+        # from the last stored bar, even if start_date is later, so that
+        # the stored rows stay contiguous
+        windows.append((last - timedelta(days=overlap), end_date))
+    return windows
+
+
+def _synced_start(synced, synced_start, start_date):
+    """
+    Return the first date a history is stored from once the windows
+    missing from start_date are saved
+    """
+    if start_date is not None and synced and (
+            synced_start is None or synced_start < start_date):
+        return synced_start
+    return start_date
+
+
+def price_store(store):
+    """
+    Return the PriceStore named by the store argument of the gather_*
+    functions: a PriceStore is used as is, True means the default_store()
+    and False or None mean no store.
+    """
+    if store is True:
+        return default_store()
+    if store is None or store is False:
+        return None
+    return store
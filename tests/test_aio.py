@@ -0,0 +1,199 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.aio
+
+from pyntrinio.aio import (agather_financial_statement_time_series,
+                           agather_financial_statement_company_compare,
+                           agather_stock_time_series,
+                           agather_stock_returns)
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare,
+                                 gather_stock_time_series,
+                                 gather_stock_returns)
+from pyntrinio.sources import ReplaySource, RecordingSource
+from pytest import fixture, raises
+import asyncio
+import threading
+
+# helper data
+api_key = 'replay'
+ticker = ['AAPL'] + ['C' + str(n) for n in range(19)]
+year = ['2018', '2019']
+period = ['Q1', 'Q2', 'Q3', 'Q4']
+
+
+@fixture
+def source():
+    """
+    Return a source serving the filings and prices of every ticker
+    """
+    return ReplaySource.synthetic(
+        ticker, years=year, periods=period, statements=['income_statement'],
+        n_tags=5, n_rows=300)
+
+
+def test_same_results_as_sync(source):
+    """
+    Test that the async functions return the same results as the sync ones
+    """
+    assert asyncio.run(agather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', year, period,
+        output_format='dict', source=source)) == \
+        gather_financial_statement_time_series(
+            api_key, 'AAPL', 'income_statement', year, period,
+            output_format='dict', source=source)
+    assert asyncio.run(agather_financial_statement_company_compare(
+        api_key, ticker, 'income_statement', '2019', 'Q1',
+        source=source)) == \
+        gather_financial_statement_company_compare(
+            api_key, ticker, 'income_statement', '2019', 'Q1',
+            source=source)
+    assert asyncio.run(agather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-06-03', source=source)) == \
+        gather_stock_time_series(
+            api_key, 'AAPL', start_date='2019-06-03', source=source)
+    assert asyncio.run(agather_stock_returns(
+        api_key, ticker[:3], '2019-06-01', '2019-12-01',
+        source=source)).equals(gather_stock_returns(
+            api_key, ticker[:3], '2019-06-01', '2019-12-01',
+            source=source))
+
+
+class Gathering:
+    """
+    Stand-in for a source with coroutine endpoints, every request waiting
+    until the others are in flight too
+    """
+
+    def __init__(self, source, parties):
+        self.source = source
+        self.parties = parties
+        self.in_flight = 0
+        self.gathered = asyncio.Event()
+
+    async def aget_fundamental_reported_financials(self, key):
+        self.in_flight += 1
+        if self.in_flight == self.parties:
+            self.gathered.set()
+        await asyncio.wait_for(self.gathered.wait(), timeout=10)
+        return self.source.get_fundamental_reported_financials(key)
+
+
+def test_concurrency(source):
+    """
+    Test that the requests are in flight at the same time
+    """
+    gathering = Gathering(source, len(ticker))
+    result = asyncio.run(agather_financial_statement_company_compare(
+        api_key, ticker, 'income_statement', '2019', 'Q1', source=gathering,
+        max_concurrency=20))
+    assert gathering.gathered.is_set()
+    assert [r['ticker'] for r in result] == ticker
+
+
+def test_blocking_source(source):
+    """
+    Test that sources without coroutine endpoints run in the executor
+    """
+    recorder = RecordingSource(source)
+    result = asyncio.run(agather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', year, period, source=recorder))
+    assert result.shape[0] == 8
+    assert recorder.replay.to_dict()['fundamentals'].keys() == {
+        'AAPL-income_statement-' + i + '-' + j for i in year for j in period}
+
+
+class Blocking:
+    """
+    Stand-in for the live API: blocking endpoints only, every one of them
+    waiting for the others at a barrier
+    """
+
+    def __init__(self, source, parties):
+        self.source = source
+        self.barrier = threading.Barrier(parties, timeout=10)
+
+    def get_fundamental_reported_financials(self, key):
+        self.barrier.wait()
+        return self.source.get_fundamental_reported_financials(key)
+
+
+def test_blocking_concurrency(source):
+    """
+    Test that max_concurrency blocking requests are in flight at once,
+    more than the default executor of the event loop runs
+    """
+    blocking = Blocking(source, len(ticker))
+    result = asyncio.run(agather_financial_statement_company_compare(
+        api_key, ticker, 'income_statement', '2019', 'Q1', source=blocking,
+        max_concurrency=len(ticker)))
+    assert [r['ticker'] for r in result] == ticker
+    assert not blocking.barrier.broken
+
+
+def test_validation_is_shared(source):
+    """
+    Test that the inputs are validated like in the sync functions
+    """
+    with raises(TypeError):
+        asyncio.run(agather_financial_statement_time_series(
+            api_key, 123, 'income_statement', year, period))
+    assert asyncio.run(agather_stock_time_series(api_key, 123)) == \
+        "Invalid data format: ticker must be a string"
+    assert asyncio.run(agather_stock_returns(
+        api_key, 'AAPL', '2019-01-01', '2017-01-01')) == \
+        "Invalid Input: sell_date must be later than buy_date"
+    msg = "Invalid agruments: please make sure that your statement"
+    msg = msg + "/year/period are valid"
+    assert asyncio.run(agather_financial_statement_company_compare(
+        api_key, ['AAPL', 'MISSING'], 'income_statement', '2019', 'Q1',
+        source=source)) == msg
+    assert asyncio.run(agather_stock_returns(
+        api_key, ['AAPL', 'MISSING'], '2019-06-03', '2019-12-02',
+        source=source)) == \
+        "Invalid ticker: no stock prices found for MISSING"
+
+
+def test_all_pages(source):
+    """
+    Test that the async stock time series follows the pages too
+    """
+    results = asyncio.run(agather_stock_time_series(
+        api_key, 'AAPL', output_format='pddf', source=source,
+        all_pages=True))
+    assert results.shape[0] == 300
+    assert source.calls['stock_prices'] == 3
+
+
+def test_stock_returns_requests(source):
+    """
+    Test that the async stock returns prices each ticker with one request
+    """
+    result = asyncio.run(agather_stock_returns(
+        api_key, ticker + ticker[:2], '2019-06-01', '2019-12-01',
+        source=source))
+    assert source.calls['stock_prices'] == len(ticker)
+    assert list(result['Stock']) == ticker + ticker[:2]
+
+
+def test_stock_returns_no_prices():
+    """
+    Test that the async stock returns report a ticker without prices between
+    the dates by name
+    """
+    source = ReplaySource.synthetic(['LATE'], n_rows=100,
+                                    end_date='2021-12-31')
+    assert asyncio.run(agather_stock_returns(
+        api_key, ['LATE'], '2019-01-01', '2019-12-31', source=source)) == \
+        "Invalid ticker: no stock prices found for LATE"
+
+
+def test_stock_panel(source):
+    """
+    Test that the async panel of several tickers is the sync one
+    """
+    for layout in ['long', 'multiindex']:
+        assert asyncio.run(agather_stock_time_series(
+            api_key, ticker[:5], output_format='pddf', source=source,
+            all_pages=True, layout=layout)).equals(gather_stock_time_series(
+                api_key, ticker[:5], output_format='pddf', source=source,
+                all_pages=True, layout=layout))
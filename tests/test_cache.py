@@ -0,0 +1,139 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.cache
+
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare)
+from pyntrinio.cache import (FilingCache, CachedSource, cached_source,
+                             default_cache)
+from pyntrinio.sources import ReplaySource
+from pytest import fixture
+import asyncio
+import threading
+from pyntrinio.aio import agather_financial_statement_time_series
+
+# helper data
+api_key = 'replay'
+year = ['2018', '2019']
+period = ['Q1', 'Q2']
+
+
+@fixture
+def source():
+    """
+    Return a source serving the income statements of AAPL and CSCO
+    """
+    return ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=year, periods=period,
+        statements=['income_statement'], n_tags=4)
+
+
+def test_cache_persists(tmp_path, source):
+    """
+    Test that cached filings are read back from disk instead of the source
+    """
+    path = str(tmp_path / 'filings.sqlite')
+    first = gather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', year, period,
+        output_format='dict', source=source, cache=FilingCache(path))
+    assert source.calls['reported_financials'] == 4
+
+    cache = FilingCache(path)
+    second = gather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', year, period,
+        output_format='dict', source=source, cache=cache)
+    assert source.calls['reported_financials'] == 4
+    assert first == second
+    assert cache.stats()['hits'] == 4
+    assert cache.stats()['misses'] == 0
+    assert 'AAPL-income_statement-2019-Q2' in cache
+
+
+def test_lru_eviction(source):
+    """
+    Test that the least recently used filings are evicted
+    """
+    cache = FilingCache(':memory:', max_entries=2)
+    source = CachedSource(source, cache)
+    source.get_fundamental_reported_financials('AAPL-income_statement-2018-Q1')
+    source.get_fundamental_reported_financials('AAPL-income_statement-2018-Q2')
+    source.get_fundamental_reported_financials('AAPL-income_statement-2018-Q1')
+    source.get_fundamental_reported_financials('AAPL-income_statement-2019-Q1')
+    assert len(cache) == 2
+    assert 'AAPL-income_statement-2018-Q1' in cache
+    assert 'AAPL-income_statement-2018-Q2' not in cache
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 3
+
+
+def test_opt_out(source):
+    """
+    Test that cache=False and given sources without cache are not cached
+    """
+    assert cached_source(source, False) is source
+    assert cached_source(source, None) is source
+    for n in range(2):
+        gather_financial_statement_company_compare(
+            api_key, ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1',
+            source=source, cache=False)
+    # two companies, twice
+    assert source.calls['reported_financials'] == 4
+
+
+def test_async_cache(source):
+    """
+    Test that the async functions share the cache
+    """
+    cache = FilingCache(':memory:')
+    for n in range(2):
+        asyncio.run(agather_financial_statement_time_series(
+            api_key, 'AAPL', 'income_statement', year, period,
+            source=source, cache=cache))
+    assert source.calls['reported_financials'] == 4
+    assert cache.hits == 4
+
+    # the SQLite calls run in the executor, not on the event loop
+    threads = set()
+    cache._db.set_trace_callback(
+        lambda statement: threads.add(threading.current_thread()))
+    asyncio.run(agather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', year, period,
+        source=source, cache=cache))
+    assert threads and threading.main_thread() not in threads
+
+
+def test_no_table_scans(tmp_path):
+    """
+    Test that reads and writes do not count the filings or look for the
+    last use, and that the count survives reopening the cache
+    """
+    path = str(tmp_path / 'filings.sqlite')
+    cache = FilingCache(path, max_entries=3)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    for n in range(5):
+        cache.put('key' + str(n), [{'tag': 'revenue'}])
+        cache.get('key0')
+    cache.put('key4', [{'tag': 'cost'}])
+    assert not [s for s in statements if 'COUNT' in s or 'MAX' in s]
+    assert len(cache) == 3
+    assert 'key0' in cache and 'key1' not in cache
+    cache = FilingCache(path, max_entries=3)
+    cache.put('key5', [])
+    assert len(cache) == 3
+    assert cache.get('key4') == [{'tag': 'cost'}]
+
+
+def test_default_cache_is_shared(tmp_path, monkeypatch):
+    """
+    Test that threads asking for the default cache at once share one
+    """
+    monkeypatch.setenv('PYNTRINIO_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr('pyntrinio.cache._default_cache', None)
+    caches = []
+    threads = [threading.Thread(target=lambda: caches.append(
+        default_cache())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, caches))) == 1
@@ -0,0 +1,70 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.calendars
+
+from pyntrinio.calendars import TradingCalendar, nyse_calendar, nyse_holidays
+from pyntrinio.pyntrinio import gather_stock_time_series
+from pyntrinio.sources import ReplaySource
+from pyntrinio.store import PriceStore
+from datetime import date
+import numpy as np
+
+
+def test_nyse_holidays():
+    """
+    Test the holiday rules against published NYSE calendars
+    """
+    assert nyse_holidays(2019) == [
+        date(2019, 1, 1), date(2019, 1, 21), date(2019, 2, 18),
+        date(2019, 4, 19), date(2019, 5, 27), date(2019, 7, 4),
+        date(2019, 9, 2), date(2019, 11, 28), date(2019, 12, 25)]
+    # Saturday New Year is not observed, Sunday Juneteenth is on Monday
+    holidays = nyse_holidays(2022)
+    assert date(2021, 12, 31) not in holidays
+    assert date(2022, 6, 20) in holidays
+    assert date(2022, 12, 26) in holidays
+    calendar = nyse_calendar()
+    assert calendar is nyse_calendar(date.today().year + 1)
+    assert nyse_calendar(2019).sessions[-1] == np.datetime64('2019-12-31')
+    sessions = {2001: 248, 2012: 250, 2019: 252, 2020: 253, 2023: 250}
+    for year, n in sessions.items():
+        assert len(calendar.between(str(year) + '-01-01',
+                                    str(year) + '-12-31')) == n
+
+
+def test_snapping():
+    """
+    Test that dates are snapped to the sessions around them
+    """
+    calendar = nyse_calendar()
+    assert calendar.is_trading_day('2019-12-24')
+    assert not calendar.is_trading_day('2019-12-25')
+    assert calendar.next_trading_day('2019-12-25') == date(2019, 12, 26)
+    assert calendar.previous_trading_day('2019-12-25') == date(2019, 12, 24)
+    # the exchange closed for four days after 9/11
+    assert calendar.next_trading_day('2001-09-11') == date(2001, 9, 17)
+    assert calendar.offset('2019-12-25', 2) == date(2019, 12, 30)
+    assert calendar.offset('2019-12-25', -2) == date(2019, 12, 20)
+    assert calendar.offset('1989-12-29', -1) is None
+    assert calendar.offset('1985-01-02', 9) is None
+    assert calendar.offset('2200-01-02', -9) is None
+    snapped = calendar.snap(['2019-12-25', '2019-12-28', '1989-01-01'],
+                            forward=False)
+    assert list(snapped[:2]) == [np.datetime64('2019-12-24'),
+                                 np.datetime64('2019-12-27')]
+    assert np.isnat(snapped[2])
+
+
+def test_from_store():
+    """
+    Test that a calendar is collected from the dates of a store
+    """
+    store = PriceStore(':memory:')
+    source = ReplaySource.synthetic(['AAPL', 'CSCO'], n_rows=20,
+                                    end_date='2019-12-31')
+    gather_stock_time_series('replay', 'AAPL', source=source, store=store)
+    calendar = TradingCalendar.from_store(store)
+    assert len(calendar) == 20
+    assert calendar.next_trading_day('2019-12-28') == date(2019, 12, 30)
+    assert calendar.next_trading_day('2020-01-01') is None
+    assert len(TradingCalendar(['2019-12-31', date(2019, 12, 30),
+                                '2019-12-31'])) == 2
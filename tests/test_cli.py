@@ -0,0 +1,203 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.cli and pyntrinio.export
+
+from pyntrinio.cli import main, read_tickers
+from pyntrinio.export import (WRITERS, CsvWriter, stream_to_files,
+                              write_fundamentals)
+from pyntrinio.pyntrinio import (iter_financial_statement_company_compare,
+                                 iter_financial_statement_time_series)
+from pyntrinio.sources import ReplaySource
+from pytest import fixture, importorskip, raises
+import csv
+import os
+import threading
+
+# helper data
+year = ['2018', '2019']
+period = ['Q1', 'Q2']
+
+
+@fixture
+def source():
+    """
+    Return a source serving the filings and prices extracted by the CLI
+    """
+    return ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=year, periods=period,
+        statements=['income_statement'], n_tags=3, n_rows=250,
+        end_date='2019-12-31')
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_prices(tmp_path, source):
+    """
+    Test that the prices of every ticker are streamed to their own file,
+    and that failed tickers are reported without stopping the others
+    """
+    universe = tmp_path / 'universe.txt'
+    universe.write_text('# tickers\nAAPL\n\nMSFT\n')
+    out = str(tmp_path / 'prices')
+    status = main(['prices', '--tickers', str(universe), 'CSCO,AAPL',
+                   '--start', '2019-06-01', '--out', out, '--page-size',
+                   '50', '--buffer', '2', '--workers', '2'],
+                  source=source)
+    assert status == 1
+    assert sorted(os.listdir(out)) == ['.checkpoint.jsonl', 'AAPL.csv',
+                                       'CSCO.csv']
+    rows = read_csv(os.path.join(out, 'AAPL.csv'))
+    assert rows[0]['date'] == '2019-12-31'
+    assert rows[-1]['date'] >= '2019-06-01'
+    assert len(rows) == len({row['date'] for row in rows})
+    assert read_tickers([str(universe), 'CSCO,AAPL']) == ['AAPL', 'MSFT',
+                                                          'CSCO']
+
+
+def test_fundamentals(tmp_path, source):
+    """
+    Test that the filings are streamed as long rows, one page per filing
+    """
+    out = str(tmp_path / 'fundamentals')
+    status = main(['fundamentals', '--tickers', 'AAPL,CSCO', '--statement',
+                   'income_statement', '--years'] + year + ['--periods'] +
+                  period + ['--out', out], source=source)
+    assert status == 0
+    rows = read_csv(os.path.join(out, 'CSCO.csv'))
+    assert len(rows) == 4 * 3
+    assert rows[0] == {'ticker': 'CSCO', 'statement': 'income_statement',
+                       'year': '2018', 'period': 'Q1', 'tag': 'tag_0',
+                       'value': '1.0'}
+
+
+def test_resume(tmp_path, capsys, source):
+    """
+    Test that running a command again only extracts the missing tickers
+    """
+    out = str(tmp_path / 'prices')
+    argv = ['prices', '--tickers', 'AAPL,CSCO,MSFT', '--out', out]
+    assert main(argv, source=source) == 1
+    calls = source.calls['stock_prices']
+    # the failed ticker is requested again, the others are skipped
+    assert main(argv, source=source) == 1
+    assert source.calls['stock_prices'] == calls + 1
+    assert 'skipped 2 tickers' in capsys.readouterr().err
+    # a deleted file is extracted again, as are other dates
+    os.remove(os.path.join(out, 'AAPL.csv'))
+    main(argv, source=source)
+    assert source.calls['stock_prices'] == calls + 3
+    main(argv + ['--start', '2019-01-01'], source=source)
+    assert source.calls['stock_prices'] == calls + 6
+
+
+def test_parquet(tmp_path, source):
+    """
+    Test that the files are written as Parquet, one row group per page
+    """
+    pq = importorskip('pyarrow.parquet')
+    out = str(tmp_path / 'prices')
+    assert main(['prices', '--tickers', 'AAPL', '--out', out, '--format',
+                 'parquet', '--page-size', '100'], source=source) == 0
+    parquet = pq.ParquetFile(os.path.join(out, 'AAPL.parquet'))
+    assert parquet.metadata.num_rows == 250
+    assert parquet.metadata.num_row_groups == 3
+    assert str(parquet.schema_arrow.field('date').type) == 'date32[day]'
+
+
+def test_invalid_arguments(tmp_path, capsys, source):
+    """
+    Test that invalid arguments stop the command before any request
+    """
+    out = str(tmp_path / 'out')
+    with raises(SystemExit):
+        main(['prices', '--tickers', 'AAPL', '--start', '2019/01/01',
+              '--out', out], source=source)
+    with raises(SystemExit):
+        main(['fundamentals', '--tickers', 'AAPL', '--statement',
+              'income_statement', '--years', '19', '--periods', 'Q1',
+              '--out', out], source=source)
+    with raises(SystemExit):
+        main(['prices', '--tickers', 'AAPL', '--out', out, '--api-key', ''])
+    assert 'API key' in capsys.readouterr().err
+    assert sum(source.calls.values()) == 0
+    assert not os.path.exists(out)
+
+
+class CountingWriter(CsvWriter):
+    """
+    CsvWriter that records how many pages were produced but not written yet
+    """
+
+    produced = 0
+    written = 0
+    waiting = []
+    lock = threading.Lock()
+
+    def write(self, columns):
+        with CountingWriter.lock:
+            CountingWriter.written += 1
+        super().write(columns)
+
+
+def test_bounded_buffer(tmp_path, monkeypatch):
+    """
+    Test that the fetching threads wait for the pages to be written, and
+    that an interrupted export leaves no unfinished file
+    """
+    monkeypatch.setitem(WRITERS, 'counting', CountingWriter)
+
+    def pages(ticker):
+        for n in range(20):
+            with CountingWriter.lock:
+                CountingWriter.produced += 1
+                CountingWriter.waiting.append(
+                    CountingWriter.produced - CountingWriter.written)
+            yield {'n': [n]}
+
+    summary = stream_to_files(['T' + str(n) for n in range(10)], pages,
+                              str(tmp_path / 'out'), ['n'], 'counting',
+                              max_workers=4, buffer=3)
+    assert sum(summary['rows'].values()) == 200
+    # the buffer, a page in the hands of every thread and the page written
+    assert max(CountingWriter.waiting) <= 3 + 4 + 1
+
+    def interrupt(ticker, path, rows):
+        raise KeyboardInterrupt
+
+    folder = str(tmp_path / 'interrupted')
+    with raises(KeyboardInterrupt):
+        stream_to_files(['T' + str(n) for n in range(10)], pages, folder,
+                        ['n'], max_workers=4, buffer=1, on_done=interrupt)
+    assert len(os.listdir(folder)) == 1
+    assert not any(name.endswith('.part') for name in os.listdir(folder))
+    with raises(ValueError):
+        stream_to_files(['T0'], pages, folder, ['n'], 'xlsx')
+
+
+def test_write_fundamentals(tmp_path, source):
+    """
+    Test that filing records are written to one file in chunks of long
+    rows, and that a failure leaves no file behind
+    """
+    path = str(tmp_path / 'funda' / 'aapl.csv')
+    records = iter_financial_statement_time_series(
+        'replay', 'AAPL', 'income_statement', year, period, source=source)
+    assert write_fundamentals(records, path, chunk_size=5) == 4 * 3
+    rows = read_csv(path)
+    assert len(rows) == 12
+    assert rows[0]['ticker'] == 'AAPL' and rows[-1]['period'] == 'Q2'
+    assert os.listdir(str(tmp_path / 'funda')) == ['aapl.csv']
+    path = str(tmp_path / 'compare.csv')
+    assert write_fundamentals(iter_financial_statement_company_compare(
+        'replay', ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1',
+        source=source), path) == 2 * 3
+    assert [row['ticker'] for row in read_csv(path)] == ['AAPL'] * 3 + \
+        ['CSCO'] * 3
+    with raises(Exception):
+        write_fundamentals(iter_financial_statement_company_compare(
+            'replay', ['AAPL', 'MSFT'], 'income_statement', '2019', 'Q1',
+            source=source), str(tmp_path / 'failed.csv'), chunk_size=1)
+    assert not any(name.startswith('failed')
+                   for name in os.listdir(str(tmp_path)))
@@ -0,0 +1,78 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.client
+
+from pyntrinio.client import PyntrinioClient, get_client
+from pyntrinio.pyntrinio import gather_stock_returns
+from pyntrinio.sources import ReplaySource
+import asyncio
+import intrinio_sdk
+
+# helper data
+api_key = 'client-test-key'
+
+
+def replay_client():
+    """
+    Return a client whose endpoints are served by a ReplaySource
+    """
+    replay = ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3, n_rows=300)
+    client = PyntrinioClient(api_key, cache=False)
+    client.get_fundamental_reported_financials = \
+        replay.get_fundamental_reported_financials
+    client.get_security_stock_prices = replay.get_security_stock_prices
+    return client, replay
+
+
+def test_shared_client():
+    """
+    Test that the module functions share one client per API key
+    """
+    client = get_client(api_key)
+    assert get_client(api_key) is client
+    assert get_client('another-key') is not client
+    # a larger pool replaces the shared client, whose pool is closed
+    pools = client.api_client.rest_client.pool_manager
+    pools.connection_from_host('api-v2.intrinio.com', 443, 'https')
+    assert len(pools.pools) == 1
+    bigger = get_client(api_key, max_connections=64)
+    assert bigger.max_connections == 64
+    assert len(pools.pools) == 0
+    assert get_client(api_key, max_connections=16) is bigger
+
+
+def test_pooled_configuration():
+    """
+    Test that a client has its own key and a pool of the requested size
+    """
+    with PyntrinioClient(api_key, max_connections=32) as client:
+        assert client.api_client.configuration.api_key == {
+            'api_key': api_key}
+        assert client.api_client.rest_client.pool_manager \
+            .connection_pool_kw['maxsize'] == 32
+        assert client.api_client.default_headers['Connection'] == \
+            'keep-alive'
+        assert client.fundamentals_api.api_client is client.api_client
+        assert client.security_api.api_client is client.api_client
+    # the default configuration is left untouched
+    assert intrinio_sdk.Configuration().api_key.get('api_key') != api_key
+
+
+def test_client_methods():
+    """
+    Test that the methods of the client read from the client
+    """
+    client, replay = replay_client()
+    series = client.gather_financial_statement_time_series(
+        'AAPL', 'income_statement', ['2019'], ['Q1'], output_format='dict')
+    assert series[0]['tag_0'] == [1.0]
+    returns = client.gather_stock_returns(
+        ['AAPL', 'CSCO'], '2019-06-01', '2019-12-01', max_workers=2)
+    assert returns.equals(gather_stock_returns(
+        api_key, ['AAPL', 'CSCO'], '2019-06-01', '2019-12-01',
+        source=replay))
+    prices = asyncio.run(client.agather_stock_time_series(
+        'AAPL', output_format='pddf', all_pages=True))
+    assert prices.shape[0] == 300
+    assert replay.calls['reported_financials'] == 1
@@ -0,0 +1,161 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.columnar
+
+from pyntrinio.columnar import ColumnStore
+from pyntrinio.pyntrinio import gather_stock_time_series
+from pyntrinio.sources import ReplaySource
+from pyntrinio.store import PriceStore
+from datetime import date
+from pytest import fixture
+import numpy as np
+import os
+import threading
+
+# helper data
+api_key = 'replay'
+tickers = ['AAPL', 'CSCO', 'BRK/B']
+
+
+@fixture
+def source():
+    """
+    Return a source serving 500 days of prices of every ticker, up to
+    2019-12-31
+    """
+    return ReplaySource.synthetic(tickers, n_rows=500, end_date='2019-12-31')
+
+
+def test_same_output_as_price_store(tmp_path, source):
+    """
+    Test that a ColumnStore returns what a PriceStore returns
+    """
+    columns = ColumnStore(str(tmp_path / 'columns'))
+    rows = PriceStore(':memory:')
+    for output_format in ['pddf', 'dict']:
+        for store in [columns, rows]:
+            gather_stock_time_series(
+                api_key, 'AAPL', start_date='2018-06-01',
+                output_format=output_format, source=source,
+                store=store)
+        assert str(gather_stock_time_series(
+            api_key, 'AAPL', start_date='2018-06-01',
+            end_date='2019-06-28', output_format=output_format,
+            source=source, store=columns)) == \
+            str(gather_stock_time_series(
+                api_key, 'AAPL', start_date='2018-06-01',
+                end_date='2019-06-28', output_format=output_format,
+                source=source, store=rows))
+    frame = columns.frame('AAPL', '2018-06-01', '2019-06-28')
+    assert frame.equals(rows_frame(rows, source))
+
+
+def rows_frame(rows, source):
+    return gather_stock_time_series(
+        api_key, 'AAPL', start_date='2018-06-01', end_date='2019-06-28',
+        output_format='pddf', source=source, store=rows)
+
+
+def test_zero_copy_columns(tmp_path, source):
+    """
+    Test that the columns are read-only views of the mapped files
+    """
+    store = ColumnStore(str(tmp_path))
+    gather_stock_time_series(api_key, 'BRK/B', source=source,
+                             store=store)
+    columns = store.columns('BRK/B', '2019-01-01', '2019-12-31')
+    mapped = store._mapped['BRK/B'][1]
+    assert isinstance(mapped['prices'], np.memmap)
+    assert np.shares_memory(columns['adj_close'], mapped['prices'])
+    assert columns['adj_close'].flags['C_CONTIGUOUS']
+    assert not columns['adj_close'].flags['WRITEABLE']
+    assert columns['date'][0] == np.datetime64('2019-01-01')
+    assert columns['date'][-1] == np.datetime64('2019-12-31')
+    assert store.tickers() == ['BRK/B']
+
+
+def test_incremental_versions(tmp_path, source):
+    """
+    Test that a sync writes a new version and keeps the previous one for
+    the readers that loaded it, until it is pruned
+    """
+    store = ColumnStore(str(tmp_path))
+    old = ReplaySource.synthetic(tickers, n_rows=500, end_date='2019-12-20')
+    gather_stock_time_series(api_key, 'AAPL', source=old, store=store)
+    reader = ColumnStore(str(tmp_path))
+    stale = reader.columns('AAPL')
+    gather_stock_time_series(api_key, 'AAPL', source=source, store=store)
+    assert source.calls['stock_prices'] == 1
+    assert store.last_date('AAPL') == date(2019, 12, 31)
+    assert len(store.columns('AAPL')['date']) == 507
+    folder = os.path.join(str(tmp_path), 'AAPL')
+    assert sorted(os.listdir(folder)) == ['.lock', '0', '1', 'meta.json']
+    assert stale['date'][-1] == np.datetime64('2019-12-20')
+    store.prune()
+    assert sorted(os.listdir(folder)) == ['.lock', '1', 'meta.json']
+    assert reader.last_date('AAPL') == date(2019, 12, 31)
+    # without a grace period the next sync deletes the superseded version
+    eager = ColumnStore(str(tmp_path), grace=0)
+    eager.save_sync('AAPL', None, source.get_security_stock_prices(
+        'AAPL', page_size=5).stock_prices)
+    assert sorted(os.listdir(folder)) == ['.lock', '2', 'meta.json']
+    # a second ColumnStore reads what the first one wrote
+    assert ColumnStore(str(tmp_path)).get('AAPL', '2019-12-31')[0].adj_close \
+        == source.get_security_stock_prices('AAPL').stock_prices[0].adj_close
+
+
+def test_concurrent_writers(tmp_path, source):
+    """
+    Test that writers syncing the same ticker at the same time take turns,
+    so that none of their rows is lost
+    """
+    prices = source.get_security_stock_prices(
+        'AAPL', page_size=500).stock_prices
+    chunks = [prices[n::8] for n in range(8)]
+
+    def write(chunk):
+        ColumnStore(str(tmp_path)).save_sync('AAPL', None, chunk)
+
+    threads = [threading.Thread(target=write, args=(chunk,))
+               for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store = ColumnStore(str(tmp_path))
+    assert len(store.columns('AAPL')['date']) == 500
+    assert [p.adj_close for p in store.get('AAPL')] == \
+        [p.adj_close for p in prices]
+    assert not any(name.startswith('.tmp-') for name in
+                   os.listdir(os.path.join(str(tmp_path), 'AAPL')))
+
+
+def test_panel(tmp_path, source):
+    """
+    Test that the panel stacks the tickers in one long dataframe
+    """
+    store = ColumnStore(str(tmp_path))
+    for ticker in tickers:
+        gather_stock_time_series(api_key, ticker, start_date='2019-01-01',
+                                 source=source, store=store)
+    panel = store.panel(tickers + ['MISSING'], '2019-07-01', '2019-12-31')
+    assert list(panel.columns[:2]) == ['ticker', 'date']
+    assert list(panel['ticker'].cat.categories) == tickers
+    assert panel.shape[0] == 3 * len(
+        store.columns('AAPL', '2019-07-01')['date'])
+    assert panel['date'].iloc[0] == np.datetime64('2019-07-01')
+    assert str(panel['volume'].dtype) == 'int64'
+
+
+def test_stored_panel(tmp_path, source):
+    """
+    Test that a list of tickers synced into a ColumnStore gives the panel a
+    PriceStore gives
+    """
+    for layout in ['long', 'multiindex']:
+        columns, rows = [gather_stock_time_series(
+            api_key, tickers, start_date='2019-06-03', output_format='pddf',
+            source=source, store=store, layout=layout)
+            for store in [ColumnStore(str(tmp_path / layout)),
+                          PriceStore(':memory:')]]
+        assert columns.shape[0] == 3 * 152
+        assert columns.equals(rows)
@@ -1,9 +1,12 @@
 # Author: Team Andrey Markov
 # tests for gather_financial_statement_company_compare
 
-from pyntrinio.pyntrinio import gather_financial_statement_company_compare
+from pyntrinio.pyntrinio import (gather_financial_statement_company_compare,
+                                 iter_financial_statement_company_compare)
+from pyntrinio.sources import ReplaySource
 from pytest import raises
 import pandas as pd
+import threading
 """
 This script tests the gather_financial_statement_company_compare functions
 in the pyntrinio module.
@@ -142,3 +145,111 @@ def test_year():
     with raises(Exception):
         gather_financial_statement_company_compare(
             api_key, ticker, statement, '97', period)
+
+
+class Blocking:
+    """
+    Stand-in for the live API, every request waiting at a barrier for as
+    many others as there are workers
+    """
+
+    def __init__(self, source, parties):
+        self.source = source
+        self.barrier = threading.Barrier(parties, timeout=10)
+
+    def get_fundamental_reported_financials(self, key):
+        self.barrier.wait()
+        return self.source.get_fundamental_reported_financials(key)
+
+
+def test_max_workers():
+    '''
+    Tests that the companies are requested in parallel and that the results
+    keep the order of ticker
+    '''
+    ticker = ['C' + str(n) for n in range(20)]
+    source = ReplaySource.synthetic(
+        ticker + ['AAPL'], years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3)
+    blocking = Blocking(source, 10)
+    result = gather_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1',
+        source=blocking, max_workers=10)
+    assert not blocking.barrier.broken
+    assert [r['ticker'] for r in result] == ticker
+    assert source.calls['reported_financials'] == 20
+
+    # Check that a failing company still returns the error message
+    msg = "Invalid agruments: please make sure that your statement"
+    msg = msg + "/year/period are valid"
+    assert gather_financial_statement_company_compare(
+        'replay', ticker + ['MISSING'], 'income_statement', '2019', 'Q1',
+        source=source, max_workers=10) == msg
+
+
+def test_iter_financial_statement_company_compare():
+    '''
+    Tests that the companies are yielded one at a time in the order of
+    ticker, and that stopping early does not request the whole universe
+    '''
+    ticker = ['C' + str(n) for n in range(50)]
+    source = ReplaySource.synthetic(
+        ticker, years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3)
+    assert list(iter_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1',
+        source=source)) == gather_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1', source=source)
+    source.calls.clear()
+    records = iter_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1', source=source,
+        max_workers=4)
+    assert [next(records)['ticker'] for _ in range(3)] == ticker[:3]
+    records.close()
+    assert source.calls['reported_financials'] <= 3 + 4
+    # a failing company raises the error of the source when it is reached
+    records = iter_financial_statement_company_compare(
+        'replay', ['C0', 'MISSING'], 'income_statement', '2019', 'Q1',
+        source=source)
+    assert next(records)['ticker'] == 'C0'
+    with raises(Exception):
+        next(records)
+    with raises(TypeError):
+        iter_financial_statement_company_compare(
+            'replay', 'C0', 'income_statement', '2019', 'Q1', source=source)
+
+
+def test_heterogeneous_tags():
+    '''
+    Tests that companies reporting different tags are pivoted into one
+    frame, dense or sparse, with NaN for the tags a company does not report
+    '''
+    ticker = ['C' + str(n) for n in range(2000)]
+    facts = {}
+    for n, comp in enumerate(ticker):
+        # every company reports a common tag and one of 500 others
+        facts[comp + '-income_statement-2019-Q1'] = [
+            {'tag': 'revenue', 'value': float(n), 'balance': 'credit',
+             'name': 'Revenue'},
+            {'tag': 'tag' + str(n % 500), 'value': 1.0, 'balance': 'debit',
+             'name': 'Tag'}]
+    source = ReplaySource(fundamentals=facts)
+    dense = gather_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1',
+        output_format='pddf', source=source)
+    assert source.calls['reported_financials'] == 2000
+    assert dense.shape == (2000, 4 + 1 + 500)
+    assert list(dense.columns[:6]) == ['ticker', 'statement', 'year',
+                                       'period', 'revenue', 'tag0']
+    assert dense['revenue'].tolist() == [float(n) for n in range(2000)]
+    assert dense['tag1'].notna().sum() == 4
+    assert dense.loc[501, 'tag1'] == 1.0
+    assert (dense.dtypes[4:] == 'float64').all()
+
+    sparse = gather_financial_statement_company_compare(
+        'replay', ticker, 'income_statement', '2019', 'Q1',
+        output_format='pddf', source=source, sparse=True)
+    assert isinstance(sparse['tag1'].dtype, pd.SparseDtype)
+    assert sparse['tag1'].sparse.density == 4 / 2000
+    tags = dense.columns[4:]
+    assert sparse[tags].sparse.to_dense().equals(dense[tags])
@@ -3,8 +3,12 @@
 
 # Reference: https://ubc-mds.github.io/py-pkgs/testing.html#pytest-tests
 
-from pyntrinio.pyntrinio import gather_financial_statement_time_series
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 iter_financial_statement_time_series,
+                                 _financial_statement_record)
+from pyntrinio.sources import ReplaySource
 from pytest import raises
+from types import SimpleNamespace
 import pandas as pd
 
 # Sample data for testing
@@ -116,3 +120,88 @@ def test_final_format():
     )
     assert(type(results) == list)
     assert(type(final_df) == pd.core.frame.DataFrame)
+
+
+def test_tag_aggregation():
+    """
+    Test that the values of a tag reported several times are added up, in
+    the order the tags first appear
+    """
+    facts = [{'tag': 'revenue', 'value': 10.0},
+             {'tag': 'cost', 'value': 4.0},
+             {'tag': 'revenue', 'value': 5.0},
+             {'tag': 'revenue', 'value': 1.0}]
+    source = ReplaySource({'CVX-income_statement-2018-Q1': facts})
+    results = gather_financial_statement_time_series(
+        api_key, ticker, statement, ['2018'], ['Q1'], output_format='dict',
+        source=source)
+    assert results == [{'ticker': ticker, 'statement': statement,
+                        'year': '2018', 'period': 'Q1', 'revenue': [16.0],
+                        'cost': [4.0]}]
+
+
+def test_financial_statement_record():
+    """
+    Test that a filing with many facts, most tags reported several times, is
+    aggregated into one total per tag
+    """
+    tags = ['tag' + str(n % 50) for n in range(1000)]
+    funda = SimpleNamespace(reported_financials=[
+        SimpleNamespace(xbrl_tag=SimpleNamespace(tag=tag), value=float(n))
+        for n, tag in enumerate(tags)])
+    record = _financial_statement_record(ticker, statement, '2018', 'Q1',
+                                         funda)
+    assert list(record)[:4] == ['ticker', 'statement', 'year', 'period']
+    assert list(record)[4:] == ['tag' + str(n) for n in range(50)]
+    for n in range(50):
+        assert record['tag' + str(n)] == [float(sum(range(n, 1000, 50)))]
+
+
+def test_parallel_grid():
+    """
+    Test that the years and periods requested in parallel come back in
+    (year, period) order, as when they are requested one after another
+    """
+    years = [str(y) for y in range(2010, 2020)]
+    periods = ['Q1', 'Q2', 'Q3', 'Q4']
+    source = ReplaySource.synthetic(
+        [ticker], years=years, periods=periods, statements=[statement],
+        n_tags=3, latency=0.01)
+    serial = gather_financial_statement_time_series(
+        api_key, ticker, statement, years, periods, output_format='dict',
+        source=source, max_workers=1)
+    parallel = gather_financial_statement_time_series(
+        api_key, ticker, statement, years, periods, output_format='dict',
+        source=source, max_workers=8)
+    assert parallel == serial
+    assert [(r['year'], r['period']) for r in parallel] == [
+        (y, p) for y in years for p in periods]
+    assert source.calls['reported_financials'] == 80
+
+
+def test_iter_financial_statement_time_series():
+    """
+    Test that the filings are yielded one at a time, in the order of the
+    'dict' output, with at most max_workers filings requested ahead
+    """
+    years = [str(y) for y in range(2010, 2020)]
+    periods = ['Q1', 'Q2', 'Q3', 'Q4']
+    source = ReplaySource.synthetic(
+        [ticker], years=years, periods=periods, statements=[statement],
+        n_tags=3)
+    expected = gather_financial_statement_time_series(
+        api_key, ticker, statement, years, periods, output_format='dict',
+        source=source)
+    for max_workers in [1, 4]:
+        source.calls.clear()
+        records = iter_financial_statement_time_series(
+            api_key, ticker, statement, years, periods, source=source,
+            max_workers=max_workers)
+        assert source.calls['reported_financials'] == 0
+        first = next(records)
+        assert first == expected[0]
+        assert source.calls['reported_financials'] <= max_workers + 1
+        assert [first] + list(records) == expected
+    with raises(TypeError):
+        iter_financial_statement_time_series(
+            api_key, 123, statement, years, periods, source=source)
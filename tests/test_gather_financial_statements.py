@@ -0,0 +1,83 @@
+# Author: Team Andrey Markov
+# tests for gather_financial_statements
+
+from pyntrinio.aio import agather_financial_statements
+from pyntrinio.pyntrinio import (gather_financial_statements,
+                                 gather_financial_statement_time_series)
+from pyntrinio.sources import ReplaySource
+from pytest import fixture, raises
+import asyncio
+
+# helper data
+api_key = 'replay'
+statements = ['income_statement', 'cash_flow_statement',
+              'balance_sheet_statement']
+year = ['2018', '2019']
+period = ['Q1', 'Q2']
+
+
+@fixture
+def source():
+    """
+    Return a source serving every statement of the AAPL and CSCO filings
+    """
+    return ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=year, periods=period, statements=statements,
+        n_tags=3, latency=0.01)
+
+
+def test_input_format():
+    """
+    Test that the tickers and statements are validated
+    """
+    with raises(TypeError):
+        gather_financial_statements(api_key, 123, statements, year, period)
+    with raises(TypeError):
+        gather_financial_statements(api_key, 'AAPL', 'income_statement',
+                                    year, period)
+    with raises(Exception):
+        gather_financial_statements(api_key, 'AAPL', ['income_statemen'],
+                                    year, period)
+    with raises(Exception):
+        gather_financial_statements(api_key, 'AAPL', statements, year,
+                                    period, output_format='pdf')
+
+
+def test_wide_records(source):
+    """
+    Test that the statements of a filing are joined on (ticker, year,
+    period) with their tags prefixed, in one request per filing
+    """
+    results = gather_financial_statements(
+        api_key, ['AAPL', 'CSCO'], statements, year, period,
+        output_format='dict', source=source)
+    assert source.calls['reported_financials'] == 2 * 3 * 2 * 2
+    assert [(r['ticker'], r['year'], r['period']) for r in results] == [
+        (t, y, p) for t in ['AAPL', 'CSCO'] for y in year for p in period]
+    assert len(results[0]) == 3 + 3 * 3
+    for stmt in statements:
+        series = gather_financial_statement_time_series(
+            api_key, 'CSCO', stmt, year, period, output_format='dict',
+            source=source)
+        for record, filing in zip(results[4:], series):
+            assert record[stmt + '.tag_1'] == filing['tag_1'][0]
+
+    frame = gather_financial_statements(
+        api_key, 'AAPL', statements, year, period, source=source)
+    assert list(frame.columns[:4]) == ['ticker', 'year', 'period',
+                                       'income_statement.tag_0']
+    assert frame.shape == (4, 12)
+    assert (frame.dtypes[3:] == 'float64').all()
+    assert frame['income_statement.tag_1'].sum() == 4 * 2.0
+    assert asyncio.run(agather_financial_statements(
+        api_key, ['AAPL', 'CSCO'], statements, year, period,
+        output_format='dict', source=source)) == results
+
+
+def test_missing_filing(source):
+    """
+    Test that a missing filing returns an error message
+    """
+    assert gather_financial_statements(
+        api_key, 'MSFT', statements, year, period,
+        source=source).startswith('Invalid agruments')
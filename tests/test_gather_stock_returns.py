@@ -1,7 +1,10 @@
 # Author: Team Andrey Markov
 # tests for gather_stock_returns
 
+from pyntrinio.calendars import TradingCalendar
 from pyntrinio.pyntrinio import gather_stock_returns
+from pyntrinio.sources import ReplaySource, ReplayError
+from datetime import date, timedelta
 
 # helper data
 api_key = 'OjhlMjhjNTBmY2IyMWJiMWE0MTExYjQwNWZmZTVkZWM1'
@@ -46,3 +49,133 @@ def test_date_logic():
     """
     assert gather_stock_returns(
         api_key, 'AAPL', buy_date='2019-01-01', sell_date='2017-01-01') == msg1
+
+
+def test_one_request_per_ticker():
+    """
+    Test that each ticker is priced with a single request when both dates
+    fit in one page, and that duplicated tickers are requested once.
+    """
+    source = ReplaySource.synthetic(['AAPL', 'CSCO'], n_rows=3000)
+    result = gather_stock_returns(
+        api_key, ['AAPL', 'CSCO', 'AAPL'], '2010-01-02', '2019-12-29',
+        source=source, max_workers=2)
+    assert source.calls['stock_prices'] == 2
+    assert list(result['Stock']) == ['AAPL', 'CSCO', 'AAPL']
+    # the buy date moves to the next trading day, the sell date to the last
+    assert list(result['Buy date']) == ['2010-01-04'] * 3
+    assert list(result['Sell date']) == ['2019-12-27'] * 3
+
+
+def test_long_span():
+    """
+    Test that spans longer than one page fall back to two short windows
+    and give the same prices as a single request.
+    """
+    source = ReplaySource.synthetic(['AAPL'], n_rows=8000)
+    long_span = gather_stock_returns(
+        api_key, 'AAPL', '1990-01-01', '2019-12-31', source=source)
+    assert source.calls['stock_prices'] == 2
+    assert long_span['Buy date'][0] == '1990-01-01'
+    assert long_span['Sell date'][0] == '2019-12-31'
+    short_span = gather_stock_returns(
+        api_key, 'AAPL', '1995-01-01', '2019-12-31', source=source)
+    assert source.calls['stock_prices'] == 3
+    assert short_span['Sell price'][0] == long_span['Sell price'][0]
+
+
+class Rejected:
+    """
+    Stand-in for a source that rejects the API key
+    """
+
+    def get_security_stock_prices(self, identifier, **kwargs):
+        raise ReplayError(401, "Unauthorized")
+
+
+def test_missing_ticker():
+    """
+    Test that a ticker without prices is reported by name, and that only a
+    rejected key is reported as a wrong key.
+    """
+    source = ReplaySource.synthetic(['AAPL'], n_rows=100)
+    msg4 = "Invalid ticker: no stock prices found for MISSING"
+    assert gather_stock_returns(
+        api_key, ['MISSING', 'AAPL'], buy_date, sell_date,
+        source=source) == msg4
+    assert gather_stock_returns(
+        api_key, ['AAPL', 'MISSING'], buy_date, sell_date,
+        source=source) == msg4
+    assert gather_stock_returns(
+        api_key, ['MISSING', 'AAPL'], buy_date, sell_date,
+        source=Rejected()) == msg3
+    # a known ticker without prices between the dates, in any position
+    late = ReplaySource.synthetic(['LATE'], n_rows=100,
+                                  end_date='2021-12-31')
+    source.add_stock_prices('LATE', late.to_dict()['stock_prices']['LATE'])
+    for tickers in [['LATE', 'AAPL'], ['AAPL', 'LATE']]:
+        assert gather_stock_returns(
+            api_key, tickers, '2019-06-03', '2019-12-02',
+            source=source) == "Invalid ticker: no stock prices found for LATE"
+
+
+def test_long_gap():
+    """
+    Test that a ticker that did not trade for months around a date of a
+    long span is still priced, by widening the windows of the calendar.
+    """
+    rows = []
+    day = date(1989, 1, 2)
+    while day <= date(2019, 12, 31):
+        # halted from the start of 1990 to April
+        if day.weekday() < 5 and not \
+                date(1990, 1, 1) <= day < date(1990, 4, 2):
+            rows.append({'date': day, 'adj_close': 100.0 + len(rows)})
+        day += timedelta(days=1)
+    source = ReplaySource(stock_prices={'HALT': rows})
+    result = gather_stock_returns(api_key, 'HALT', '1990-01-01',
+                                  '2019-12-31', source=source)
+    assert result['Buy date'][0] == '1990-04-02'
+    assert result['Sell date'][0] == '2019-12-31'
+    # the buy window was widened once, the sell window was complete
+    assert source.calls['stock_prices'] == 4
+    # a calendar built from the prices themselves needs no widening
+    calendar = TradingCalendar([r['date'] for r in rows])
+    assert gather_stock_returns(
+        api_key, 'HALT', '1990-01-01', '2019-12-31', source=source,
+        calendar=calendar).equals(result)
+    assert source.calls['stock_prices'] == 6
+
+
+def test_before_calendar():
+    """
+    Test that a buy date before the first session of the calendar (1990) is
+    priced on its first trading day, not on a row cut off by the page size
+    """
+    rows = []
+    day = date(1980, 1, 1)
+    while day <= date(2020, 1, 3):
+        if day.weekday() < 5:
+            rows.append({'date': day, 'adj_close': 100.0 + len(rows)})
+        day += timedelta(days=1)
+    source = ReplaySource(stock_prices={'OLD': rows})
+    result = gather_stock_returns(api_key, 'OLD', '1985-01-02',
+                                  '2020-01-02', source=source)
+    assert result['Buy date'][0] == '1985-01-02'
+    assert result['Sell date'][0] == '2020-01-02'
+    first = [r for r in rows if r['date'] == date(1985, 1, 2)][0]
+    assert result['Buy price'][0] == first['adj_close']
+
+
+def test_no_prices_in_window():
+    """
+    Test that a ticker listed after the sell date is reported by name, for
+    spans priced with one request and with two
+    """
+    source = ReplaySource.synthetic(['LATE'], n_rows=100,
+                                    end_date='2021-12-31')
+    msg4 = "Invalid ticker: no stock prices found for LATE"
+    assert gather_stock_returns(api_key, 'LATE', '2019-01-01', '2019-12-31',
+                                source=source) == msg4
+    assert gather_stock_returns(api_key, 'LATE', '1980-01-01', '2019-12-31',
+                                source=source) == msg4
@@ -1,7 +1,10 @@
 # Author: Team Andrey Markov
 # tests for gather_stock_time_series
 
-from pyntrinio.pyntrinio import gather_stock_time_series
+from pyntrinio.pyntrinio import (gather_stock_time_series,
+                                 iter_stock_time_series)
+from pyntrinio.sources import ReplaySource
+from pytest import raises
 import pandas as pd
 from datetime import date
 
@@ -173,3 +176,95 @@ def test_output():
     assert gather_stock_time_series(
         api_key, ticker, start_date='2020-01-15',
         end_date='2020-01-17') == results
+
+# test that all the pages are returned with all_pages and streamed with
+# iter_stock_time_series (offline)
+
+
+def test_all_pages():
+    """
+    Test that all_pages follows the next_page tokens past the 100 row cap
+    """
+    source = ReplaySource.synthetic([ticker], n_rows=250)
+    assert len(gather_stock_time_series(
+        api_key, ticker, source=source)['date']) == 100
+    results = gather_stock_time_series(
+        api_key, ticker, output_format='pddf', source=source, all_pages=True)
+    assert results.shape == (250, 13)
+    assert results['date'].is_monotonic_decreasing
+    assert source.calls['stock_prices'] == 4
+
+
+def test_iter_stock_time_series():
+    """
+    Test that the pages are yielded one at a time, with and without prefetch
+    """
+    source = ReplaySource.synthetic([ticker], n_rows=250)
+    for prefetch in [True, False]:
+        pages = list(iter_stock_time_series(
+            api_key, ticker, start_date='2018-01-01', page_size=100,
+            source=source, prefetch=prefetch))
+        assert [len(page['date']) for page in pages] == [100, 100, 50]
+        assert pages[0]['date'][0] > pages[-1]['date'][-1]
+    with raises(ValueError):
+        iter_stock_time_series(api_key, 123)
+    with raises(ValueError, match='ticker must be a string'):
+        iter_stock_time_series(api_key, [ticker], source=source)
+
+# test the dtypes of the dataframe output (offline)
+
+
+def test_pddf_dtypes():
+    """
+    Test that the dataframe columns have explicit dtypes
+    """
+    source = ReplaySource.synthetic([ticker], n_rows=250)
+    results = gather_stock_time_series(
+        api_key, ticker, output_format='pddf', source=source)
+    assert str(results['date'].dtype) == 'datetime64[ns]'
+    assert results['adj_close'].dtype == 'float64'
+    assert results['volume'].dtype == 'int64'
+    assert str(results['frequency'].dtype) == 'category'
+    assert results['intraperiod'].dtype == bool
+    results = gather_stock_time_series(
+        api_key, ticker, output_format='pddf', source=source,
+        all_pages=True, price_dtype='float32')
+    assert results.shape == (250, 13)
+    assert results['close'].dtype == 'float32'
+    assert str(results['frequency'].dtype) == 'category'
+
+# test the panel of several tickers (offline)
+
+
+def test_panel():
+    """
+    Test that a list of tickers returns one long or MultiIndex panel with
+    the rows each ticker returns on its own
+    """
+    tickers = ['AAPL', 'CSCO', 'MSFT']
+    source = ReplaySource.synthetic(tickers, n_rows=250)
+    single = [gather_stock_time_series(
+        api_key, t, output_format='pddf', source=source, all_pages=True)
+        for t in tickers]
+    long = gather_stock_time_series(
+        api_key, tickers + ['AAPL'], output_format='pddf', source=source,
+        all_pages=True, max_workers=3)
+    assert long.shape == (750, 14)
+    assert list(long['ticker'].cat.categories) == tickers
+    for t, frame in zip(tickers, single):
+        assert long[long['ticker'] == t].drop(columns='ticker').reset_index(
+            drop=True).equals(frame)
+    wide = gather_stock_time_series(
+        api_key, tickers, output_format='pddf', source=source,
+        all_pages=True, layout='multiindex')
+    assert wide.index.names == ['date', 'ticker']
+    assert wide.index.is_monotonic_increasing
+    assert wide.loc[(single[1]['date'][0], 'CSCO'), 'adj_close'] == \
+        single[1]['adj_close'][0]
+    results = gather_stock_time_series(api_key, tickers, source=source)
+    assert results['ticker'] == ['AAPL'] * 100 + ['CSCO'] * 100 + \
+        ['MSFT'] * 100
+    assert gather_stock_time_series(api_key, ['AAPL', 123]) == \
+        "Invalid data format: ticker must be a string or a list of strings"
+    assert gather_stock_time_series(api_key, tickers, layout='wide') == \
+        "Invalid Input: layout must be 'long' or 'multiindex'"
@@ -0,0 +1,16 @@
+# Author: Team Andrey Markov
+# tests for the import time of pyntrinio
+
+from benchmarks.bench_import import run
+
+
+def test_import_benchmark():
+    """
+    Test that importing pyntrinio and asking for 'dict' outputs loads
+    neither pandas, numpy nor intrinio_sdk
+    """
+    results = run(repeats=1)
+    assert [r['name'] for r in results] == ['import',
+                                            'import + dict outputs']
+    assert all(r['loaded'] == [] for r in results)
+    assert all(r['wall_s'] > 0 for r in results)
@@ -0,0 +1,226 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.jobs
+
+from pyntrinio.jobs import (CheckpointManifest, run_units,
+                            backfill_financial_statements,
+                            backfill_stock_returns, backfill_stock_prices)
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_stock_returns)
+from pyntrinio.sources import ReplaySource, ReplayError
+from pyntrinio.store import PriceStore
+from pytest import fixture, raises
+from datetime import date, timedelta
+
+# helper data
+api_key = 'replay'
+year = ['2018', '2019']
+period = ['Q1', 'Q2']
+
+
+@fixture
+def replay():
+    """
+    Return a source serving the filings and prices of AAPL and CSCO
+    """
+    return ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=year, periods=period,
+        statements=['income_statement'], n_tags=3, n_rows=300,
+        end_date='2019-12-31')
+
+
+class Outage:
+    """
+    Stand-in for a source whose requests for some keys fail until it is
+    restored
+    """
+
+    def __init__(self, source, failing):
+        self.source = source
+        self.failing = failing
+        self.down = True
+
+    def get_fundamental_reported_financials(self, key):
+        if self.down and any(f in key for f in self.failing):
+            raise ReplayError(503, "Unavailable")
+        return self.source.get_fundamental_reported_financials(key)
+
+    def get_security_stock_prices(self, identifier, *args, **kwargs):
+        if self.down and identifier in self.failing:
+            raise ReplayError(503, "Unavailable")
+        return self.source.get_security_stock_prices(identifier, *args,
+                                                     **kwargs)
+
+
+def test_manifest(tmp_path):
+    """
+    Test that the manifest is read back and survives a line cut short
+    """
+    path = str(tmp_path / 'jobs' / 'manifest.jsonl')
+    with CheckpointManifest(path) as manifest:
+        manifest.record(('stock_prices', 'AAPL', '', ''), 250)
+        manifest.record(('stock_prices', 'CSCO', '', ''), 100)
+    with open(path, 'a') as f:
+        f.write('{"unit": ["stock_prices", "MS')
+    manifest = CheckpointManifest(path)
+    assert len(manifest) == 2
+    assert manifest.done(['stock_prices', 'AAPL', '', ''])
+    assert manifest.result(('stock_prices', 'CSCO', '', '')) == 100
+    manifest.record(('stock_prices', 'MSFT', '', ''), 5)
+    manifest.close()
+    assert len(CheckpointManifest(path)) == 3
+
+
+def test_interrupted_job(tmp_path):
+    """
+    Test that an interrupted job keeps the units it completed and resumes
+    with the others
+    """
+    manifest = CheckpointManifest(str(tmp_path / 'manifest.jsonl'))
+    units = [('unit', str(n)) for n in range(20)]
+    calls = []
+
+    def fetch(unit):
+        calls.append(unit)
+        if unit == ('unit', '5'):
+            raise KeyboardInterrupt
+        return int(unit[1])
+
+    with raises(KeyboardInterrupt):
+        run_units(units, fetch, manifest, max_workers=1)
+    # the unit running when the job stopped may have completed too
+    completed = len(manifest)
+    assert 5 <= completed < 20
+    assert not manifest.done(('unit', '5'))
+    resumed = []
+    assert run_units(units, lambda unit: resumed.append(unit), manifest) \
+        == {}
+    assert len(resumed) == 20 - completed
+    assert len(manifest) == 20
+    calls.clear()
+    assert run_units(units, fetch, manifest) == {}
+    assert calls == []
+
+
+def test_backfill_financial_statements(tmp_path, replay):
+    """
+    Test that the filings that failed are the only ones requested again, and
+    that the output matches gather_financial_statement_time_series
+    """
+    source = Outage(replay, ['CSCO-income_statement-2019'])
+    path = str(tmp_path / 'fundamentals.jsonl')
+    filings, failed = backfill_financial_statements(
+        api_key, ['AAPL', 'CSCO'], 'income_statement', year, period, path,
+        output_format='dict', source=source)
+    assert len(filings) == 6
+    assert sorted(failed) == [
+        ('financial_statement', 'CSCO', 'income_statement', '2019', p)
+        for p in period]
+    source.down = False
+    calls = replay.calls['reported_financials']
+    filings, failed = backfill_financial_statements(
+        api_key, ['AAPL', 'CSCO'], 'income_statement', year, period, path,
+        output_format='dict', source=source)
+    assert failed == {}
+    assert replay.calls['reported_financials'] == calls + 2
+    assert filings == [
+        record for ticker in ['AAPL', 'CSCO']
+        for record in gather_financial_statement_time_series(
+            api_key, ticker, 'income_statement', year, period,
+            output_format='dict', source=replay)]
+    frame, _ = backfill_financial_statements(
+        api_key, 'AAPL', 'income_statement', year, period, path,
+        source=source)
+    assert frame.shape[0] == 4
+    with raises(TypeError):
+        backfill_financial_statements(api_key, [1], 'income_statement', year,
+                                      period, path, source=source)
+
+
+def test_backfill_stock_returns(tmp_path, replay):
+    """
+    Test that the returns of a backfill match gather_stock_returns
+    """
+    source = Outage(replay, ['CSCO'])
+    path = str(tmp_path / 'returns.jsonl')
+    returns, failed = backfill_stock_returns(
+        api_key, ['AAPL', 'CSCO'], '2019-06-03', '2019-12-02', path,
+        source=source)
+    assert list(returns['Stock']) == ['AAPL']
+    assert list(failed) == [('stock_returns', 'CSCO', '2019-06-03',
+                             '2019-12-02')]
+    source.down = False
+    returns, failed = backfill_stock_returns(
+        api_key, ['AAPL', 'CSCO'], '2019-06-03', '2019-12-02', path,
+        source=source)
+    expected = gather_stock_returns(api_key, ['AAPL', 'CSCO'], '2019-06-03',
+                                    '2019-12-02', source=replay)
+    assert failed == {}
+    assert returns.values.tolist() == expected.values.tolist()
+
+
+def test_backfill_no_prices(tmp_path):
+    """
+    Test that a ticker without prices between the dates fails with its
+    message
+    """
+    source = ReplaySource.synthetic(['LATE'], n_rows=100,
+                                    end_date='2021-12-31')
+    returns, failed = backfill_stock_returns(
+        api_key, ['LATE'], '2019-01-01', '2019-12-31',
+        str(tmp_path / 'returns.jsonl'), source=source)
+    assert returns.shape[0] == 0
+    assert failed == {('stock_returns', 'LATE', '2019-01-01', '2019-12-31'):
+                      "Invalid ticker: no stock prices found for LATE"}
+
+
+class Opened(CheckpointManifest):
+    """
+    CheckpointManifest keeping track of the manifests opened by the backfills
+    """
+    manifests = []
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.manifests.append(self)
+
+
+def test_backfill_stock_prices(tmp_path, replay, monkeypatch):
+    """
+    Test that the prices are synced to the store once per ticker and per
+    day, and that the manifests opened by the backfill are closed
+    """
+    monkeypatch.setattr('pyntrinio.jobs.CheckpointManifest', Opened)
+    store = PriceStore(':memory:')
+    path = str(tmp_path / 'prices.jsonl')
+    rows, failed = backfill_stock_prices(
+        api_key, ['AAPL', 'CSCO', 'MSFT'], path, start_date='2019-06-03',
+        store=store, source=replay)
+    today = date.today()
+    assert list(failed) == [('stock_prices', 'MSFT', '2019-06-03',
+                             today.isoformat())]
+    assert rows['AAPL'] == len(store.get('AAPL', '2019-06-03')) > 0
+    calls = replay.calls['stock_prices']
+    rows, failed = backfill_stock_prices(
+        api_key, ['AAPL', 'CSCO'], path, start_date='2019-06-03',
+        store=store, source=replay)
+    assert replay.calls['stock_prices'] == calls
+    assert sorted(rows) == ['AAPL', 'CSCO']
+    assert len(Opened.manifests) == 2
+    assert all(manifest._file.closed for manifest in Opened.manifests)
+
+    # the next day the tickers are synced again
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return today + timedelta(days=1)
+    monkeypatch.setattr('pyntrinio.jobs.date', Tomorrow)
+    backfill_stock_prices(api_key, ['AAPL', 'CSCO'], path,
+                          start_date='2019-06-03', store=store,
+                          source=replay)
+    assert replay.calls['stock_prices'] == calls + 2
+
+    # no manifest is created when the inputs are rejected
+    with raises(ValueError):
+        backfill_stock_prices(api_key, 'AAPL', str(tmp_path / 'none.jsonl'),
+                              store=False, source=replay)
+    assert not (tmp_path / 'none.jsonl').exists()
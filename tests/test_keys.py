@@ -0,0 +1,113 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.keys
+
+from pyntrinio import keys
+from pyntrinio.pyntrinio import (gather_financial_statement_company_compare,
+                                 gather_stock_returns)
+from pyntrinio.sources import IntrinioSource, ReplaySource, ReplayError
+
+# helper data
+ticker = ['AAPL', 'CSCO']
+msg_key = "Invalid API Key: please input a valid API key as a string"
+msg_args = "Invalid agruments: please make sure that your statement"
+msg_args = msg_args + "/year/period are valid"
+
+
+class Rejected:
+    """
+    Stand-in for the intrinio_sdk APIs that rejects the key
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_fundamental_reported_financials(self, key):
+        self.calls += 1
+        raise ReplayError(401, "Unauthorized")
+
+    def get_security_stock_prices(self, identifier, **kwargs):
+        self.calls += 1
+        raise ReplayError(401, "Unauthorized")
+
+
+def live_source(api_key, api):
+    """
+    Return an IntrinioSource whose requests are answered by api
+    """
+    source = IntrinioSource(api_key)
+    source.fundamentals_api = api
+    source.security_api = api
+    return source
+
+
+def replay():
+    return ReplaySource.synthetic(
+        ticker, years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3, n_rows=300)
+
+
+def test_no_probe():
+    """
+    Test that no request is spent on checking the key
+    """
+    keys.forget_keys()
+    api = replay()
+    source = live_source('good-key', api)
+    gather_financial_statement_company_compare(
+        'good-key', ticker, 'income_statement', '2019', 'Q1', source=source)
+    assert api.calls['reported_financials'] == 2
+    assert keys.known_key('good-key') is True
+    gather_stock_returns('good-key', ticker, '2019-06-03', '2019-12-02',
+                         source=source)
+    assert api.calls['stock_prices'] == 2
+
+
+def test_invalid_key_is_remembered():
+    """
+    Test that a rejected key is not tried again until the TTL expires
+    """
+    keys.forget_keys()
+    api = Rejected()
+    source = live_source('bad-key', api)
+    assert gather_financial_statement_company_compare(
+        'bad-key', ticker, 'income_statement', '2019', 'Q1',
+        source=source) == msg_key
+    calls = api.calls
+    assert keys.known_key('bad-key') is False
+    assert gather_financial_statement_company_compare(
+        'bad-key', ticker, 'income_statement', '2019', 'Q1',
+        source=source) == msg_key
+    assert gather_stock_returns('bad-key', ticker, '2019-06-03',
+                                '2019-12-02', source=source) == msg_key
+    assert api.calls == calls
+    # offline sources are not affected by what is known about the key
+    assert gather_stock_returns('bad-key', ticker, '2019-06-03',
+                                '2019-12-02', source=replay()).shape[0] == 2
+
+
+def test_other_errors_are_not_remembered():
+    """
+    Test that errors unrelated to the key say nothing about it
+    """
+    keys.forget_keys()
+    source = live_source('some-key', replay())
+    assert gather_financial_statement_company_compare(
+        'some-key', ['MISSING'], 'income_statement', '2019', 'Q1',
+        source=source) == msg_args
+    assert keys.known_key('some-key') is None
+
+
+def test_ttl():
+    """
+    Test that the checks expire and that a TTL of 0 disables them
+    """
+    keys.forget_keys()
+    keys.remember_key('old-key', ReplayError(403, "Forbidden"))
+    assert keys.known_key('old-key') is False
+    try:
+        keys.set_key_ttl(0)
+        assert keys.known_key('old-key') is None
+        keys.remember_key('old-key')
+        assert keys.known_key('old-key') is None
+    finally:
+        keys.set_key_ttl(3600)
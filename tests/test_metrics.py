@@ -0,0 +1,213 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.metrics
+
+from pyntrinio.aio import agather_stock_returns
+from pyntrinio.cache import FilingCache
+from pyntrinio.metrics import (MetricsRegistry, add_hook, remove_hook,
+                               metered_source, profile_call)
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare,
+                                 gather_stock_time_series,
+                                 gather_stock_returns)
+from pyntrinio.ratelimit import set_rate_limit
+from pyntrinio.sources import IntrinioSource, ReplaySource, ReplayError
+from pytest import fixture
+import asyncio
+import json
+import urllib3
+
+# helper data
+api_key = 'replay'
+year = ['2018', '2019']
+period = ['Q1', 'Q2']
+
+
+@fixture
+def source():
+    """
+    Return a source serving a few small filings and prices
+    """
+    return ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=year, periods=period,
+        statements=['income_statement'], n_tags=4, n_rows=30,
+        end_date='2019-12-31')
+
+
+def recorded(func, *args, **kwargs):
+    """
+    Return the result of a call and the CallRecords it reported
+    """
+    records = []
+    hook = add_hook(records.append)
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        remove_hook(hook)
+    return result, records
+
+
+def test_records(source):
+    """
+    Test that every call of the gather functions is reported with its
+    function, endpoint, key and rows
+    """
+    # without hooks the source is used as is
+    assert metered_source(source, 'gather_stock_time_series') is source
+
+    _, records = recorded(gather_financial_statement_time_series,
+                          api_key, 'AAPL', 'income_statement', year, period,
+                          output_format='dict', source=source)
+    assert len(records) == 4
+    assert {r.function for r in records} == {
+        'gather_financial_statement_time_series'}
+    assert {r.endpoint for r in records} == {
+        'get_fundamental_reported_financials'}
+    assert 'AAPL-income_statement-2018-Q1' in {r.key for r in records}
+    assert all(r.rows == 4 and r.error is None and r.latency >= 0
+               for r in records)
+
+    _, records = recorded(gather_financial_statement_company_compare,
+                          api_key, ['AAPL', 'CSCO'], 'income_statement',
+                          '2019', 'Q1', source=source)
+    assert [r.function for r in records] == [
+        'gather_financial_statement_company_compare'] * 2
+
+    _, records = recorded(gather_stock_time_series, api_key, 'AAPL',
+                          source=source)
+    assert len(records) == 1
+    assert records[0].endpoint == 'get_security_stock_prices'
+    assert records[0].key == 'AAPL'
+    assert records[0].rows == 30
+    assert records[0].payload_size is None
+
+    _, records = recorded(gather_stock_returns, api_key, ['AAPL', 'CSCO'],
+                          '2019-12-02', '2019-12-16', source=source)
+    assert {r.function for r in records} == {'gather_stock_returns'}
+    assert {r.key for r in records} == {'AAPL', 'CSCO'}
+
+    _, records = recorded(asyncio.run, agather_stock_returns(
+        api_key, ['AAPL', 'CSCO'], '2019-12-02', '2019-12-16',
+        source=source))
+    assert {r.function for r in records} == {'agather_stock_returns'}
+
+    # failed calls are reported with their error
+    _, records = recorded(gather_stock_time_series, api_key, 'MSFT',
+                          source=source)
+    assert records[0].rows is None
+    assert isinstance(records[0].error, ReplayError)
+
+
+def test_cache_hits(tmp_path, source):
+    """
+    Test that the calls answered by the filing cache are told apart
+    """
+    cache = FilingCache(str(tmp_path / 'filings.sqlite'))
+    for expected in ['miss', 'hit']:
+        _, records = recorded(gather_financial_statement_time_series,
+                              api_key, 'AAPL', 'income_statement', year,
+                              period, output_format='dict', source=source,
+                              cache=cache)
+        assert [r.cache for r in records] == [expected] * 4
+
+
+class PoolManager:
+    """
+    Stand-in for the connection pool of the live API answering with a page
+    of stock prices
+    """
+
+    body = json.dumps({'stock_prices': [
+        {'date': '2019-12-31', 'close': 293.65, 'adj_close': 293.65,
+         'frequency': 'daily', 'intraperiod': False}],
+        'next_page': None}).encode()
+
+    def request(self, *args, **kwargs):
+        return urllib3.HTTPResponse(body=self.body, status=200,
+                                    preload_content=True)
+
+    def clear(self):
+        pass
+
+
+def test_live_calls():
+    """
+    Test that the payload and the retries of the live API are recorded
+    """
+    source = IntrinioSource('metrics-key')
+    source.api_client.rest_client.pool_manager = PoolManager()
+    _, records = recorded(gather_stock_time_series, 'metrics-key', 'AAPL',
+                          output_format='dict', source=source)
+    assert records[0].payload_size == len(PoolManager.body)
+    assert records[0].rows == 1
+
+    set_rate_limit('metrics-key', backoff=0.001)
+    failures = []
+
+    def flaky(*args, **kwargs):
+        if len(failures) < 2:
+            failures.append(args)
+            raise ReplayError(503, "Unavailable")
+        return ReplaySource.synthetic(
+            ['AAPL'], n_rows=5).get_security_stock_prices('AAPL')
+
+    source.security_api.get_security_stock_prices = flaky
+    _, records = recorded(gather_stock_time_series, 'metrics-key', 'AAPL',
+                          output_format='dict', source=source)
+    assert records[0].retries == 2
+    assert records[0].rows == 5
+
+
+def test_registry(source):
+    """
+    Test the aggregation of the records and their Prometheus export
+    """
+    registry = MetricsRegistry(buckets=(0.5, 10.0))
+    add_hook(registry)
+    try:
+        gather_stock_time_series(api_key, 'AAPL', source=source)
+        gather_stock_time_series(api_key, 'MSFT', source=source)
+    finally:
+        remove_hook(registry)
+    series = registry.snapshot()[('gather_stock_time_series',
+                                  'get_security_stock_prices')]
+    assert series['calls'] == 2
+    assert series['errors'] == 1
+    assert series['rows'] == 30
+    assert series['latency_buckets'] == [2, 2]
+    text = registry.to_prometheus()
+    labels = ('{function="gather_stock_time_series",'
+              'endpoint="get_security_stock_prices"')
+    assert '# TYPE pyntrinio_calls_total counter' in text
+    assert 'pyntrinio_calls_total' + labels + '} 2' in text
+    assert 'pyntrinio_errors_total' + labels + '} 1' in text
+    assert 'pyntrinio_latency_seconds_bucket' + labels + ',le="+Inf"} 2' \
+        in text
+    registry.reset()
+    assert registry.snapshot() == {}
+
+
+def test_profile_call(source):
+    """
+    Test that a profiled call returns its result and a report
+    """
+    result, report = profile_call(gather_stock_time_series, api_key, 'AAPL',
+                                  output_format='dict', source=source, top=5)
+    assert result == gather_stock_time_series(api_key, 'AAPL',
+                                              output_format='dict',
+                                              source=source)
+    assert report['wall_s'] > 0
+    assert len(report['calls']) == 1
+    assert 'cumulative' in report['profile']
+    assert report['peak_mb'] > 0
+    assert len(report['allocations']) <= 5
+    # the hook of the profile is removed
+    assert metered_source(source, 'gather_stock_time_series') is source
+    # the requests made on the thread pool of the call are profiled too
+    source = ReplaySource.synthetic(['AAPL'], years=['2018', '2019'],
+                                    periods=['Q1', 'Q2'],
+                                    statements=['income_statement'])
+    _, report = profile_call(
+        gather_financial_statement_time_series, api_key, 'AAPL',
+        'income_statement', ['2018', '2019'], ['Q1', 'Q2'], source=source,
+        max_workers=4, memory=False, top=None)
+    assert 'get_fundamental_reported_financials' in report['profile']
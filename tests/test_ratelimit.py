@@ -0,0 +1,144 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.ratelimit
+
+from pyntrinio.ratelimit import (RateLimiter, get_limiter, set_rate_limit,
+                                 retry_after, retryable_error)
+from pyntrinio.pyntrinio import gather_financial_statement_company_compare
+from pyntrinio.sources import IntrinioSource, ReplaySource, ReplayError
+from pytest import raises, approx
+
+
+class Flaky:
+    """
+    Stand-in for an endpoint that fails a number of times before answering
+    """
+
+    def __init__(self, failures, status=429, headers=None):
+        self.failures = failures
+        self.status = status
+        self.headers = headers
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            error = ReplayError(self.status, "Failing")
+            error.headers = self.headers
+            raise error
+        return 'ok'
+
+
+class FrozenClock:
+    """
+    Stand-in for the time module of the limiter: the clock does not move,
+    and the waits are recorded instead of slept
+    """
+
+    def __init__(self):
+        self.sleeps = []
+
+    def monotonic(self):
+        return 0.0
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+
+
+def test_token_bucket(monkeypatch):
+    """
+    Test that the requests are spread at the given rate after the burst
+    """
+    clock = FrozenClock()
+    monkeypatch.setattr('pyntrinio.ratelimit.time', clock)
+    limiter = RateLimiter(rate=100, burst=5)
+    for n in range(15):
+        limiter.acquire()
+    # 5 requests go at once, the next 10 one every 10 ms
+    assert clock.sleeps == approx([0.01 * n for n in range(1, 11)])
+    assert limiter.stats()['requests'] == 15
+
+
+def test_retries():
+    """
+    Test that throttled requests are retried and that other errors are not
+    """
+    limiter = RateLimiter(backoff=0.001)
+    endpoint = Flaky(3)
+    assert limiter.call(endpoint) == 'ok'
+    assert endpoint.calls == 4
+    assert limiter.stats() == {'requests': 4, 'retries': 3, 'throttled': 3}
+    with raises(ReplayError):
+        limiter.call(Flaky(1, status=404))
+    with raises(ReplayError):
+        RateLimiter(max_retries=2, backoff=0.001).call(Flaky(5, status=503))
+
+
+def test_retry_after(monkeypatch):
+    """
+    Test that Retry-After is honored and holds the other requests too
+    """
+    assert retry_after(ReplayError(429, "Throttled")) is None
+    error = ReplayError(429, "Throttled")
+    error.headers = {'Retry-After': '0.1'}
+    assert retry_after(error) == 0.1
+    error.headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    assert retry_after(error) == 0.0
+    assert retryable_error(ReplayError(500, "Server error"))
+    assert not retryable_error(ReplayError(401, "Unauthorized"))
+    assert not retryable_error(ValueError())
+
+    clock = FrozenClock()
+    monkeypatch.setattr('pyntrinio.ratelimit.time', clock)
+    limiter = RateLimiter(backoff=0.001)
+    assert limiter.call(Flaky(1, headers={'Retry-After': '0.1'})) == 'ok'
+    # the retry waits for the Retry-After, and since the clock has not moved
+    # past the pause, so do the retried request and the next one
+    limiter.acquire()
+    assert clock.sleeps == [0.1, 0.1, 0.1]
+
+
+def test_live_source_is_limited():
+    """
+    Test that the requests of IntrinioSource go through the limiter of its
+    key and that a throttled run completes
+    """
+    assert get_limiter('limited-key') is get_limiter('limited-key')
+    limiter = set_rate_limit('limited-key', rate=1000, backoff=0.001)
+    assert get_limiter('limited-key') is limiter
+    replay = ReplaySource.synthetic(
+        ['AAPL', 'CSCO'], years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3)
+    flaky = Flaky(2)
+    source = IntrinioSource('limited-key')
+
+    def throttled(key):
+        flaky()
+        return replay.get_fundamental_reported_financials(key)
+
+    source.fundamentals_api.get_fundamental_reported_financials = throttled
+    result = gather_financial_statement_company_compare(
+        'limited-key', ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1',
+        source=source)
+    assert [r['ticker'] for r in result] == ['AAPL', 'CSCO']
+    assert limiter.stats() == {'requests': 4, 'retries': 2, 'throttled': 2}
+
+
+def test_sdk_does_not_retry():
+    """
+    Test that a dropped connection is sent max_retries + 1 times in all,
+    the ApiClient of IntrinioSource not retrying it on its own
+    """
+    import urllib3
+
+    set_rate_limit('sdk-key', max_retries=2, backoff=0.001)
+    source = IntrinioSource('sdk-key')
+    dropped = []
+
+    def request(*args, **kwargs):
+        dropped.append(args)
+        raise urllib3.exceptions.ProtocolError("Connection aborted")
+
+    source.api_client.rest_client.request = request
+    with raises(urllib3.exceptions.ProtocolError):
+        source.get_security_stock_prices('AAPL')
+    assert len(dropped) == 3
@@ -0,0 +1,91 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.returns
+
+from pyntrinio.pyntrinio import gather_stock_returns, gather_stock_time_series
+from pyntrinio.returns import gather_panel_returns, panel_returns
+from pyntrinio.sources import ReplaySource
+from pytest import fixture, raises
+import numpy as np
+import pandas as pd
+
+# helper data
+api_key = 'replay'
+tickers = ['AAPL', 'CSCO', 'MSFT']
+buy_dates = ['2018-03-03', '2018-06-01', '2019-01-01']
+sell_dates = ['2019-03-03', '2019-06-30', '2019-12-31']
+
+
+@fixture
+def source():
+    """
+    Return a source serving 600 days of prices of every ticker
+    """
+    return ReplaySource.synthetic(tickers, n_rows=600, end_date='2019-12-31')
+
+
+def test_same_as_stock_returns(source):
+    """
+    Test that every window is priced like gather_stock_returns prices it,
+    whatever the layout of the panel
+    """
+    for layout in ['long', 'multiindex']:
+        panel = gather_stock_time_series(
+            api_key, tickers, output_format='pddf', all_pages=True,
+            source=source, layout=layout)
+        result = panel_returns(panel, buy_dates, sell_dates)
+        assert result.shape == (3, 3)
+        assert list(result.index) == tickers
+        for w, (buy, sell) in enumerate(zip(buy_dates, sell_dates)):
+            expected = gather_stock_returns(api_key, tickers, buy, sell,
+                                            source=source)
+            assert np.allclose(result.iloc[:, w].round(2).tolist(),
+                               expected['Return (%)'].tolist())
+
+
+def test_missing_windows(source):
+    """
+    Test that a window without trading days of a ticker is NaN
+    """
+    panel = gather_stock_time_series(
+        api_key, tickers, start_date='2019-01-01', output_format='pddf',
+        all_pages=True, source=source)
+    result = panel_returns(panel, ['2010-01-01', '2019-06-01', '2019-06-01'],
+                           ['2011-01-01', '2019-06-02', '2020-06-01'])
+    assert result.iloc[:, :2].isna().all().all()
+    assert result.iloc[:, 2].notna().all()
+    with raises(ValueError):
+        panel_returns(panel, ['2019-01-02'], ['2018-01-02'])
+    with raises(ValueError):
+        panel_returns(panel, ['2019-01-02'], [])
+    with raises(ValueError):
+        panel_returns(panel, ['2019-13-02'], ['2019-12-02'])
+
+
+def test_many_windows(source):
+    """
+    Test that thousands of windows are priced in one pass, like the windows
+    priced one at a time
+    """
+    panel = gather_stock_time_series(
+        api_key, tickers, output_format='pddf', all_pages=True,
+        source=source, layout='multiindex')
+    buy = pd.date_range('2017-08-01', periods=5000, freq='h').normalize()
+    result = panel_returns(panel, buy, buy + pd.Timedelta(days=90))
+    assert result.shape == (3, 5000)
+    assert result.notna().all().all()
+    for n in [0, 2500, 4999]:
+        window = panel_returns(panel, buy[n:n + 1],
+                               buy[n:n + 1] + pd.Timedelta(days=90))
+        assert result.iloc[:, n].tolist() == window.iloc[:, 0].tolist()
+
+
+def test_gather_panel_returns(source):
+    """
+    Test that the prices of every window are requested once per ticker
+    """
+    result = gather_panel_returns(api_key, tickers, buy_dates, sell_dates,
+                                  source=source)
+    assert source.calls['stock_prices'] == 3
+    assert result.equals(panel_returns(gather_stock_time_series(
+        api_key, tickers, output_format='pddf', all_pages=True,
+        source=source), buy_dates, sell_dates))
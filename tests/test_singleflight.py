@@ -0,0 +1,112 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.singleflight
+
+from pyntrinio.aio import agather_stock_time_series
+from pyntrinio.pyntrinio import gather_financial_statement_time_series
+from pyntrinio.singleflight import SingleFlight, single_flight
+from pyntrinio.sources import IntrinioSource, ReplaySource, ReplayError
+from concurrent.futures import ThreadPoolExecutor
+from pytest import raises
+import asyncio
+import threading
+import time
+
+
+def slow(result, calls, delay=0.1):
+    """
+    Return an endpoint that counts its calls and answers after a delay
+    """
+    def endpoint(*args, **kwargs):
+        calls.append(args)
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return endpoint
+
+
+def test_shared_call():
+    """
+    Test that concurrent calls with the same key share one call, and that
+    other keys and later calls are not shared
+    """
+    flight = SingleFlight()
+    calls = []
+    fetch = slow('ok', calls)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(
+            lambda n: flight.call('key' if n < 6 else n, fetch, n),
+            range(8)))
+    assert results == ['ok'] * 8
+    assert len(calls) == 3
+    assert flight.stats() == {'calls': 3, 'shared': 5}
+    assert flight.in_flight() == 0
+    flight.call('key', fetch)
+    assert len(calls) == 4
+    # unhashable keys are called directly
+    assert flight.call(['key'], fetch) == 'ok'
+
+
+def test_shared_error():
+    """
+    Test that every caller waiting on a failing call gets its exception
+    """
+    flight = SingleFlight()
+    calls = []
+    fetch = slow(ReplayError(404, "Missing"), calls)
+    errors = []
+
+    def call():
+        try:
+            flight.call('key', fetch)
+        except ReplayError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(errors) == 4
+    with raises(ReplayError):
+        flight.call('key', fetch)
+
+
+def test_live_source_bursts():
+    """
+    Test that identical gather_* calls made at the same time from threads
+    and tasks send one request per key to the live API
+    """
+    replay = ReplaySource.synthetic(
+        ['AAPL'], years=['2019'], periods=['Q1'],
+        statements=['income_statement'], n_tags=3, n_rows=50)
+    calls = []
+    source = IntrinioSource('burst-key')
+    source.fundamentals_api.get_fundamental_reported_financials = slow(
+        replay.get_fundamental_reported_financials(
+            'AAPL-income_statement-2019-Q1'), calls)
+    before = single_flight().stats()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(
+            lambda _: gather_financial_statement_time_series(
+                'burst-key', 'AAPL', 'income_statement', ['2019'], ['Q1'],
+                output_format='dict', source=source), range(10)))
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
+    assert single_flight().stats()['shared'] - before['shared'] == 9
+
+    calls.clear()
+    source.security_api.get_security_stock_prices = slow(
+        replay.get_security_stock_prices('AAPL'), calls)
+
+    async def burst():
+        # enough executor threads for every task to be in flight at once
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=10))
+        return await asyncio.gather(*[agather_stock_time_series(
+            'burst-key', 'AAPL', source=source) for _ in range(10)])
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert all(result == results[0] for result in results)
@@ -0,0 +1,105 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.sources
+
+from pyntrinio.pyntrinio import (gather_financial_statement_time_series,
+                                 gather_financial_statement_company_compare,
+                                 gather_stock_time_series,
+                                 gather_stock_returns)
+from pyntrinio.sources import ReplaySource, RecordingSource, ReplayError
+from pytest import fixture, raises
+from datetime import date
+import pandas as pd
+from benchmarks.bench_gather import run
+
+# helper data
+api_key = 'replay'
+facts = [{'tag': 'revenue', 'value': 10.0, 'balance': 'credit',
+          'name': 'Revenue'},
+         {'tag': 'revenue', 'value': 5.0, 'balance': 'credit',
+          'name': 'Revenue'},
+         {'tag': 'cost', 'value': 4.0, 'balance': 'debit', 'name': 'Cost'}]
+prices = [{'date': '2020-01-' + str(d), 'close': float(d),
+           'adj_close': float(d), 'volume': 100.0, 'frequency': 'daily',
+           'intraperiod': False}
+          for d in range(10, 20)]
+
+
+@fixture
+def source():
+    """
+    Return a source serving facts and prices
+    """
+    return ReplaySource(
+        fundamentals={'AAPL-income_statement-2019-Q1': facts,
+                      'CSCO-income_statement-2019-Q1': facts[2:]},
+        stock_prices={'AAPL': prices})
+
+
+def test_stock_prices_pagination(source):
+    """
+    Test that prices are served newest first, page by page
+    """
+    page = source.get_security_stock_prices(
+        'AAPL', start_date=date(2020, 1, 11), end_date='2020-01-18',
+        page_size=5)
+    assert [p.date.day for p in page.stock_prices] == [18, 17, 16, 15, 14]
+    page = source.get_security_stock_prices(
+        'AAPL', start_date=date(2020, 1, 11), end_date='2020-01-18',
+        page_size=5, next_page=page.next_page)
+    assert [p.date.day for p in page.stock_prices] == [13, 12, 11]
+    assert page.next_page is None
+    assert source.calls['stock_prices'] == 2
+
+
+def test_missing_payload(source):
+    """
+    Test that unknown keys and tickers raise a ReplayError
+    """
+    with raises(ReplayError):
+        source.get_fundamental_reported_financials('MSFT-x-2019-Q1')
+    with raises(ReplayError):
+        source.get_security_stock_prices('MSFT')
+
+
+def test_record_and_replay(tmp_path, source):
+    """
+    Test that a recorded session replays the same results
+    """
+    recorder = RecordingSource(source)
+    first = gather_stock_time_series(api_key, 'AAPL', source=recorder)
+    path = str(tmp_path / 'recorded.json')
+    recorder.save(path)
+    replayed = gather_stock_time_series(
+        api_key, 'AAPL', source=ReplaySource.load(path))
+    assert first == replayed
+
+
+def test_gather_functions_offline(source):
+    """
+    Test that all gather_* functions read through the source
+    """
+    series = gather_financial_statement_time_series(
+        api_key, 'AAPL', 'income_statement', ['2019'], ['Q1'],
+        source=source)
+    assert series['revenue'][0] == [15.0]
+    compare = gather_financial_statement_company_compare(
+        api_key, ['AAPL', 'CSCO'], 'income_statement', '2019', 'Q1',
+        output_format='pddf', source=source)
+    assert list(compare['ticker']) == ['AAPL', 'CSCO']
+    assert pd.isna(compare['revenue'][1])
+    returns = gather_stock_returns(
+        api_key, 'AAPL', '2020-01-10', '2020-01-19', source=source)
+    assert returns['Return (%)'][0] == 90.0
+    assert isinstance(returns, pd.core.frame.DataFrame)
+
+
+def test_benchmark_suite():
+    """
+    Test that the benchmark suite runs at a small scale
+    """
+    results = run(n_tickers=3, n_years=2, n_rows=50, n_tags=5)
+    assert [r['name'] for r in results] == [
+        'financial_statement_time_series',
+        'financial_statement_company_compare',
+        'stock_time_series', 'stock_panel', 'stock_returns']
+    assert results[0]['calls'] == 8
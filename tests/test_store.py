@@ -0,0 +1,104 @@
+# Author: Team Andrey Markov
+# tests for pyntrinio.store
+
+from pyntrinio.aio import agather_stock_time_series
+from pyntrinio.pyntrinio import gather_stock_time_series
+from pyntrinio.sources import ReplaySource
+from pyntrinio.store import PriceStore, price_store
+from datetime import date
+import asyncio
+import pandas as pd
+
+# helper data
+api_key = 'replay'
+
+
+def history(end_date):
+    """
+    Return a source with one year of AAPL prices up to end_date
+    """
+    return ReplaySource.synthetic(['AAPL'], n_rows=300, end_date=end_date)
+
+
+def test_full_then_incremental(tmp_path):
+    """
+    Test that only the days after the last stored bar are requested again,
+    and that the overlap picks up revised values
+    """
+    store = PriceStore(str(tmp_path / 'prices.sqlite'))
+    old = history('2019-12-20')
+    first = gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-06-03', output_format='pddf',
+        source=old, store=store)
+    assert old.calls['stock_prices'] == 1
+    assert first['date'].max() == pd.Timestamp('2019-12-20')
+
+    # the new source has 7 more bars and revised values for the old ones
+    new = history('2019-12-31')
+    merged = gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-06-03', output_format='pddf',
+        source=new, store=PriceStore(store.path), overlap=5)
+    assert new.calls['stock_prices'] == 1
+    assert merged.shape[0] == first.shape[0] + 7
+    assert merged['date'].is_monotonic_decreasing
+    expected = gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-06-03', output_format='pddf',
+        source=new, all_pages=True)
+    # the overlap (2019-12-15 onwards) is revised, older bars are kept
+    recent = merged['date'] >= pd.Timestamp('2019-12-15')
+    assert merged[recent].equals(expected[recent])
+    kept = first['date'] < pd.Timestamp('2019-12-15')
+    assert merged[~recent].reset_index(drop=True).equals(
+        first[kept].reset_index(drop=True))
+
+
+def test_no_request_when_up_to_date():
+    """
+    Test that a window already stored is answered without a request
+    """
+    store = PriceStore(':memory:')
+    source = history('2019-12-31')
+    gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-01-02', end_date='2019-12-31',
+        source=source, store=store)
+    again = gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-03-01', end_date='2019-06-28',
+        source=source, store=store)
+    assert source.calls['stock_prices'] == 1
+    assert again == gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-03-01', end_date='2019-06-28',
+        source=source, allow_max_rows=True)
+
+
+def test_earlier_start():
+    """
+    Test that the history before the stored rows is requested on its own
+    """
+    store = PriceStore(':memory:')
+    source = history('2019-12-31')
+    gather_stock_time_series(api_key, 'AAPL', start_date='2019-06-03',
+                             end_date='2019-12-31', source=source,
+                             store=store)
+    assert store.missing('AAPL', date(2019, 3, 1), date(2019, 12, 31)) == [
+        (date(2019, 3, 1), date(2019, 6, 2))]
+    prices = gather_stock_time_series(
+        api_key, 'AAPL', start_date='2019-03-01', end_date='2019-12-31',
+        output_format='pddf', source=source, store=store)
+    assert source.calls['stock_prices'] == 2
+    assert store.synced_from('AAPL') == (True, date(2019, 3, 1))
+    assert prices.shape[0] == len(source.get_security_stock_prices(
+        'AAPL', '2019-03-01', '2019-12-31', page_size=1000).stock_prices)
+
+
+def test_async_store():
+    """
+    Test that the async function fills and reads the same store
+    """
+    store = PriceStore(':memory:')
+    source = history('2019-12-31')
+    prices = asyncio.run(agather_stock_time_series(
+        api_key, 'AAPL', output_format='pddf', source=source, store=store))
+    assert prices.shape[0] == 300
+    assert store.tickers() == ['AAPL']
+    assert price_store(False) is None
+    assert price_store(store) is store